@@ -21,13 +21,17 @@
 import collections
 import fnmatch
 import itertools
+import operator
 import random
+import time
 
+import eventlet
 from keystoneclient import exceptions as ks_exceptions
 from oslo_config import cfg
 from oslo_context import context
 from oslo_log import log
 import oslo_messaging
+import six
 from six import moves
 from six.moves.urllib import parse as urlparse
 from stevedore import extension
@@ -66,6 +70,19 @@ POLLING_OPTS = [
                     'config files. For each sub-group of the agent '
                     'pool with the same partitioning_group_prefix a disjoint '
                     'subset of pollsters should be loaded.'),
+    cfg.IntOpt('pollster_workers',
+               default=1,
+               min=1,
+               help='Number of pollsters of a polling task run concurrently. '
+                    'The default of 1 runs the pollsters one after the '
+                    'other. Only raise it if the pollsters loaded share '
+                    'the polling cache safely, as the in-tree ones do.'),
+    cfg.IntOpt('pollster_timeout',
+               default=0,
+               min=0,
+               help='Number of seconds after which a pollster still running '
+                    'is interrupted, so that a slow pollster does not delay '
+                    'the next polling cycle. 0 means no timeout.'),
 ]
 
 cfg.CONF.register_opts(OPTS)
@@ -89,12 +106,75 @@ class PollsterListForbidden(Exception):
         super(PollsterListForbidden, self).__init__(msg)
 
 
+def _freeze(value):
+    if isinstance(value, dict):
+        return frozenset((k, _freeze(v)) for k, v in six.iteritems(value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _resource_key(resource):
+    """Return a hashable key identifying a discovered resource.
+
+    Discoverers return strings, dicts and API client resources, such as nova
+    servers or keystone tenants, which are compared on their type and their
+    attributes. None is returned for resources that can't be hashed.
+    """
+    info = getattr(resource, '_info', None)
+    try:
+        if isinstance(info, dict):
+            key = (type(resource), _freeze(info))
+        else:
+            key = _freeze(resource)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class _ResourceSet(object):
+    """Set of discovered resources, de-duplicated in linear time."""
+
+    def __init__(self, resources=()):
+        self._keys = set()
+        # resources without key, compared one by one
+        self._others = []
+        self.update(resources)
+
+    def add(self, resource):
+        """Add a resource, return False if it was already in the set."""
+        key = _resource_key(resource)
+        if key is None:
+            if resource in self._others:
+                return False
+            self._others.append(resource)
+        elif key in self._keys:
+            return False
+        else:
+            self._keys.add(key)
+        return True
+
+    def update(self, resources):
+        for resource in resources:
+            self.add(resource)
+
+    def __contains__(self, resource):
+        key = _resource_key(resource)
+        if key is None:
+            return resource in self._others
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys) + len(self._others)
+
+
 class Resources(object):
     def __init__(self, agent_manager):
         self.agent_manager = agent_manager
         self._resources = []
         self._discovery = []
-        self.blacklist = []
+        self.blacklist = _ResourceSet()
         self.last_dup = []
 
     def setup(self, source):
@@ -125,6 +205,9 @@ class PollingTask(object):
     A polling task can be invoked periodically or only once.
     """
 
+    # Number of pollsters named when a polling cycle overruns its interval
+    SLOWEST_POLLSTERS = 5
+
     def __init__(self, agent_manager):
         self.manager = agent_manager
 
@@ -139,17 +222,28 @@ class PollingTask(object):
 
         self._batch = cfg.CONF.batch_polled_samples
         self._telemetry_secret = cfg.CONF.publisher.telemetry_secret
+        self._timeout = cfg.CONF.polling.pollster_timeout
+
+        # interval shared by the sources of the task, and duration in
+        # seconds of each pollster run in the last cycle, keyed like the
+        # resources
+        self.interval = None
+        self.durations = {}
 
     def add(self, pollster, source):
+        self.interval = source.get_interval()
         self.pollster_matches[source.name].add(pollster)
         key = Resources.key(source.name, pollster)
         self.resources[key].setup(source)
 
     def poll_and_notify(self):
         """Polling sample and notify."""
-        cache = {}
+        start = time.time()
+        self.durations = {}
+        cache = plugin_base.PollingCache()
         discovery_cache = {}
         poll_history = {}
+        pool = eventlet.GreenPool(cfg.CONF.polling.pollster_workers)
         for source_name in self.pollster_matches:
             for pollster in self.pollster_matches[source_name]:
                 key = Resources.key(source_name, pollster)
@@ -159,18 +253,14 @@ class PollingTask(object):
                     candidate_res = self.manager.discover(
                         [pollster.obj.default_discovery], discovery_cache)
 
-                # Remove duplicated resources and black resources. Using
-                # set() requires well defined __hash__ for each resource.
-                # Since __eq__ is defined, 'not in' is safe here.
+                # Remove duplicated resources and black resources.
                 polling_resources = []
                 black_res = self.resources[key].blacklist
-                history = poll_history.get(pollster.name, [])
+                history = poll_history.setdefault(pollster.name,
+                                                  _ResourceSet())
                 for x in candidate_res:
-                    if x not in history:
-                        history.append(x)
-                        if x not in black_res:
-                            polling_resources.append(x)
-                poll_history[pollster.name] = history
+                    if history.add(x) and x not in black_res:
+                        polling_resources.append(x)
 
                 # If no resources, skip for this pollster
                 if not polling_resources:
@@ -183,38 +273,75 @@ class PollingTask(object):
                 LOG.info(_LI("Polling pollster %(poll)s in the context of "
                              "%(src)s"),
                          dict(poll=pollster.name, src=source_name))
-                try:
-                    samples = pollster.obj.get_samples(
-                        manager=self.manager,
-                        cache=cache,
-                        resources=polling_resources
-                    )
-                    sample_batch = []
-
-                    for sample in samples:
-                        sample_dict = (
-                            publisher_utils.meter_message_from_counter(
-                                sample, self._telemetry_secret
-                            ))
-                        if self._batch:
-                            sample_batch.append(sample_dict)
-                        else:
-                            self._send_notification([sample_dict])
-
-                    if sample_batch:
-                        self._send_notification(sample_batch)
-
-                except plugin_base.PollsterPermanentError as err:
-                    LOG.error(_(
-                        'Prevent pollster %(name)s for '
-                        'polling source %(source)s anymore!')
-                        % ({'name': pollster.name, 'source': source_name}))
-                    self.resources[key].blacklist.extend(err.fail_res_list)
-                except Exception as err:
-                    LOG.warning(_(
-                        'Continue after error from %(name)s: %(error)s')
-                        % ({'name': pollster.name, 'error': err}),
-                        exc_info=True)
+                pool.spawn_n(self._poll, source_name, pollster, cache,
+                             polling_resources)
+        pool.waitall()
+
+        duration = time.time() - start
+        if self.interval and duration > self.interval:
+            slowest = sorted(self.durations.items(),
+                             key=operator.itemgetter(1), reverse=True)
+            LOG.warning(_LW('Polling cycle took %(duration).1f seconds, '
+                            'more than its interval of %(interval)d seconds. '
+                            'Slowest pollsters: %(slowest)s'),
+                        {'duration': duration, 'interval': self.interval,
+                         'slowest': ', '.join(
+                             '%s (%.1fs)' % d
+                             for d in slowest[:self.SLOWEST_POLLSTERS])})
+
+    def _poll(self, source_name, pollster, cache, polling_resources):
+        """Get the samples of one pollster and send them."""
+        key = Resources.key(source_name, pollster)
+        start = time.time()
+        timer = eventlet.Timeout(self._timeout or None)
+        try:
+            with timer:
+                samples = pollster.obj.get_samples(
+                    manager=self.manager,
+                    cache=cache,
+                    resources=polling_resources
+                )
+                sample_batch = []
+
+                for sample in samples:
+                    sample_dict = (
+                        publisher_utils.meter_message_from_counter(
+                            sample, self._telemetry_secret
+                        ))
+                    if self._batch:
+                        sample_batch.append(sample_dict)
+                    else:
+                        self._send_notification([sample_dict])
+
+                if sample_batch:
+                    self._send_notification(sample_batch)
+
+        except plugin_base.PollsterPermanentError as err:
+            LOG.error(_(
+                'Prevent pollster %(name)s for '
+                'polling source %(source)s anymore!')
+                % ({'name': pollster.name, 'source': source_name}))
+            self.resources[key].blacklist.update(err.fail_res_list)
+        except eventlet.Timeout as t:
+            if t is not timer:
+                # an outer timeout, not ours to swallow
+                raise
+            LOG.warning(_LW('Pollster %(name)s of polling source %(source)s '
+                            'interrupted after %(timeout)d seconds'),
+                        {'name': pollster.name, 'source': source_name,
+                         'timeout': self._timeout})
+        except Exception as err:
+            LOG.warning(_(
+                'Continue after error from %(name)s: %(error)s')
+                % ({'name': pollster.name, 'error': err}),
+                exc_info=True)
+        finally:
+            duration = time.time() - start
+            self.durations[key] = duration
+            LOG.debug('Pollster %(name)s of polling source %(source)s ran '
+                      'for %(duration).3f seconds',
+                      {'name': pollster.name, 'source': source_name,
+                       'duration': duration})
 
     def _send_notification(self, samples):
         self.manager.notifier.sample(
@@ -390,6 +517,8 @@ class AgentManager(service_base.BaseService):
         self.init_pipeline_refresh()
 
     def stop(self):
+        for d in self.discovery_manager:
+            d.obj.stop()
         if self.partition_coordinator:
             self.partition_coordinator.stop()
         super(AgentManager, self).stop()
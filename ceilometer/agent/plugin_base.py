@@ -18,6 +18,7 @@
 import abc
 import collections
 
+from eventlet import semaphore
 from oslo_context import context
 from oslo_log import log
 import oslo_messaging
@@ -149,6 +150,49 @@ class PollsterPermanentError(Exception):
         self.fail_res_list = resources
 
 
+class PollingCache(dict):
+    """Cache shared by the pollsters of one polling cycle.
+
+    The pollsters of a polling task run concurrently, get_or_set makes sure
+    that a value requested by several of them at the same time is only
+    computed once.
+    """
+
+    def __init__(self):
+        super(PollingCache, self).__init__()
+        self._key_locks = {}
+
+    def get_or_set(self, key, creator):
+        """Return the value of key, storing the result of creator if unset."""
+        with self._key_locks.setdefault(key, semaphore.Semaphore()):
+            if key not in self:
+                self[key] = creator()
+            return self[key]
+
+
+def get_cached(cache, key, creator):
+    """Return cache[key], setting it to the result of creator if missing.
+
+    :param cache: dict or PollingCache given to get_samples.
+    :param key: Key of the value in the cache.
+    :param creator: Callable returning the value when it is not cached.
+    """
+    if isinstance(cache, PollingCache):
+        return cache.get_or_set(key, creator)
+    if key not in cache:
+        cache[key] = creator()
+    return cache[key]
+
+
+def get_nested_cache(cache, key):
+    """Return the cache stored under key in cache, creating it if missing.
+
+    The nested cache has the type of cache, so that its values can be
+    shared through get_cached too.
+    """
+    return get_cached(cache, key, type(cache))
+
+
 @six.add_metaclass(abc.ABCMeta)
 class PollsterBase(PluginBase):
     """Base class for plugins that support the polling API."""
@@ -250,6 +294,9 @@ class DiscoveryBase(object):
         :param param: an optional parameter to guide the discovery
         """
 
+    def stop(self):
+        """Release the resources of the discovery when the agent stops."""
+
     @property
     def group_id(self):
         """Return group id of this discovery.
@@ -33,6 +33,11 @@ def dbsync():
     storage.get_connection_from_config(cfg.CONF, 'event').upgrade()
 
 
+def rebuild_rollups():
+    service.prepare_service()
+    storage.get_connection_from_config(cfg.CONF, 'metering').rebuild_rollups()
+
+
 def expirer():
     service.prepare_service()
 
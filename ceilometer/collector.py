@@ -13,6 +13,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import errno
 import socket
 
 import msgpack
@@ -25,7 +26,7 @@ from oslo_utils import units
 
 from ceilometer import dispatcher
 from ceilometer import messaging
-from ceilometer.i18n import _, _LE
+from ceilometer.i18n import _, _LE, _LI, _LW
 from ceilometer import utils
 
 OPTS = [
@@ -36,6 +37,12 @@ OPTS = [
     cfg.PortOpt('udp_port',
                 default=4952,
                 help='Port to which the UDP socket is bound.'),
+    cfg.IntOpt('udp_batch_size',
+               default=100,
+               min=1,
+               help='Maximum number of UDP datagrams read in one burst '
+               'once data is available on the socket. The samples they '
+               'contain are handed to the dispatchers in a single call.'),
     cfg.BoolOpt('requeue_sample_on_dispatcher_error',
                 default=False,
                 help='Requeue the sample on the collector sample queue '
@@ -49,7 +56,27 @@ OPTS = [
                 default=False,
                 help='Enable the RPC functionality of collector. This '
                 'functionality is now deprecated in favour of notifier '
-                'publisher and queues.')
+                'publisher and queues.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               min=1,
+               help='Number of samples or events the collector buffers '
+               'before handing them to the dispatchers in a single call. '
+               'A notification message carrying several samples or events '
+               'takes as many places in the batch. A message is '
+               'acknowledged only once all its samples or events have been '
+               'dispatched; if a batch fails to be dispatched, every '
+               'message with data in it is requeued or dropped as set by '
+               'requeue_sample_on_dispatcher_error and '
+               'requeue_event_on_dispatcher_error. The default of 1 '
+               'dispatches the data of every message on its own.'),
+    cfg.IntOpt('batch_timeout',
+               default=1,
+               min=1,
+               help='Number of seconds to wait before dispatching a '
+               'partial batch of samples or events, so that messages are '
+               'not held when less than batch_size samples or events are '
+               'received.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
@@ -122,26 +149,61 @@ class CollectorService(os_service.Service):
             address_family = socket.AF_INET6
         udp = socket.socket(address_family, socket.SOCK_DGRAM)
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            # NOTE: each collector worker binds its own socket and lets
+            # the kernel spread the datagrams between them.
+            try:
+                udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except socket.error:
+                LOG.warning(_LW("UDP: SO_REUSEPORT is not supported by "
+                                "this kernel, only one collector worker "
+                                "will receive the datagrams"))
         udp.bind((cfg.CONF.collector.udp_address,
                   cfg.CONF.collector.udp_port))
 
         self.udp_run = True
         while self.udp_run:
-            # NOTE(jd) Arbitrary limit of 64K because that ought to be
-            # enough for anybody.
-            data, source = udp.recvfrom(64 * units.Ki)
-            try:
-                sample = msgpack.loads(data, encoding='utf-8')
-            except Exception:
-                LOG.warn(_("UDP: Cannot decode data sent by %s"), source)
-            else:
+            samples = self._receive_udp_batch(udp)
+            if samples:
                 try:
-                    LOG.debug("UDP: Storing %s", sample)
+                    LOG.debug("UDP: Storing %d samples", len(samples))
                     self.meter_manager.map_method('record_metering_data',
-                                                  sample)
+                                                  samples)
                 except Exception:
                     LOG.exception(_("UDP: Unable to store meter"))
 
+    def _receive_udp_batch(self, udp):
+        """Wait for a datagram, then read what else is already queued.
+
+        Up to udp_batch_size datagrams are read and the samples they
+        contain are returned.
+        """
+        samples = []
+        # NOTE(jd) Arbitrary limit of 64K because that ought to be
+        # enough for anybody.
+        self._decode_udp(samples, *udp.recvfrom(64 * units.Ki))
+        udp.setblocking(False)
+        try:
+            for i in range(cfg.CONF.collector.udp_batch_size - 1):
+                if not self.udp_run:
+                    break
+                self._decode_udp(samples, *udp.recvfrom(64 * units.Ki))
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                LOG.exception(_("UDP: Unable to receive data"))
+        finally:
+            udp.setblocking(True)
+        return samples
+
+    @staticmethod
+    def _decode_udp(samples, data, source):
+        try:
+            sample = msgpack.loads(data, encoding='utf-8')
+        except Exception:
+            LOG.warn(_("UDP: Cannot decode data sent by %s"), source)
+        else:
+            samples.append(sample)
+
     def stop(self):
         self.udp_run = False
         if cfg.CONF.collector.enable_rpc and self.rpc_server:
@@ -161,10 +223,35 @@ class CollectorService(os_service.Service):
         self.meter_manager.map_method('record_metering_data', data=data)
 
 
+class DispatchBuffer(utils.BatchBuffer):
+    """Write-behind buffer grouping payloads into dispatcher calls."""
+
+    def __init__(self, dispatcher_manager, method, batch_size,
+                 batch_timeout):
+        super(DispatchBuffer, self).__init__(
+            method, self._dispatch, batch_size, batch_timeout)
+        self.dispatcher_manager = dispatcher_manager
+        self.method = method
+
+    def _dispatch(self, items):
+        self.dispatcher_manager.map_method(self.method, items)
+
+    def dispatch(self, payload):
+        self.add(payload if isinstance(payload, list) else [payload])
+
+
 class CollectorEndpoint(object):
     def __init__(self, dispatcher_manager, requeue_on_error):
         self.dispatcher_manager = dispatcher_manager
         self.requeue_on_error = requeue_on_error
+        self.buffer = None
+        batch_size = cfg.CONF.collector.batch_size
+        if batch_size > 1:
+            LOG.info(_LI("Dispatching %(type)ss in batches of %(size)d"),
+                     {'type': self.ep_type, 'size': batch_size})
+            self.buffer = DispatchBuffer(
+                dispatcher_manager, self.method, batch_size,
+                cfg.CONF.collector.batch_timeout)
 
     def sample(self, ctxt, publisher_id, event_type, payload, metadata):
         """RPC endpoint for notification messages
@@ -173,7 +260,10 @@ class CollectorEndpoint(object):
         bus, this method receives it.
         """
         try:
-            self.dispatcher_manager.map_method(self.method, payload)
+            if self.buffer:
+                self.buffer.dispatch(payload)
+            else:
+                self.dispatcher_manager.map_method(self.method, payload)
         except Exception:
             if self.requeue_on_error:
                 LOG.exception(_LE("Dispatcher failed to handle the %s, "
@@ -14,29 +14,84 @@
 # under the License.
 
 from oslo_config import cfg
+from oslo_log import log
+import oslo_messaging
 from oslo_utils import timeutils
 
 from ceilometer.agent import plugin_base
+from ceilometer.i18n import _LI, _LW
+from ceilometer import messaging
 from ceilometer import nova_client
+from ceilometer import utils
+
+LOG = log.getLogger(__name__)
 
 OPTS = [
     cfg.BoolOpt('workload_partitioning',
                 default=False,
                 help='Enable work-load partitioning, allowing multiple '
-                     'compute agents to be run simultaneously.')
+                     'compute agents to be run simultaneously.'),
+    cfg.BoolOpt('instance_notifications',
+                default=False,
+                help='Keep the instances discovered on this host up to date '
+                     'by listening to the Nova instance notifications. Nova '
+                     'is then only queried when instances of this host '
+                     'changed, and for the periodic resynchronisation. '
+                     'Nova notifications are not published per host, so '
+                     'every compute agent gets its own queue receiving a '
+                     'copy of all the Nova notifications of the cloud, and '
+                     'drops the ones of other hosts. Only enable it when '
+                     'the message bus can carry this load. The queue of a '
+                     'host is left on the message bus when the host is '
+                     'removed and has to be deleted by the operator.'),
+    cfg.IntOpt('instance_resync_interval',
+               default=3600,
+               min=0,
+               help='Number of seconds between two full listings of the '
+                    'instances of this host when instance_notifications is '
+                    'enabled, to recover from lost notifications. 0 '
+                    'disables the resynchronisation.'),
 ]
 cfg.CONF.register_opts(OPTS, group='compute')
+cfg.CONF.import_opt('nova_control_exchange',
+                    'ceilometer.compute.notifications')
 
 
 class InstanceDiscovery(plugin_base.DiscoveryBase):
+    # nova notifications changing the instances of a host
+    event_types = [
+        'compute.instance.create.end',
+        'compute.instance.delete.end',
+        'compute.instance.rebuild.end',
+        'compute.instance.finish_resize.end',
+        'compute.instance.resize.revert.end',
+        'compute.instance.live_migration.post.dest.end',
+        'compute.instance.live_migration._rollback.end',
+    ]
+
     def __init__(self):
         super(InstanceDiscovery, self).__init__()
         self.nova_cli = nova_client.Client()
         self.last_run = None
         self.instances = {}
+        self.filter_rule = oslo_messaging.NotificationFilter(
+            event_type='|'.join(self.event_types))
+        self.listener = None
+        self.last_resync = None
+        # whether instances of this host changed since the last discovery
+        self.changed = True
 
     def discover(self, manager, param=None):
         """Discover resources to monitor."""
+        if cfg.CONF.compute.instance_notifications:
+            if self.listener is None:
+                self.start_listener()
+            if self._resync_needed():
+                return self._resync()
+            if not self.changed:
+                return list(self.instances.values())
+
+        self.changed = False
         try:
             instances = self.nova_cli.instance_get_all_by_host(
                 cfg.CONF.host, self.last_run)
@@ -44,6 +99,7 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
             # NOTE(zqfan): instance_get_all_by_host is wrapped and will log
             # exception when there is any error. It is no need to raise it
             # again and print one more time.
+            self.changed = True
             return []
 
         for instance in instances:
@@ -53,7 +109,71 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
             else:
                 self.instances[instance.id] = instance
         self.last_run = timeutils.utcnow(True).isoformat()
-        return self.instances.values()
+        return list(self.instances.values())
+
+    def _resync_needed(self):
+        interval = cfg.CONF.compute.instance_resync_interval
+        return (self.last_resync is None or
+                (interval and timeutils.is_older_than(self.last_resync,
+                                                      interval)))
+
+    def _resync(self):
+        """List all the instances of this host again."""
+        self.changed = False
+        try:
+            instances = self.nova_cli.instance_get_all_by_host(cfg.CONF.host)
+        except Exception:
+            # keep the known instances until the next attempt
+            self.changed = True
+            return list(self.instances.values())
+
+        self.instances = dict(
+            (instance.id, instance) for instance in instances
+            if getattr(instance, 'OS-EXT-STS:vm_state', None) not in [
+                'deleted', 'error'])
+        self.last_resync = timeutils.utcnow()
+        self.last_run = timeutils.utcnow(True).isoformat()
+        return list(self.instances.values())
+
+    def start_listener(self):
+        """Listen to the nova instance notifications.
+
+        The notifications are consumed from a pool dedicated to the agent of
+        this host, so they are still received by the notification agents.
+        """
+        LOG.warning(_LW('Instance discovery of %s consumes a copy of every '
+                        'nova notification through its own queue, which is '
+                        'kept on the message bus if this host is removed'),
+                    cfg.CONF.host)
+        transport = messaging.get_transport()
+        targets = [oslo_messaging.Target(
+            topic=topic, exchange=cfg.CONF.nova_control_exchange)
+            for topic in cfg.CONF.notification_topics]
+        self.listener = messaging.get_notification_listener(
+            transport, targets, [self],
+            pool='ceilometer-instance-discovery-%s' % cfg.CONF.host)
+        self.listener.start()
+        LOG.info(_LI('Listening to nova notifications to discover the '
+                     'instances of %s'), cfg.CONF.host)
+
+    def stop(self):
+        if self.listener is not None:
+            utils.kill_listeners([self.listener])
+            self.listener = None
+        super(InstanceDiscovery, self).stop()
+
+    def info(self, ctxt, publisher_id, event_type, payload, metadata):
+        """Update the instances from a nova instance notification."""
+        instance_id = payload.get('instance_id')
+        host = payload.get('host')
+        if (event_type == 'compute.instance.delete.end' or
+                payload.get('state') in ['deleted', 'error'] or
+                host != cfg.CONF.host):
+            # deleted, failed or moved to another host
+            self.instances.pop(instance_id, None)
+        else:
+            # the instance details are fetched at the next discovery
+            self.changed = True
 
     @property
     def group_id(self):
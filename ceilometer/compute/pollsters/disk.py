@@ -21,6 +21,7 @@ from oslo_log import log
 import six
 
 import ceilometer
+from ceilometer.agent import plugin_base
 from ceilometer.compute import pollsters
 from ceilometer.compute.pollsters import util
 from ceilometer.compute.virt import inspector as virt_inspector
@@ -72,8 +73,9 @@ class _Base(pollsters.BaseComputePollster):
     CACHE_KEY_DISK = 'diskio'
 
     def _populate_cache(self, inspector, cache, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_DISK, {})
-        if instance.id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(cache, self.CACHE_KEY_DISK)
+
+        def _inspect():
             r_bytes = 0
             r_requests = 0
             w_bytes = 0
@@ -102,14 +104,14 @@ class _Base(pollsters.BaseComputePollster):
                 'write_bytes': per_device_write_bytes,
                 'write_requests': per_device_write_requests,
             }
-            i_cache[instance.id] = DiskIOData(
+            return DiskIOData(
                 r_bytes=r_bytes,
                 r_requests=r_requests,
                 w_bytes=w_bytes,
                 w_requests=w_requests,
                 per_disk_requests=per_device_requests,
             )
-        return i_cache[instance.id]
+        return plugin_base.get_cached(i_cache, instance.id, _inspect)
 
     @abc.abstractmethod
     def _get_samples(instance, c_data):
@@ -287,8 +289,9 @@ class _DiskRatesPollsterBase(pollsters.BaseComputePollster):
     CACHE_KEY_DISK_RATE = 'diskio-rate'
 
     def _populate_cache(self, inspector, cache, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_DISK_RATE, {})
-        if instance.id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(cache, self.CACHE_KEY_DISK_RATE)
+
+        def _inspect():
             r_bytes_rate = 0
             r_requests_rate = 0
             w_bytes_rate = 0
@@ -316,14 +319,14 @@ class _DiskRatesPollsterBase(pollsters.BaseComputePollster):
                 'write_bytes_rate': per_disk_w_bytes_rate,
                 'write_requests_rate': per_disk_w_requests_rate,
             }
-            i_cache[instance.id] = DiskRateData(
+            return DiskRateData(
                 r_bytes_rate,
                 r_requests_rate,
                 w_bytes_rate,
                 w_requests_rate,
                 per_disk_rate
             )
-        return i_cache[instance.id]
+        return plugin_base.get_cached(i_cache, instance.id, _inspect)
 
     @abc.abstractmethod
     def _get_samples(self, instance, disk_rates_info):
@@ -493,8 +496,10 @@ class _DiskLatencyPollsterBase(pollsters.BaseComputePollster):
     CACHE_KEY_DISK_LATENCY = 'disk-latency'
 
     def _populate_cache(self, inspector, cache, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_DISK_LATENCY, {})
-        if instance.id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(
+            cache, self.CACHE_KEY_DISK_LATENCY)
+
+        def _inspect():
             latency = 0
             per_device_latency = {}
             disk_rates = inspector.inspect_disk_latency(instance)
@@ -505,11 +510,11 @@ class _DiskLatencyPollsterBase(pollsters.BaseComputePollster):
             per_disk_latency = {
                 'disk_latency': per_device_latency
             }
-            i_cache[instance.id] = DiskLatencyData(
+            return DiskLatencyData(
                 latency,
                 per_disk_latency
             )
-        return i_cache[instance.id]
+        return plugin_base.get_cached(i_cache, instance.id, _inspect)
 
     @abc.abstractmethod
     def _get_samples(self, instance, disk_rates_info):
@@ -576,8 +581,9 @@ class _DiskIOPSPollsterBase(pollsters.BaseComputePollster):
     CACHE_KEY_DISK_IOPS = 'disk-iops'
 
     def _populate_cache(self, inspector, cache, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_DISK_IOPS, {})
-        if instance.id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(cache, self.CACHE_KEY_DISK_IOPS)
+
+        def _inspect():
             iops = 0
             per_device_iops = {}
             disk_iops_count = inspector.inspect_disk_iops(instance)
@@ -587,11 +593,11 @@ class _DiskIOPSPollsterBase(pollsters.BaseComputePollster):
             per_disk_iops = {
                 'iops_count': per_device_iops
             }
-            i_cache[instance.id] = DiskIOPSData(
+            return DiskIOPSData(
                 iops,
                 per_disk_iops
             )
-        return i_cache[instance.id]
+        return plugin_base.get_cached(i_cache, instance.id, _inspect)
 
     @abc.abstractmethod
     def _get_samples(self, instance, disk_rates_info):
@@ -659,8 +665,9 @@ class _DiskInfoPollsterBase(pollsters.BaseComputePollster):
     CACHE_KEY_DISK_INFO = 'diskinfo'
 
     def _populate_cache(self, inspector, cache, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_DISK_INFO, {})
-        if instance.id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(cache, self.CACHE_KEY_DISK_INFO)
+
+        def _inspect():
             all_capacity = 0
             all_allocation = 0
             all_physical = 0
@@ -682,13 +689,13 @@ class _DiskInfoPollsterBase(pollsters.BaseComputePollster):
                 'allocation': per_disk_allocation,
                 'physical': per_disk_physical,
             }
-            i_cache[instance.id] = DiskInfoData(
+            return DiskInfoData(
                 all_capacity,
                 all_allocation,
                 all_physical,
                 per_disk_info
             )
-        return i_cache[instance.id]
+        return plugin_base.get_cached(i_cache, instance.id, _inspect)
 
     @abc.abstractmethod
     def _get_samples(self, instance, disk_info):
@@ -19,6 +19,7 @@ import copy
 from oslo_log import log
 
 import ceilometer
+from ceilometer.agent import plugin_base
 from ceilometer.compute import pollsters
 from ceilometer.compute.pollsters import util
 from ceilometer.compute.virt import inspector as virt_inspector
@@ -69,12 +70,10 @@ class _Base(pollsters.BaseComputePollster):
         return info.tx_bytes
 
     def _get_vnics_for_instance(self, cache, inspector, instance):
-        i_cache = cache.setdefault(self.CACHE_KEY_VNIC, {})
-        if instance.id not in i_cache:
-            i_cache[instance.id] = list(
-                self._get_vnic_info(inspector, instance)
-            )
-        return i_cache[instance.id]
+        i_cache = plugin_base.get_nested_cache(cache, self.CACHE_KEY_VNIC)
+        return plugin_base.get_cached(
+            i_cache, instance.id,
+            lambda: list(self._get_vnic_info(inspector, instance)))
 
     def get_samples(self, manager, cache, resources):
         self._inspection_duration = self._record_poll_time()
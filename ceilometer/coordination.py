@@ -63,6 +63,10 @@ class PartitionCoordinator(object):
         self._coordinator = None
         self._groups = set()
         self._my_id = my_id or str(uuid.uuid4())
+        # hash ring of the members of each group, and the member each key
+        # was assigned to by the last extract_my_subset call
+        self._rings = {}
+        self._assignments = {}
 
     def start(self):
         backend_url = cfg.CONF.coordination.backend_url
@@ -141,6 +145,8 @@ class PartitionCoordinator(object):
         if self._coordinator:
             self._coordinator.leave_group(group_id)
             self._groups.remove(group_id)
+            self._rings.pop(group_id, None)
+            self._assignments.pop(group_id, None)
             LOG.info(_LI('Left partitioning group %s'), group_id)
 
     def _get_members(self, group_id):
@@ -154,6 +160,25 @@ class PartitionCoordinator(object):
             except tooz.coordination.GroupNotCreated:
                 self.join_group(group_id)
 
+    def _get_ring(self, group_id, members):
+        """Return the hash ring of a group, updated with its members.
+
+        The ring is only changed when the membership of the group changed,
+        and the memoised assignments of the group are then forgotten.
+        """
+        members = set(members)
+        ring = self._rings.get(group_id)
+        if ring is None:
+            ring = self._rings[group_id] = utils.HashRing(members)
+        elif ring.nodes != members:
+            LOG.debug('Members of group %s changed', group_id)
+            ring.remove_nodes(ring.nodes - members)
+            ring.add_nodes(members - ring.nodes)
+        else:
+            return ring
+        self._assignments[group_id] = {}
+        return ring
+
     def extract_my_subset(self, group_id, iterable):
         """Filters an iterable, returning only objects assigned to this agent.
 
@@ -168,9 +193,21 @@ class PartitionCoordinator(object):
         try:
             members = self._get_members(group_id)
             LOG.debug('Members of group: %s', members)
-            hr = utils.HashRing(members)
-            filtered = [v for v in iterable
-                        if hr.get_node(str(v)) == self._my_id]
+            hr = self._get_ring(group_id, members)
+            assignments = self._assignments[group_id]
+            # only the keys of this call are kept, so that the assignments
+            # of resources which disappeared don't pile up
+            new_assignments = {}
+            filtered = []
+            for v in iterable:
+                key = str(v)
+                node = assignments.get(key)
+                if node is None:
+                    node = hr.get_node(key)
+                new_assignments[key] = node
+                if node == self._my_id:
+                    filtered.append(v)
+            self._assignments[group_id] = new_assignments
             LOG.debug('My subset: %s', [str(f) for f in filtered])
             return filtered
         except tooz.coordination.ToozError:
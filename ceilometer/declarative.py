@@ -11,8 +11,10 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import os
 
+from jsonpath_rw import jsonpath
 from jsonpath_rw_ext import parser
 from oslo_config import cfg
 from oslo_log import log
@@ -24,6 +26,9 @@ from ceilometer.i18n import _, _LI
 LOG = log.getLogger(__name__)
 
 
+_KeyMatch = collections.namedtuple('_KeyMatch', ['path', 'value'])
+
+
 class DefinitionException(Exception):
     def __init__(self, message, definition_cfg):
         super(DefinitionException, self).__init__(message)
@@ -81,25 +86,83 @@ class Definition(object):
             else:
                 fields = '|'.join('(%s)' % path for path in fields)
 
+        # Paths made only of named fields, like payload.tenant_id, are
+        # looked up directly in the notification, as a list of
+        # (path, keys) tried in order, instead of being evaluated by
+        # jsonpath.
+        self.key_paths = None
         if isinstance(fields, six.integer_types):
             self.getter = fields
         else:
             try:
-                self.getter = self.JSONPATH_RW_PARSER.parse(fields).find
+                expr = self.JSONPATH_RW_PARSER.parse(fields)
+                self.getter = expr.find
+                self.key_paths = self._get_key_paths(expr)
             except Exception as e:
                 raise DefinitionException(
                     _("Parse error in JSONPath specification "
                       "'%(jsonpath)s' for %(name)s: %(err)s")
                     % dict(jsonpath=fields, name=name, err=e), self.cfg)
 
+    @classmethod
+    def _get_keys(cls, expr, leftmost=True):
+        """Return the keys of a path only made of named fields, or None."""
+        if type(expr) is jsonpath.Child:
+            left = cls._get_keys(expr.left, leftmost)
+            right = cls._get_keys(expr.right, False)
+            if left is not None and right is not None:
+                return left + right
+        elif (type(expr) is jsonpath.Fields and len(expr.fields) == 1 and
+                expr.fields[0] != '*'):
+            return list(expr.fields)
+        elif type(expr) is jsonpath.Root and leftmost:
+            return []
+        return None
+
+    @classmethod
+    def _get_key_paths(cls, expr):
+        """Return the (path, keys) of a union of simple paths, or None."""
+        if type(expr) is jsonpath.Union:
+            left = cls._get_key_paths(expr.left)
+            right = cls._get_key_paths(expr.right)
+            if left is not None and right is not None:
+                return left + right
+            return None
+        keys = cls._get_keys(expr)
+        if keys is None:
+            return None
+        return [('.'.join(keys), keys)]
+
+    def _find_keys(self, obj):
+        for path, keys in self.key_paths:
+            value = obj
+            try:
+                for key in keys:
+                    value = value[key]
+            except (TypeError, KeyError, AttributeError):
+                continue
+            yield _KeyMatch(path, value)
+
     def _get_path(self, match):
         if match.context is not None:
             for path_element in self._get_path(match.context):
                 yield path_element
             yield str(match.path)
 
+    def _match_path(self, match):
+        if isinstance(match, _KeyMatch):
+            return match.path
+        return '.'.join(self._get_path(match))
+
     def parse(self, obj, return_all_values=False):
-        if callable(self.getter):
+        if self.key_paths is not None:
+            if self.plugin is None and not return_all_values:
+                for match in self._find_keys(obj):
+                    if match.value is not None:
+                        return match.value
+                return None
+            values = self._find_keys(obj)
+        elif callable(self.getter):
             values = self.getter(obj)
         else:
             return self.getter
@@ -112,7 +175,7 @@ class Definition(object):
                 raise DefinitionException("Plugin %s don't allows to "
                                           "return multiple values" %
                                           self.cfg["plugin"]["name"])
-            values_map = [('.'.join(self._get_path(match)), match.value) for
+            values_map = [(self._match_path(match), match.value) for
                           match in values]
             values = [v for v in self.plugin.trait_values(values_map)
                       if v is not None]
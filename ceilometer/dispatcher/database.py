@@ -75,6 +75,7 @@ class DatabaseDispatcher(dispatcher.MeterDispatcherBase,
         if not isinstance(data, list):
             data = [data]
 
+        samples = []
         for meter in data:
             LOG.debug(
                 'metering data %(counter_name)s '
@@ -85,24 +86,33 @@ class DatabaseDispatcher(dispatcher.MeterDispatcherBase,
                  'counter_volume': meter['counter_volume']})
             if publisher_utils.verify_signature(
                     meter, self.conf.publisher.telemetry_secret):
-                try:
-                    # Convert the timestamp to a datetime instance.
-                    # Storage engines are responsible for converting
-                    # that value to something they can store.
-                    if meter.get('timestamp'):
+                # Convert the timestamp to a datetime instance.
+                # Storage engines are responsible for converting
+                # that value to something they can store.
+                if meter.get('timestamp'):
+                    try:
                         ts = timeutils.parse_isotime(meter['timestamp'])
-                        meter['timestamp'] = timeutils.normalize_time(ts)
-                    self.meter_conn.record_metering_data(meter)
-                except Exception as err:
-                    LOG.exception(_LE('Failed to record metering data: %s'),
-                                  err)
-                    # raise the exception to propagate it up in the chain.
-                    raise
+                    except ValueError:
+                        LOG.warning(_LW(
+                            'message timestamp invalid, discarding '
+                            'message: %r'), meter)
+                        continue
+                    meter['timestamp'] = timeutils.normalize_time(ts)
+                samples.append(meter)
             else:
                 LOG.warning(_LW(
                     'message signature invalid, discarding message: %r'),
                     meter)
 
+        if not samples:
+            return
+        try:
+            self.meter_conn.record_metering_data_batch(samples)
+        except Exception as err:
+            LOG.exception(_LE('Failed to record metering data: %s'), err)
+            # raise the exception to propagate it up in the chain.
+            raise
+
     def record_events(self, events):
         if not isinstance(events, list):
             events = [events]
@@ -76,9 +76,8 @@ class _Base(plugin_base.PollsterBase):
     def _iter_probes(self, ksclient, cache, endpoint):
         """Iterate over all probes."""
         key = '%s-%s' % (endpoint, self.CACHE_KEY_PROBE)
-        if key not in cache:
-            cache[key] = self._get_probes(ksclient, endpoint)
-        return iter(cache[key])
+        return iter(plugin_base.get_cached(
+            cache, key, lambda: self._get_probes(ksclient, endpoint)))
 
     def _get_probes(self, ksclient, endpoint):
         try:
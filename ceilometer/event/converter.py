@@ -14,6 +14,8 @@
 # under the License.
 
 import fnmatch
+import os
+import re
 
 from debtcollector import moves
 from oslo_config import cfg
@@ -24,6 +26,7 @@ import six
 from ceilometer import declarative
 from ceilometer.event.storage import models
 from ceilometer.i18n import _
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('definitions_cfg_file',
@@ -118,6 +121,9 @@ class EventDefinition(object):
         if self._excluded_types and not self._included_types:
             self._included_types.append('*')
 
+        self._included_re = self._compile(self._included_types)
+        self._excluded_re = self._compile(self._excluded_types)
+
         for trait_name in self.DEFAULT_TRAITS:
             self.traits[trait_name] = TraitDefinition(
                 trait_name,
@@ -129,22 +135,37 @@ class EventDefinition(object):
                 traits[trait_name],
                 trait_plugin_mgr)
 
+    @staticmethod
+    def _compile(patterns):
+        """Fold fnmatch patterns into a single regex."""
+        if not patterns:
+            return None
+        return re.compile('|'.join(
+            '(?:%s)' % fnmatch.translate(os.path.normcase(p))
+            for p in patterns))
+
     def included_type(self, event_type):
-        for t in self._included_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return (self._included_re is not None and
+                self._included_re.match(os.path.normcase(event_type))
+                is not None)
 
     def excluded_type(self, event_type):
-        for t in self._excluded_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return (self._excluded_re is not None and
+                self._excluded_re.match(os.path.normcase(event_type))
+                is not None)
 
     def match_type(self, event_type):
         return (self.included_type(event_type)
                 and not self.excluded_type(event_type))
 
+    @property
+    def exact_types(self):
+        """Event types matched by name, None if there are wildcards."""
+        if self._excluded_types or any(c in t for t in self._included_types
+                                       for c in '*?['):
+            return None
+        return set(self._included_types)
+
     @property
     def is_catchall(self):
         return '*' in self._included_types and not self._excluded_types
@@ -262,6 +283,8 @@ class NotificationEventsConverter(object):
 
     """
 
+    CACHE_SIZE = 1024
+
     def __init__(self, events_config, trait_plugin_mgr, add_catchall=True):
         self.definitions = [
             EventDefinition(event_def, trait_plugin_mgr)
@@ -271,14 +294,37 @@ class NotificationEventsConverter(object):
             self.definitions.append(EventDefinition(event_def,
                                                     trait_plugin_mgr))
 
+        # Definitions only listing event types by name are indexed by
+        # name, the others are tried in order before the indexed one.
+        self._exact = {}
+        self._wildcards = []
+        for i, d in enumerate(self.definitions):
+            exact_types = d.exact_types
+            if exact_types is None:
+                self._wildcards.append((i, d))
+            else:
+                for t in exact_types:
+                    self._exact.setdefault(t, (i, d))
+        self._cache = utils.LRUCache(self.CACHE_SIZE)
+
+    def _find_definition(self, event_type):
+        """Return the first definition matching event_type, if any."""
+        index, edef = self._exact.get(event_type,
+                                      (len(self.definitions), None))
+        for i, d in self._wildcards:
+            if i > index:
+                break
+            if d.match_type(event_type):
+                return d
+        return edef
+
     def to_event(self, notification_body):
         event_type = notification_body['event_type']
         message_id = notification_body['message_id']
-        edef = None
-        for d in self.definitions:
-            if d.match_type(event_type):
-                edef = d
-                break
+        edef = self._cache.get(event_type, False)
+        if edef is False:
+            edef = self._find_definition(event_type)
+            self._cache[event_type] = edef
 
         if edef is None:
             msg = (_('Dropping Notification %(type)s (uuid:%(msgid)s)')
@@ -42,7 +42,15 @@ class Connection(pymongo_base.Connection):
             raise storage.StorageBadVersion("Need at least MongoDB 2.4")
 
         connection_options = pymongo.uri_parser.parse_uri(url)
-        self.db = getattr(self.conn, connection_options['database'])
+        write_concern = cfg.CONF.database.mongodb_event_write_concern
+        if write_concern:
+            if write_concern.isdigit():
+                write_concern = int(write_concern)
+            self.db = pymongo_utils.MongoProxy(self.conn.get_database(
+                connection_options['database'],
+                write_concern=pymongo.WriteConcern(w=write_concern)))
+        else:
+            self.db = getattr(self.conn, connection_options['database'])
         if connection_options.get('username'):
             self.db.authenticate(connection_options['username'],
                                  connection_options['password'])
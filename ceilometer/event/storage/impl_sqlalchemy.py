@@ -26,7 +26,7 @@ import sqlalchemy as sa
 
 from ceilometer.event.storage import base
 from ceilometer.event.storage import models as api_models
-from ceilometer.i18n import _LE, _LI
+from ceilometer.i18n import _LE, _LI, _LW
 from ceilometer.storage.sqlalchemy import models
 from ceilometer import utils
 
@@ -131,6 +131,7 @@ class Connection(base.Connection):
         options = dict(cfg.CONF.database.items())
         options['max_retries'] = 0
         self._engine_facade = db_session.EngineFacade(url, **options)
+        self._event_type_ids = {}
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
@@ -145,6 +146,7 @@ class Connection(base.Connection):
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
         engine.dispose()
+        self._event_type_ids.clear()
 
     def _get_or_create_event_type(self, event_type, session=None):
         """Check if an event type with the supplied name is already exists.
@@ -161,45 +163,144 @@ class Connection(base.Connection):
                 session.add(et)
         return et
 
+    def _get_event_type_ids(self, session, event_types):
+        """Return the ids of the event types, creating the missing ones.
+
+        The ids known from previous batches are not queried again.
+        """
+        ids = dict((t, self._event_type_ids[t]) for t in event_types
+                   if t in self._event_type_ids)
+        missing = set(event_types) - set(ids)
+        if missing:
+            ids.update(session.query(models.EventType.desc,
+                                     models.EventType.id)
+                       .filter(models.EventType.desc.in_(missing)))
+            created = [models.EventType(t) for t in missing - set(ids)]
+            if created:
+                session.add_all(created)
+                session.flush()
+                ids.update((et.desc, et.id) for et in created)
+        return ids
+
+    def _record_event(self, session, event_model):
+        with session.begin():
+            event_type = self._get_or_create_event_type(
+                event_model.event_type, session=session)
+            event = models.Event(event_model.message_id, event_type,
+                                 event_model.generated,
+                                 event_model.raw)
+            session.add(event)
+            session.flush()
+
+            if event_model.traits:
+                trait_map = {}
+                for trait in event_model.traits:
+                    if trait_map.get(trait.dtype) is None:
+                        trait_map[trait.dtype] = []
+                    trait_map[trait.dtype].append(
+                        {'event_id': event.id,
+                         'key': trait.name,
+                         'value': trait.value})
+                for dtype in trait_map.keys():
+                    model = TRAIT_ID_TO_MODEL[dtype]
+                    session.execute(model.__table__.insert(),
+                                    trait_map[dtype])
+
+    def _record_batch(self, session, batch):
+        with session.begin():
+            message_ids = [event_model.message_id
+                           for event_model, row, traits in batch]
+            recorded = set(message_id for message_id, in
+                           session.query(models.Event.message_id)
+                           .filter(models.Event.message_id.in_(message_ids)))
+            if recorded:
+                for message_id in recorded:
+                    LOG.info(_LI("Duplicate event detected, skipping it: "
+                                 "%s") % message_id)
+                batch = [(event_model, row, traits)
+                         for event_model, row, traits in batch
+                         if event_model.message_id not in recorded]
+                if not batch:
+                    return
+                message_ids = [event_model.message_id
+                               for event_model, row, traits in batch]
+
+            event_type_ids = self._get_event_type_ids(
+                session, set(event_model.event_type
+                             for event_model, row, traits in batch))
+            for event_model, row, traits in batch:
+                row['event_type_id'] = event_type_ids[event_model.event_type]
+            session.execute(models.Event.__table__.insert(),
+                            [row for event_model, row, traits in batch])
+
+            # NOTE: message_id is unique, so the ids of the events just
+            # inserted are fetched back with it on every database.
+            event_ids = dict(session.query(models.Event.message_id,
+                                           models.Event.id)
+                             .filter(models.Event.message_id.in_(message_ids)))
+            trait_rows = {}
+            for event_model, row, traits in batch:
+                event_id = event_ids[event_model.message_id]
+                for model, trait in traits:
+                    trait['event_id'] = event_id
+                    trait_rows.setdefault(model, []).append(trait)
+            for model, rows in trait_rows.items():
+                session.execute(model.__table__.insert(), rows)
+        self._event_type_ids.update(event_type_ids)
+
     def record_events(self, event_models):
         """Write the events to SQL database via sqlalchemy.
 
+        The events are written in a single transaction, with one insert
+        statement for the events and one per trait table. If that fails,
+        they are written again one by one.
+
         :param event_models: a list of model.Event objects.
         """
         session = self._engine_facade.get_session()
         error = None
+        batch = []
+        message_ids = set()
         for event_model in event_models:
-            event = None
             try:
-                with session.begin():
-                    event_type = self._get_or_create_event_type(
-                        event_model.event_type, session=session)
-                    event = models.Event(event_model.message_id, event_type,
-                                         event_model.generated,
-                                         event_model.raw)
-                    session.add(event)
-                    session.flush()
-
-                    if event_model.traits:
-                        trait_map = {}
-                        for trait in event_model.traits:
-                            if trait_map.get(trait.dtype) is None:
-                                trait_map[trait.dtype] = []
-                            trait_map[trait.dtype].append(
-                                {'event_id': event.id,
-                                 'key': trait.name,
-                                 'value': trait.value})
-                        for dtype in trait_map.keys():
-                            model = TRAIT_ID_TO_MODEL[dtype]
-                            session.execute(model.__table__.insert(),
-                                            trait_map[dtype])
-            except dbexc.DBDuplicateEntry as e:
-                LOG.info(_LI("Duplicate event detected, skipping it: %s") % e)
+                if event_model.message_id in message_ids:
+                    LOG.info(_LI("Duplicate event detected, skipping it: "
+                                 "%s") % event_model.message_id)
+                    continue
+                row = {'message_id': event_model.message_id,
+                       'generated': event_model.generated,
+                       'raw': event_model.raw}
+                traits = [(TRAIT_ID_TO_MODEL[trait.dtype],
+                           {'key': trait.name, 'value': trait.value})
+                          for trait in event_model.traits or []]
             except KeyError as e:
                 LOG.exception(_LE('Failed to record event: %s') % e)
             except Exception as e:
                 LOG.exception(_LE('Failed to record event: %s') % e)
                 error = e
+            else:
+                message_ids.add(event_model.message_id)
+                batch.append((event_model, row, traits))
+
+        if batch:
+            try:
+                self._record_batch(session, batch)
+            except Exception as e:
+                # NOTE: the cached event type ids may be stale, as unused
+                # event types are removed with the expired events.
+                self._event_type_ids.clear()
+                LOG.warning(_LW('Failed to record %(count)d events at once, '
+                                'recording them one by one: %(err)s') %
+                            {'count': len(batch), 'err': e})
+                for event_model, row, traits in batch:
+                    try:
+                        self._record_event(session, event_model)
+                    except dbexc.DBDuplicateEntry as e:
+                        LOG.info(_LI("Duplicate event detected, skipping "
+                                     "it: %s") % e)
+                    except Exception as e:
+                        LOG.exception(_LE('Failed to record event: %s') % e)
+                        error = e
         if error:
             raise error
 
@@ -433,3 +534,4 @@ class Connection(base.Connection):
              .filter(~models.EventType.events.any())
              .delete(synchronize_session="fetch"))
             LOG.info(_LI("%d events are removed from database"), event_rows)
+        self._event_type_ids.clear()
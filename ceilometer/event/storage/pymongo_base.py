@@ -33,6 +33,9 @@ AVAILABLE_STORAGE_CAPABILITIES = {
     'storage': {'production_ready': True},
 }
 
+# Codes of the write errors reported for a duplicate key
+DUPLICATE_KEY_CODES = (11000, 11001, 12582)
+
 
 class Connection(base.Connection):
     """Base event Connection class for MongoDB and DB2 drivers."""
@@ -47,27 +50,52 @@ class Connection(base.Connection):
     def record_events(self, event_models):
         """Write the events to database.
 
+        The events are written with a single unordered insert, the ones
+        whose message id is already recorded are skipped.
+
         :param event_models: a list of models.Event objects.
         """
         error = None
+        events = []
         for event_model in event_models:
-            traits = []
-            if event_model.traits:
-                for trait in event_model.traits:
-                    traits.append({'trait_name': trait.name,
-                                   'trait_type': trait.dtype,
-                                   'trait_value': trait.value})
             try:
-                self.db.event.insert_one(
-                    {'_id': event_model.message_id,
-                     'event_type': event_model.event_type,
-                     'timestamp': event_model.generated,
-                     'traits': traits, 'raw': event_model.raw})
-            except pymongo.errors.DuplicateKeyError as ex:
-                LOG.info(_LI("Duplicate event detected, skipping it: %s") % ex)
+                traits = []
+                if event_model.traits:
+                    for trait in event_model.traits:
+                        traits.append({'trait_name': trait.name,
+                                       'trait_type': trait.dtype,
+                                       'trait_value': trait.value})
+                events.append({'_id': event_model.message_id,
+                               'event_type': event_model.event_type,
+                               'timestamp': event_model.generated,
+                               'traits': traits, 'raw': event_model.raw})
             except Exception as ex:
                 LOG.exception(_LE("Failed to record event: %s") % ex)
                 error = ex
+        if events:
+            try:
+                self.db.event.insert_many(events, ordered=False)
+            except pymongo.errors.BulkWriteError as ex:
+                # NOTE: with an unordered insert, the events which do not
+                # fail are recorded and each failure is reported here.
+                failed = False
+                for err in ex.details.get('writeErrors', []):
+                    if err.get('code') in DUPLICATE_KEY_CODES:
+                        LOG.info(_LI("Duplicate event detected, skipping "
+                                     "it: %s") % err.get('errmsg'))
+                    else:
+                        LOG.error(_LE("Failed to record event: %s") %
+                                  err.get('errmsg'))
+                        failed = True
+                for err in ex.details.get('writeConcernErrors', []):
+                    LOG.error(_LE("Failed to record events: %s") %
+                              err.get('errmsg'))
+                    failed = True
+                if failed:
+                    error = ex
+            except Exception as ex:
+                LOG.exception(_LE("Failed to record events: %s") % ex)
+                error = ex
         if error:
             raise error
 
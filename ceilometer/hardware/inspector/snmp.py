@@ -20,6 +20,7 @@
 """Inspector for collecting data over SNMP"""
 
 import copy
+from eventlet import semaphore
 from pysnmp.entity.rfc3413.oneliner import cmdgen
 
 import six
@@ -66,6 +67,7 @@ class SNMPInspector(base.Inspector):
     _port = 161
 
     _CACHE_KEY_OID = "snmp_cached_oid"
+    _CACHE_KEY_LOCK = "snmp_cached_oid_lock"
 
     # NOTE: The following mapping has been moved to the yaml file identified
     # by the config options hardware.meter_definitions_file. However, we still
@@ -196,6 +198,13 @@ class SNMPInspector(base.Inspector):
             metadata[key] = cls.get_oid_value(oid_cache, oid_def, suffix)
         return metadata
 
+    @classmethod
+    def _get_lock(cls, cache):
+        # NOTE: the pollsters of a host run concurrently and share its
+        # cache, the oids missing from it are queried under this lock so
+        # that pollsters needing the same oids only query them once.
+        return cache.setdefault(cls._CACHE_KEY_LOCK, semaphore.Semaphore())
+
     @classmethod
     def _find_missing_oids(cls, meter_def, cache):
         # find oids have not been queried and cached
@@ -216,12 +225,13 @@ class SNMPInspector(base.Inspector):
     def inspect_generic(self, host, cache, extra_metadata, param):
         # the snmp definition for the corresponding meter
         meter_def = param
-        # collect oids that needs to be queried
-        oids_to_query = self._find_missing_oids(meter_def, cache)
-        # query oids and populate into caches
-        if oids_to_query:
-            self._query_oids(host, oids_to_query, cache,
-                             meter_def['matching_type'] == PREFIX)
+        with self._get_lock(cache):
+            # collect oids that needs to be queried
+            oids_to_query = self._find_missing_oids(meter_def, cache)
+            # query oids and populate into caches
+            if oids_to_query:
+                self._query_oids(host, oids_to_query, cache,
+                                 meter_def['matching_type'] == PREFIX)
         # construct (value, metadata, extra)
         oid_cache = cache[self._CACHE_KEY_OID]
         # find all oids which needed to construct final sample values
@@ -256,8 +266,9 @@ class SNMPInspector(base.Inspector):
     def _post_op_memory_avail_to_used(self, host, cache, meter_def,
                                       value, metadata, extra, suffix):
         _memory_total_oid = "1.3.6.1.4.1.2021.4.5.0"
-        if _memory_total_oid not in cache[self._CACHE_KEY_OID]:
-            self._query_oids(host, [_memory_total_oid], cache, False)
+        with self._get_lock(cache):
+            if _memory_total_oid not in cache[self._CACHE_KEY_OID]:
+                self._query_oids(host, [_memory_total_oid], cache, False)
         value = int(cache[self._CACHE_KEY_OID][_memory_total_oid]) - value
         return value
 
@@ -266,11 +277,12 @@ class SNMPInspector(base.Inspector):
         # add ip address into metadata
         _interface_ip_oid = "1.3.6.1.2.1.4.20.1.2"
         oid_cache = cache.setdefault(self._CACHE_KEY_OID, {})
-        if not self.find_matching_oids(oid_cache,
-                                       _interface_ip_oid,
-                                       PREFIX):
-            # populate the oid into cache
-            self._query_oids(host, [_interface_ip_oid], cache, True)
+        with self._get_lock(cache):
+            if not self.find_matching_oids(oid_cache,
+                                           _interface_ip_oid,
+                                           PREFIX):
+                # populate the oid into cache
+                self._query_oids(host, [_interface_ip_oid], cache, True)
         ip_addr = ''
         for k, v in six.iteritems(oid_cache):
             if k.startswith(_interface_ip_oid) and v == int(suffix[1:]):
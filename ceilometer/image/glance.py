@@ -73,9 +73,8 @@ class _Base(plugin_base.PollsterBase):
     def _iter_images(self, ksclient, cache, endpoint):
         """Iterate over all images."""
         key = '%s-images' % endpoint
-        if key not in cache:
-            cache[key] = list(self._get_images(ksclient, endpoint))
-        return iter(cache[key])
+        return iter(plugin_base.get_cached(
+            cache, key, lambda: list(self._get_images(ksclient, endpoint))))
 
     @staticmethod
     def extract_image_metadata(image):
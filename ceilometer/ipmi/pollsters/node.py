@@ -150,10 +150,9 @@ class _CUPSUtilPollsterBase(_Base):
     CACHE_KEY_CUPS = 'CUPS'
 
     def read_data(self, cache):
-        i_cache = cache.setdefault(self.CACHE_KEY_CUPS, {})
-        if not i_cache:
-            i_cache.update(self.nodemanager.read_cups_utilization())
-        return i_cache
+        return plugin_base.get_cached(
+            cache, self.CACHE_KEY_CUPS,
+            lambda: dict(self.nodemanager.read_cups_utilization()))
 
 
 class CPUUtilPollster(_CUPSUtilPollsterBase):
@@ -76,11 +76,11 @@ def get_rpc_client(transport, retry=None, **kwargs):
 
 
 def get_notification_listener(transport, targets, endpoints,
-                              allow_requeue=False):
+                              allow_requeue=False, pool=None):
     """Return a configured oslo_messaging notification listener."""
     return oslo_messaging.get_notification_listener(
         transport, targets, endpoints, executor='eventlet',
-        allow_requeue=allow_requeue)
+        allow_requeue=allow_requeue, pool=pool)
 
 
 def get_notifier(transport, publisher_id):
@@ -13,6 +13,7 @@
 
 import fnmatch
 import itertools
+import operator
 import pkg_resources
 import six
 
@@ -26,6 +27,7 @@ from ceilometer.agent import plugin_base
 from ceilometer import declarative
 from ceilometer.i18n import _LE
 from ceilometer import sample
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('meter_definitions_cfg_file',
@@ -100,6 +102,13 @@ class MeterDefinition(object):
             if fnmatch.fnmatch(meter_name, t):
                 return True
 
+    @property
+    def exact_types(self):
+        """Event types matched by name, None if there are wildcards."""
+        if any(c in t for t in self._event_type for c in '*?['):
+            return None
+        return set(self._event_type)
+
     def to_samples(self, message, all_values=False):
         # Sample defaults
         sample = {
@@ -170,10 +179,39 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
 
     event_types = []
 
+    CACHE_SIZE = 1024
+
     def __init__(self, manager):
         super(ProcessMeterNotifications, self).__init__(manager)
         self.definitions = self._load_definitions()
 
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        # Definitions only listing event types by name are indexed by
+        # name, the others are matched against each new event type. The
+        # dispatch table is rebuilt whenever the definitions are reloaded.
+        self._definitions = definitions
+        self._exact = {}
+        self._wildcards = []
+        for i, d in enumerate(definitions):
+            exact_types = d.exact_types
+            if exact_types is None:
+                self._wildcards.append((i, d))
+            else:
+                for t in exact_types:
+                    self._exact.setdefault(t, []).append((i, d))
+        self._cache = utils.LRUCache(self.CACHE_SIZE)
+
+    def _find_definitions(self, event_type):
+        """Return the definitions matching event_type, in order."""
+        matches = self._exact.get(event_type, []) + [
+            (i, d) for i, d in self._wildcards if d.match_type(event_type)]
+        return [d for i, d in sorted(matches, key=operator.itemgetter(0))]
+
     @staticmethod
     def _load_definitions():
         plugin_manager = extension.ExtensionManager(
@@ -227,7 +265,11 @@ class ProcessMeterNotifications(plugin_base.NotificationBase):
         return targets
 
     def process_notification(self, notification_body):
-        for d in self.definitions:
-            if d.match_type(notification_body['event_type']):
-                for s in d.to_samples(notification_body):
-                    yield sample.Sample.from_notification(**s)
+        event_type = notification_body['event_type']
+        definitions = self._cache.get(event_type)
+        if definitions is None:
+            definitions = self._find_definitions(event_type)
+            self._cache[event_type] = definitions
+        for d in definitions:
+            for s in d.to_samples(notification_body):
+                yield sample.Sample.from_notification(**s)
@@ -39,9 +39,9 @@ class FloatingIPPollster(plugin_base.PollsterBase):
 
     def _iter_floating_ips(self, ksclient, cache, endpoint):
         key = '%s-floating_ips' % endpoint
-        if key not in cache:
-            cache[key] = list(self._get_floating_ips(ksclient, endpoint))
-        return iter(cache[key])
+        return iter(plugin_base.get_cached(
+            cache, key,
+            lambda: list(self._get_floating_ips(ksclient, endpoint))))
 
     @property
     def default_discovery(self):
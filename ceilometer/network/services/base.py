@@ -34,9 +34,8 @@ class BaseServicesPollster(plugin_base.PollsterBase):
 
     @staticmethod
     def _iter_cache(cache, meter_name, method):
-        if meter_name not in cache:
-            cache[meter_name] = list(method())
-        return iter(cache[meter_name])
+        return iter(plugin_base.get_cached(cache, meter_name,
+                                           lambda: list(method())))
 
     def extract_metadata(self, metric):
         return dict((k, metric[k]) for k in self.FIELDS)
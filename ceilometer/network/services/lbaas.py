@@ -20,6 +20,7 @@ from oslo_log import log
 from oslo_utils import timeutils
 import six
 
+from ceilometer.agent import plugin_base
 from ceilometer.i18n import _
 from ceilometer.network.services import base
 from ceilometer import neutron_client
@@ -227,16 +228,17 @@ class _LBStatsPollster(base.BaseServicesPollster):
         )
 
     def _populate_stats_cache(self, pool_id, cache):
-        i_cache = cache.setdefault("lbstats", {})
-        if pool_id not in i_cache:
+        i_cache = plugin_base.get_nested_cache(cache, "lbstats")
+
+        def _pool_stats():
             stats = self.client.pool_stats(pool_id)['stats']
-            i_cache[pool_id] = LBStatsData(
+            return LBStatsData(
                 active_connections=stats['active_connections'],
                 total_connections=stats['total_connections'],
                 bytes_in=stats['bytes_in'],
                 bytes_out=stats['bytes_out'],
             )
-        return i_cache[pool_id]
+        return plugin_base.get_cached(i_cache, pool_id, _pool_stats)
 
     @property
     def default_discovery(self):
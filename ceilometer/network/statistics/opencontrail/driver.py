@@ -17,6 +17,7 @@ import re
 from oslo_utils import timeutils
 from six.moves.urllib import parse as urlparse
 
+from ceilometer.agent import plugin_base
 from ceilometer.network.statistics import driver
 from ceilometer.network.statistics.opencontrail import client
 from ceilometer import neutron_client
@@ -60,18 +61,10 @@ class OpencontrailDriver(driver.Driver):
     """
     @staticmethod
     def _prepare_cache(endpoint, params, cache):
-
-        if 'network.statistics.opencontrail' in cache:
-            return cache['network.statistics.opencontrail']
-
-        data = {
-            'o_client': client.Client(endpoint),
-            'n_client': neutron_client.Client()
-        }
-
-        cache['network.statistics.opencontrail'] = data
-
-        return data
+        return plugin_base.get_cached(
+            cache, 'network.statistics.opencontrail',
+            lambda: {'o_client': client.Client(endpoint),
+                     'n_client': neutron_client.Client()})
 
     def get_sample_data(self, meter_name, parse_url, params, cache):
 
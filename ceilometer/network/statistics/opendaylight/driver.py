@@ -19,6 +19,7 @@ import six
 from six import moves
 from six.moves.urllib import parse as urlparse
 
+from ceilometer.agent import plugin_base
 from ceilometer.i18n import _
 from ceilometer.network.statistics import driver
 from ceilometer.network.statistics.opendaylight import client
@@ -82,12 +83,14 @@ class OpenDayLightDriver(driver.Driver):
       http://127.0.0.1:8080/controller/nb/v2/statistics/default/flow
       http://127.0.0.1:8080/controller/nb/v2/statistics/egg/flow
     """
-    @staticmethod
-    def _prepare_cache(endpoint, params, cache):
-
-        if 'network.statistics.opendaylight' in cache:
-            return cache['network.statistics.opendaylight']
+    @classmethod
+    def _prepare_cache(cls, endpoint, params, cache):
+        return plugin_base.get_cached(
+            cache, 'network.statistics.opendaylight',
+            lambda: cls._get_data(endpoint, params))
 
+    @staticmethod
+    def _get_data(endpoint, params):
         data = {}
 
         container_names = params.get('container_name', ['default'])
@@ -169,8 +172,6 @@ class OpenDayLightDriver(driver.Driver):
                 LOG.exception(_('Request failed to connect to OpenDaylight'
                                 ' with NorthBound REST API'))
 
-        cache['network.statistics.opendaylight'] = data
-
         return data
 
     def get_sample_data(self, meter_name, parse_url, params, cache):
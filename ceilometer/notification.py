@@ -12,6 +12,7 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import functools
 import itertools
 
 from oslo_config import cfg
@@ -59,6 +60,23 @@ OPTS = [
                 default=False,
                 help='Enable workload partitioning, allowing multiple '
                      'notification agents to be run simultaneously.'),
+    cfg.IntOpt('batch_size',
+               default=1,
+               min=1,
+               help='Number of notification messages received by a '
+                    'listener whose samples and events are published '
+                    'together through the pipelines. A message counts once '
+                    'whatever the number of meter definitions or event '
+                    'handlers it matches, and is acknowledged once the '
+                    'batch it belongs to has been published. The default '
+                    'of 1 publishes the data of every message on its own.'),
+    cfg.IntOpt('batch_timeout',
+               default=1,
+               min=1,
+               help='Number of seconds to wait before publishing a partial '
+                    'batch of notification messages, so that messages are '
+                    'not held when less than batch_size of them are '
+                    'received by a listener.'),
     cfg.MultiStrOpt('messaging_urls',
                     default=[],
                     secret=True,
@@ -74,6 +92,53 @@ cfg.CONF.import_opt('telemetry_driver', 'ceilometer.publisher.messaging',
                     group='publisher_notifier')
 
 
+# Methods of the notification endpoints, one per notification priority, as
+# documented by oslo.messaging.
+NOTIFICATION_PRIORITIES = ('audit', 'debug', 'info', 'warn', 'error',
+                           'critical', 'sample')
+
+
+class BatchNotificationEndpoint(object):
+    """Endpoint dispatching each message to the endpoints of a listener.
+
+    All the endpoints matching a message are called through the
+    BatchDispatcher of the listener, so that the message joins a batch
+    once with the data published by all of them. Endpoints are screened
+    with their filter_rule and their results handled as oslo.messaging
+    would do for a listener created with the same allow_requeue.
+    """
+
+    def __init__(self, dispatcher, endpoints, allow_requeue=False):
+        self.dispatcher = dispatcher
+        self.allow_requeue = allow_requeue
+        for priority in NOTIFICATION_PRIORITIES:
+            callbacks = [(getattr(e, 'filter_rule', None),
+                          getattr(e, priority))
+                         for e in endpoints if hasattr(e, priority)]
+            if callbacks:
+                setattr(self, priority,
+                        functools.partial(self._dispatch, callbacks))
+
+    def _dispatch(self, callbacks, ctxt, publisher_id, event_type, payload,
+                  metadata):
+        return self.dispatcher.dispatch(
+            self._call, callbacks, ctxt, publisher_id, event_type, payload,
+            metadata)
+
+    def _call(self, callbacks, ctxt, publisher_id, event_type, payload,
+              metadata):
+        for screen, callback in callbacks:
+            if screen and not screen.match(ctxt, publisher_id, event_type,
+                                           metadata, payload):
+                continue
+            result = callback(ctxt, publisher_id, event_type, payload,
+                              metadata)
+            if (self.allow_requeue and
+                    result == oslo_messaging.NotificationResult.REQUEUE):
+                return result
+        return oslo_messaging.NotificationResult.HANDLED
+
+
 class NotificationService(service_base.BaseService):
     """Notification service.
 
@@ -82,6 +147,10 @@ class NotificationService(service_base.BaseService):
     to the main OpenStack queue and another listener(and notifier) for IPC to
     divide pipeline sink endpoints. Coordination should be enabled to have
     proper active/active HA.
+
+    Each worker process started with the `workers` option runs its own
+    listeners and pipelines, and joins the partitioning group as a member
+    of its own.
     """
 
     NOTIFICATION_NAMESPACE = 'ceilometer.notification'
@@ -149,6 +218,16 @@ class NotificationService(service_base.BaseService):
 
         self.transport = messaging.get_transport()
 
+        if (cfg.CONF.notification.workers > 1 and
+                not cfg.CONF.notification.workload_partitioning and
+                any(p.sink.transformers
+                    for p in self.pipeline_manager.pipelines)):
+            LOG.warning(_LW('Pipelines with transformers are run by %d '
+                            'notification workers without workload '
+                            'partitioning, each worker only transforms '
+                            'the samples it receives.'),
+                        cfg.CONF.notification.workers)
+
         if cfg.CONF.notification.workload_partitioning:
             self.ctxt = context.get_admin_context()
             self.group_id = self.NOTIFICATION_NAMESPACE
@@ -192,8 +271,30 @@ class NotificationService(service_base.BaseService):
 
         self.init_pipeline_refresh()
 
+    @staticmethod
+    def _get_batch_manager(manager):
+        if cfg.CONF.notification.batch_size > 1 and manager is not None:
+            return pipeline.BatchPublishManager(manager)
+        return manager
+
+    @staticmethod
+    def _get_batch_endpoints(endpoints, name, allow_requeue):
+        batch_size = cfg.CONF.notification.batch_size
+        if batch_size > 1:
+            LOG.info(_LI('Publishing the data of %(name)s in batches of '
+                         '%(size)d notifications'),
+                     {'name': name, 'size': batch_size})
+            return [BatchNotificationEndpoint(
+                pipeline.BatchDispatcher(
+                    name, batch_size, cfg.CONF.notification.batch_timeout,
+                    requeue_on_error=allow_requeue),
+                endpoints, allow_requeue)]
+        return endpoints
+
     def _configure_main_queue_listeners(self, pipe_manager,
                                         event_pipe_manager):
+        pipe_manager = self._get_batch_manager(pipe_manager)
+        event_pipe_manager = self._get_batch_manager(event_pipe_manager)
         notification_manager = self._get_notifications_manager(pipe_manager)
         if not list(notification_manager):
             LOG.warning(_('Failed to load any notification handlers for %s'),
@@ -225,11 +326,19 @@ class NotificationService(service_base.BaseService):
                     targets.append(new_tar)
             endpoints.append(handler)
 
+        # NOTE: batches are published once their messages are dispatched,
+        # out of reach of the event endpoint, so the batch dispatcher
+        # requeues the messages of a batch which failed to be published.
+        allow_requeue = (cfg.CONF.notification.batch_size > 1 and
+                         not ack_on_error)
         urls = cfg.CONF.notification.messaging_urls or [None]
-        for url in urls:
+        for i, url in enumerate(urls):
             transport = messaging.get_transport(url)
             listener = messaging.get_notification_listener(
-                transport, targets, endpoints)
+                transport, targets,
+                self._get_batch_endpoints(endpoints, 'listener-%d' % i,
+                                          allow_requeue),
+                allow_requeue=allow_requeue)
             listener.start()
             self.listeners.append(listener)
 
@@ -76,10 +76,9 @@ class _Base(plugin_base.PollsterBase):
         return _Base._ENDPOINT
 
     def _iter_accounts(self, ksclient, cache, tenants):
-        if self.CACHE_KEY_METHOD not in cache:
-            cache[self.CACHE_KEY_METHOD] = list(self._get_account_info(
-                ksclient, tenants))
-        return iter(cache[self.CACHE_KEY_METHOD])
+        return iter(plugin_base.get_cached(
+            cache, self.CACHE_KEY_METHOD,
+            lambda: list(self._get_account_info(ksclient, tenants))))
 
     def _get_account_info(self, ksclient, tenants):
         endpoint = self._get_endpoint(ksclient)
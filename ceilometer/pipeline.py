@@ -18,9 +18,12 @@
 # under the License.
 
 import abc
+import collections
 import fnmatch
 import hashlib
 import os
+import re
+import threading
 
 from oslo_config import cfg
 from oslo_log import log
@@ -32,10 +35,11 @@ import yaml
 
 
 from ceilometer.event.storage import models
-from ceilometer.i18n import _, _LI, _LW
+from ceilometer.i18n import _, _LE, _LI, _LW
 from ceilometer import publisher
 from ceilometer.publisher import utils as publisher_utils
 from ceilometer import sample as sample_util
+from ceilometer import utils
 
 
 OPTS = [
@@ -154,11 +158,11 @@ class _PipelineTransportManager(object):
         event_type = self.event_type
 
         class PipelinePublishContext(object):
+            def __init__(self):
+                self.buckets = {}
+
             def __enter__(self):
                 def p(data):
-                    # TODO(gordc): cleanup so payload is always single
-                    #              datapoint. we can't correctly bucketise
-                    #              datapoints if batched.
                     data = [data] if not isinstance(data, list) else data
                     for datapoint in data:
                         serialized_data = serializer(datapoint)
@@ -167,14 +171,19 @@ class _PipelineTransportManager(object):
                                 key = (hash_grouping(serialized_data,
                                                      grouping_keys)
                                        % len(notifiers))
-                                notifier = notifiers[key]
-                                notifier.sample(context.to_dict(),
-                                                event_type=event_type,
-                                                payload=[serialized_data])
+                                self.buckets.setdefault(
+                                    notifiers[key], []).append(
+                                        serialized_data)
                 return p
 
             def __exit__(self, exc_type, exc_value, traceback):
-                pass
+                # All the datapoints of a bucket go to the same pipeline
+                # queue, so they are sent there as a single message.
+                buckets, self.buckets = self.buckets, {}
+                for notifier, payload in six.iteritems(buckets):
+                    notifier.sample(context.to_dict(),
+                                    event_type=event_type,
+                                    payload=payload)
 
         return PipelinePublishContext()
 
@@ -201,25 +210,180 @@ class EventPipelineTransportManager(_PipelineTransportManager):
 
 class PublishContext(object):
 
-    def __init__(self, context, pipelines=None):
+    def __init__(self, context, pipelines=None, router=None):
         pipelines = pipelines or []
         self.pipelines = set(pipelines)
         self.context = context
+        self.router = router
 
     def add_pipelines(self, pipelines):
         self.pipelines.update(pipelines)
 
     def __enter__(self):
+        # Pipelines the router handed datapoints to, only they are flushed
+        self.routed = set()
+
         def p(data):
-            for p in self.pipelines:
-                p.publish_data(self.context, data)
+            if self.router is None:
+                for p in self.pipelines:
+                    p.publish_data(self.context, data)
+                return
+            # Only hand each datapoint to the pipelines accepting it, the
+            # pipelines receiving nothing are skipped.
+            routed = {}
+            for datapoint in data if isinstance(data, list) else [data]:
+                for pipe in self.router(datapoint):
+                    routed.setdefault(pipe, []).append(datapoint)
+            for pipe, datapoints in six.iteritems(routed):
+                self.routed.add(pipe)
+                pipe.publish_data(self.context, datapoints)
         return p
 
     def __exit__(self, exc_type, exc_value, traceback):
-        for p in self.pipelines:
+        pipelines = self.pipelines if self.router is None else self.routed
+        for p in pipelines:
             p.flush(self.context)
 
 
+class BatchPublishManager(object):
+    """Record the datapoints published while a BatchDispatcher dispatches.
+
+    The endpoints of the batched notification listeners are given this
+    wrapper of the pipeline manager. Its publisher() contexts record their
+    datapoints in the message being dispatched by the current thread, or
+    publish them right away through the wrapped manager if no message is
+    being dispatched.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def publisher(self, context):
+        records = getattr(BatchDispatcher.local, 'records', None)
+        if records is None:
+            return self.manager.publisher(context)
+        manager = self.manager
+
+        class BatchPublishContext(object):
+            def __enter__(self):
+                self.datapoints = []
+
+                def p(data):
+                    if isinstance(data, list):
+                        self.datapoints.extend(data)
+                    else:
+                        self.datapoints.append(data)
+                return p
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                if exc_type is None and self.datapoints:
+                    records.append((manager, context, self.datapoints))
+
+        return BatchPublishContext()
+
+
+class BatchDispatcher(object):
+    """Publish the datapoints of the messages of a listener in batches.
+
+    dispatch() hands the datapoints recorded by the BatchPublishManager
+    while handling one message to a BatchBuffer, as a single item, and
+    waits for the batch to be published. A batch so holds batch_size
+    messages whatever the number of endpoints handling each of them, and a
+    message waits for its batch once. The datapoints of a batch are
+    published through a single publisher of each pipeline manager, built
+    with the context of the first message of the batch which used it.
+
+    When requeue_on_error is set, every message of a batch which could not
+    be published is requeued, otherwise the error is raised to each of them.
+    """
+
+    local = threading.local()
+
+    def __init__(self, name, batch_size, batch_timeout,
+                 requeue_on_error=False):
+        self.name = name
+        self.requeue_on_error = requeue_on_error
+        self.buffer = utils.BatchBuffer(name, self._publish, batch_size,
+                                        batch_timeout)
+
+    def dispatch(self, func, *args, **kwargs):
+        self.local.records = records = []
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            del self.local.records
+        if records:
+            try:
+                self.buffer.add([records])
+            except Exception:
+                if not self.requeue_on_error:
+                    raise
+                LOG.exception(_LE('%s: unable to publish a batch, '
+                                  'requeuing its messages'), self.name)
+                return oslo_messaging.NotificationResult.REQUEUE
+        return result
+
+    @staticmethod
+    def _publish(messages):
+        batches = collections.OrderedDict()
+        for records in messages:
+            for manager, context, datapoints in records:
+                batches.setdefault(manager, (context, []))[1].extend(
+                    datapoints)
+        for manager, (context, datapoints) in six.iteritems(batches):
+            with manager.publisher(context) as p:
+                p(datapoints)
+
+
+class _NameMatcher(object):
+    """Compiled form of the meter or event list of a source.
+
+    Names are matched as Source.is_supported would do, with the exact names
+    looked up in a set and all the wildcards folded into a single regex. The
+    decisions are memoized per name.
+    """
+
+    CACHE_SIZE = 1024
+
+    def __init__(self, dataset):
+        self.only_excluded = all(d.startswith('!') for d in dataset)
+        self.excluded = self._compile(d[1:] for d in dataset if d[0] == '!')
+        self.included = self._compile(d for d in dataset if d[0] != '!')
+        self._cache = utils.LRUCache(self.CACHE_SIZE)
+
+    @staticmethod
+    def _compile(patterns):
+        names = set()
+        wildcards = []
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            if any(c in pattern for c in '*?['):
+                wildcards.append('(?:%s)' % fnmatch.translate(pattern))
+            else:
+                names.add(pattern)
+        regex = re.compile('|'.join(wildcards)) if wildcards else None
+        return names, regex
+
+    @staticmethod
+    def _match(compiled, name):
+        names, regex = compiled
+        return name in names or (regex is not None and
+                                 regex.match(name) is not None)
+
+    def __call__(self, data_name):
+        supported = self._cache.get(data_name)
+        if supported is None:
+            name = os.path.normcase(data_name)
+            if self._match(self.excluded, name):
+                supported = False
+            elif self._match(self.included, name):
+                supported = True
+            else:
+                supported = self.only_excluded
+            self._cache[data_name] = supported
+        return supported
+
+
 class Source(object):
     """Represents a source of samples or events."""
 
@@ -295,9 +459,10 @@ class EventSource(Source):
         super(EventSource, self).__init__(cfg)
         self.events = cfg.get('events')
         self.check_source_filtering(self.events, 'events')
+        self._matcher = _NameMatcher(self.events)
 
     def support_event(self, event_name):
-        return self.is_supported(self.events, event_name)
+        return self._matcher(event_name)
 
 
 class SampleSource(Source):
@@ -328,12 +493,13 @@ class SampleSource(Source):
         if not isinstance(self.discovery, list):
             raise PipelineException("Discovery should be a list", cfg)
         self.check_source_filtering(self.meters, 'meters')
+        self._matcher = _NameMatcher(self.meters)
 
     def get_interval(self):
         return self.interval
 
     def support_meter(self, meter_name):
-        return self.is_supported(self.meters, meter_name)
+        return self._matcher(meter_name)
 
 
 class Sink(object):
@@ -548,6 +714,12 @@ class EventPipeline(Pipeline):
     def support_event(self, event_type):
         return self.source.support_event(event_type)
 
+    supports = support_event
+
+    @staticmethod
+    def get_data_name(event):
+        return event.event_type
+
     def publish_data(self, ctxt, events):
         if not isinstance(events, list):
             events = [events]
@@ -573,6 +745,12 @@ class SamplePipeline(Pipeline):
     def support_meter(self, meter_name):
         return self.source.support_meter(meter_name)
 
+    supports = support_meter
+
+    @staticmethod
+    def get_data_name(sample):
+        return sample.name
+
     def _validate_volume(self, s):
         volume = s.volume
         if volume is None:
@@ -628,6 +806,8 @@ class PipelineManager(object):
 
     """
 
+    ROUTES_CACHE_SIZE = 4096
+
     def __init__(self, cfg, transformer_manager, p_type=SAMPLE_TYPE):
         """Setup the pipelines according to config.
 
@@ -696,6 +876,10 @@ class PipelineManager(object):
 
         """
         self.pipelines = []
+        self.p_type = p_type
+        # Pipelines accepting each meter name or event type, filled as
+        # datapoints are published.
+        self._routes = utils.LRUCache(self.ROUTES_CACHE_SIZE)
         if not ('sources' in cfg and 'sinks' in cfg):
             raise PipelineException("Both sources & sinks are required",
                                     cfg)
@@ -738,12 +922,24 @@ class PipelineManager(object):
                     self.pipelines.append(pipe)
         unique_names.clear()
 
+    def get_pipelines(self, name):
+        """Return the pipelines accepting a meter name or event type."""
+        pipelines = self._routes.get(name)
+        if pipelines is None:
+            pipelines = [p for p in self.pipelines if p.supports(name)]
+            self._routes[name] = pipelines
+        return pipelines
+
+    def route(self, datapoint):
+        return self.get_pipelines(
+            self.p_type['pipeline'].get_data_name(datapoint))
+
     def publisher(self, context):
         """Build a new Publisher for these manager pipelines.
 
         :param context: The context.
         """
-        return PublishContext(context, self.pipelines)
+        return PublishContext(context, self.pipelines, self.route)
 
 
 class PollingManager(object):
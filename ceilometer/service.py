@@ -96,7 +96,10 @@ NOTI_OPT = cfg.IntOpt('workers',
                       deprecated_group='DEFAULT',
                       deprecated_name='notification_workers',
                       help='Number of workers for notification service, '
-                           'default value is 1.')
+                           'default value is 1. Each worker is a process '
+                           'with its own listeners and pipelines, which '
+                           'joins the workload partitioning group on its '
+                           'own.')
 cfg.CONF.register_opt(NOTI_OPT, 'notification')
 
 COLL_OPT = cfg.IntOpt('workers',
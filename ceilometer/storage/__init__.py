@@ -75,6 +75,32 @@ OPTS = [
                help="The max length of resources id in DB2 nosql, "
                     "the value should be larger than len(hostname) * 2 "
                     "as compute node's resource id is <hostname>_<nodename>."),
+    cfg.StrOpt('mongodb_event_write_concern',
+               default=None,
+               help="Write concern of the events recorded in MongoDB: the "
+                    "number of replica set members which must acknowledge "
+                    "the writes, 'majority' or a tag set name. If unset, "
+                    "the write concern of the connection string is used."),
+    cfg.IntOpt('sql_id_cache_size',
+               default=10000,
+               help="Maximum number of meter and of resource ids the SQL "
+                    "driver keeps in memory to avoid looking them up when "
+                    "recording samples (0 disables the cache)."),
+    cfg.ListOpt('sql_rollup_granularities',
+                default=[],
+                help="Granularities, in seconds, of the pre-aggregated "
+                     "samples the SQL driver maintains per meter and "
+                     "resource, e.g. 300,3600,86400. Statistics whose range "
+                     "and period line up with them are computed from these "
+                     "rollups. The same value has to be set for every "
+                     "process writing samples. Run ceilometer-dbsync after "
+                     "changing this option to build the rollups of the new "
+                     "granularities from the stored samples, they are only "
+                     "read once built, and ceilometer-rebuild-rollups to "
+                     "compute again the rollups of every granularity. "
+                     "Rollups are read up to the end of their last build, "
+                     "which the statistics queries bring up to date as "
+                     "periods end."),
 ]
 
 cfg.CONF.register_opts(OPTS, group='database')
@@ -149,6 +149,10 @@ class Connection(object):
     def upgrade():
         """Migrate the database to `version` or the most recent version."""
 
+    @staticmethod
+    def rebuild_rollups():
+        """Compute again the pre-aggregated samples from the samples."""
+
     @staticmethod
     def record_metering_data(data):
         """Write the data to the backend storage system.
@@ -161,6 +165,18 @@ class Connection(object):
         raise ceilometer.NotImplementedError(
             'Recording metering data is not implemented')
 
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Drivers able to store several samples in fewer round trips should
+        override this; the default records each sample one at a time.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        for s in samples:
+            self.record_metering_data(s)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system.
@@ -64,6 +64,9 @@ class MTable(object):
     def delete(self, key):
         del self._rows_with_ts[key]
 
+    def batch(self, timestamp=None, batch_size=None, transaction=False):
+        return MBatch(self, timestamp, batch_size, transaction)
+
     def _get_latest_dict(self, row):
         # The idea here is to return latest versions of columns.
         # In _rows_with_ts we store {row: {ts_1: {data}, ts_2: {data}}}.
@@ -243,6 +246,47 @@ class MTable(object):
         return r
 
 
+class MBatch(object):
+    """HappyBase.Batch mock."""
+    def __init__(self, table, timestamp=None, batch_size=None,
+                 transaction=False):
+        self._table = table
+        self._timestamp = timestamp
+        self._batch_size = batch_size
+        self._transaction = transaction
+        self._mutations = []
+
+    def put(self, key, data):
+        self._mutations.append((key, data))
+        self._check_send()
+
+    def delete(self, key):
+        self._mutations.append((key, None))
+        self._check_send()
+
+    def _check_send(self):
+        if self._batch_size and len(self._mutations) >= self._batch_size:
+            self.send()
+
+    def send(self):
+        for key, data in self._mutations:
+            if data is None:
+                self._table.delete(key)
+            else:
+                self._table.put(key, data, self._timestamp)
+        self._mutations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Like HappyBase, only a transactional batch drops its pending
+        # mutations on error
+        if self._transaction and exc_type is not None:
+            return
+        self.send()
+
+
 class MConnectionPool(object):
     def __init__(self):
         self.conn = MConnection()
@@ -12,13 +12,16 @@
 # under the License.
 
 import datetime
+import math
 import operator
 import time
 
 from oslo_log import log
 from oslo_utils import timeutils
+import six
 
 import ceilometer
+from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage.hbase import base as hbase_base
 from ceilometer.storage.hbase import migration as hbase_migration
@@ -36,9 +39,18 @@ AVAILABLE_CAPABILITIES = {
                             'metadata': True}},
     'samples': {'query': {'simple': True,
                           'metadata': True}},
-    'statistics': {'query': {'simple': True,
+    'statistics': {'groupby': True,
+                   'query': {'simple': True,
                              'metadata': True},
-                   'aggregation': {'standard': True}},
+                   'aggregation': {'standard': True,
+                                   'selectable': {
+                                       'max': True,
+                                       'min': True,
+                                       'sum': True,
+                                       'avg': True,
+                                       'count': True,
+                                       'stddev': True,
+                                       'cardinality': True}}},
 }
 
 
@@ -115,6 +127,8 @@ class Connection(hbase_base.Connection, base.Connection):
 
     RESOURCE_TABLE = "resource"
     METER_TABLE = "meter"
+    # Maximum number of mutations sent at once to the meter table
+    BATCH_SIZE = 1000
 
     def __init__(self, url):
         super(Connection, self).__init__(url)
@@ -146,41 +160,69 @@ class Connection(hbase_base.Connection, base.Connection):
         :param data: a dictionary such as returned by
           ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Rows of the meter table are sent through batched mutations, and all
+        the puts on the resource table for a given resource are merged into
+        a single one carrying the timestamp of its newest sample.
+
+        :param samples: a list of dictionaries such as returned by
+          ceilometer.meter.meter_message_from_counter
+        """
+        resources = {}
         with self.conn_pool.connection() as conn:
-            resource_table = conn.table(self.RESOURCE_TABLE)
             meter_table = conn.table(self.METER_TABLE)
+            with meter_table.batch(batch_size=self.BATCH_SIZE) as batch:
+                for data in samples:
+                    # Determine the name of new meter
+                    rts = hbase_utils.timestamp(data['timestamp'])
+                    new_meter = hbase_utils.prepare_key(
+                        rts, data['source'], data['counter_name'],
+                        data['counter_type'], data['counter_unit'])
+
+                    # TODO(nprivalova): try not to store resource_id
+                    resource = hbase_utils.serialize_entry(**{
+                        'source': data['source'],
+                        'meter': {new_meter: data['timestamp']},
+                        'resource_metadata': data.get('resource_metadata',
+                                                      {}),
+                        'resource_id': data['resource_id'],
+                        'project_id': data['project_id'],
+                        'user_id': data['user_id']})
+                    resources.setdefault(data['resource_id'], []).append(
+                        (data['timestamp'], resource))
+
+                    # Rowkey consists of reversed timestamp, meter and a
+                    # message uuid for purposes of uniqueness
+                    row = hbase_utils.prepare_key(data['counter_name'], rts,
+                                                  data['message_id'])
+                    record = hbase_utils.serialize_entry(
+                        data, **{'source': data['source'], 'rts': rts,
+                                 'message': data,
+                                 'recorded_at': timeutils.utcnow()})
+                    batch.put(row, record)
 
-            resource_metadata = data.get('resource_metadata', {})
-            # Determine the name of new meter
-            rts = hbase_utils.timestamp(data['timestamp'])
-            new_meter = hbase_utils.prepare_key(
-                rts, data['source'], data['counter_name'],
-                data['counter_type'], data['counter_unit'])
-
-            # TODO(nprivalova): try not to store resource_id
-            resource = hbase_utils.serialize_entry(**{
-                'source': data['source'],
-                'meter': {new_meter: data['timestamp']},
-                'resource_metadata': resource_metadata,
-                'resource_id': data['resource_id'],
-                'project_id': data['project_id'], 'user_id': data['user_id']})
-            # Here we put entry in HBase with our own timestamp. This is needed
-            # when samples arrive out-of-order
-            # If we use timestamp=data['timestamp'] the newest data will be
-            # automatically 'on the top'. It is needed to keep metadata
-            # up-to-date: metadata from newest samples is considered as actual.
-            ts = int(time.mktime(data['timestamp'].timetuple()) * 1000)
-            resource_table.put(hbase_utils.encode_unicode(data['resource_id']),
-                               resource, ts)
-
-            # Rowkey consists of reversed timestamp, meter and a
-            # message uuid for purposes of uniqueness
-            row = hbase_utils.prepare_key(data['counter_name'], rts,
-                                          data['message_id'])
-            record = hbase_utils.serialize_entry(
-                data, **{'source': data['source'], 'rts': rts,
-                         'message': data, 'recorded_at': timeutils.utcnow()})
-            meter_table.put(row, record)
+            resource_table = conn.table(self.RESOURCE_TABLE)
+            for resource_id, entries in six.iteritems(resources):
+                # Merge the entries oldest first so the newest sample of the
+                # batch provides the metadata, while meters and sources of
+                # every sample are kept.
+                entries.sort(key=operator.itemgetter(0))
+                resource = {}
+                for ignored, entry in entries:
+                    resource.update(entry)
+                # Here we put entry in HBase with our own timestamp. This is
+                # needed when samples arrive out-of-order
+                # If we use timestamp=data['timestamp'] the newest data will
+                # be automatically 'on the top'. It is needed to keep metadata
+                # up-to-date: metadata from newest samples is considered as
+                # actual.
+                ts = int(time.mktime(entries[-1][0].timetuple()) * 1000)
+                resource_table.put(hbase_utils.encode_unicode(resource_id),
+                                   resource, ts)
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
@@ -314,29 +356,6 @@ class Connection(hbase_base.Connection, base.Connection):
                 d_meter['message']['recorded_at'] = d_meter['recorded_at']
                 yield models.Sample(**d_meter['message'])
 
-    @staticmethod
-    def _update_meter_stats(stat, meter):
-        """Do the stats calculation on a requested time bucket in stats dict
-
-        :param stats: dict where aggregated stats are kept
-        :param index: time bucket index in stats
-        :param meter: meter record as returned from HBase
-        :param start_time: query start time
-        :param period: length of the time bucket
-        """
-        vol = meter['counter_volume']
-        ts = meter['timestamp']
-        stat.unit = meter['counter_unit']
-        stat.min = min(vol, stat.min or vol)
-        stat.max = max(vol, stat.max)
-        stat.sum = vol + (stat.sum or 0)
-        stat.count += 1
-        stat.avg = (stat.sum / float(stat.count))
-        stat.duration_start = min(ts, stat.duration_start or ts)
-        stat.duration_end = max(ts, stat.duration_end or ts)
-        stat.duration = (timeutils.delta_seconds(stat.duration_start,
-                                                 stat.duration_end))
-
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
         """Return an iterable of models.Statistics instances.
@@ -348,77 +367,185 @@ class Connection(hbase_base.Connection, base.Connection):
 
           Due to HBase limitations the aggregations are implemented
           in the driver itself, therefore this method will be quite slow
-          because of all the Thrift traffic it is going to create.
+          because of all the Thrift traffic it is going to create. The
+          meters are scanned once. Unless periods are requested without a
+          start timestamp, samples are consumed as they are scanned and only
+          one accumulator per period and group is kept in memory.
         """
-        if groupby:
-            raise ceilometer.NotImplementedError("Group by not implemented.")
-
-        if aggregate:
+        if groupby and set(groupby) - set(STATISTICS_GROUPBY):
             raise ceilometer.NotImplementedError(
-                'Selectable aggregates not implemented')
-
+                "Unable to group by these fields")
+
+        for a in aggregate or []:
+            if a.func not in SELECTABLE_AGGREGATES:
+                raise ceilometer.NotImplementedError(
+                    'Selectable aggregate function %s'
+                    ' is not supported' % a.func)
+            if a.func == 'cardinality' and a.param not in CARDINALITY_FIELDS:
+                raise storage.StorageBadAggregate('Bad aggregate: %s.%s'
+                                                  % (a.func, a.param))
+
+        distinct_fields = set(a.param for a in aggregate or []
+                              if a.func == 'cardinality')
+
+        q, start, stop, columns = (hbase_utils.
+                                   make_sample_query_from_filter
+                                   (sample_filter))
+        # Keep the columns used by the filter but not the raw message
+        columns = [c for c in columns
+                   if c not in ('f:message', 'f:recorded_at')]
+        columns.append('f:timestamp')
+
+        # These fields are used in statistics' calculating
+        columns.extend(['f:counter_volume', 'f:counter_unit'])
+        columns.extend('f:%s' % g for g in groupby or [])
+        columns.extend('f:%s' % f for f in distinct_fields)
+        columns = [c.replace('f:resource_metadata.', 'f:r_metadata.')
+                   for c in columns]
+        stat_fields = (['timestamp', 'counter_volume', 'counter_unit'] +
+                       list(distinct_fields))
+
+        results = {}
+
+        def add(start_time, f_meter, group):
+            index = (int(timeutils.delta_seconds(
+                start_time, f_meter['timestamp']) / period)
+                if period else 0)
+            stat = results.get((index, group))
+            if stat is None:
+                stat = results[(index, group)] = _StatisticsAccumulator(
+                    distinct_fields)
+            stat.update(f_meter)
+
+        start_time = sample_filter.start_timestamp
+        # NOTE: periods are aligned on the oldest sample when there is no
+        #       start timestamp, but HBase meters are scanned newest-first,
+        #       so the oldest one is the last row scanned. The fields used
+        #       by the statistics are then kept until the scan ends rather
+        #       than scanning the meters twice.
+        pending = [] if period and start_time is None else None
+        first_ts = last_ts = None
         with self.conn_pool.connection() as conn:
             meter_table = conn.table(self.METER_TABLE)
-            q, start, stop, columns = (hbase_utils.
-                                       make_sample_query_from_filter
-                                       (sample_filter))
-            # These fields are used in statistics' calculating
-            columns.extend(['f:timestamp', 'f:counter_volume',
-                            'f:counter_unit'])
-            meters = map(hbase_utils.deserialize_entry,
-                         list(meter for (ignored, meter) in
-                              meter_table.scan(
-                                  filter=q, row_start=start,
-                                  row_stop=stop, columns=columns)))
-
-        if sample_filter.start_timestamp:
-            start_time = sample_filter.start_timestamp
-        elif meters:
-            start_time = meters[-1][0]['timestamp']
-        else:
-            start_time = None
-
-        if sample_filter.end_timestamp:
-            end_time = sample_filter.end_timestamp
-        elif meters:
-            end_time = meters[0][0]['timestamp']
-        else:
-            end_time = None
-
-        results = []
+            for ignored, meter in meter_table.scan(
+                    filter=q, row_start=start, row_stop=stop,
+                    columns=columns):
+                f_meter, _s, _m, md = hbase_utils.deserialize_entry(
+                    meter, get_raw_meta=False)
+                ts = f_meter['timestamp']
+                first_ts = min(ts, first_ts or ts)
+                last_ts = max(ts, last_ts or ts)
+                group = tuple(
+                    md.get(g[len('resource_metadata.'):])
+                    if g.startswith('resource_metadata.') else f_meter.get(g)
+                    for g in groupby or [])
+                if pending is None:
+                    add(start_time, f_meter, group)
+                else:
+                    pending.append((dict((f, f_meter[f]) for f in stat_fields
+                                         if f in f_meter), group))
+        if pending:
+            start_time = first_ts
+            for f_meter, group in pending:
+                add(start_time, f_meter, group)
 
         if not period:
             period = 0
-            period_start = start_time
-            period_end = end_time
-
-        # As our HBase meters are stored as newest-first, we need to iterate
-        # in the reverse order
-        for meter in meters[::-1]:
-            ts = meter[0]['timestamp']
+            period_start = sample_filter.start_timestamp or first_ts
+            period_end = sample_filter.end_timestamp or last_ts
+
+        # NOTE: group values are None for samples missing the field and
+        #       None does not compare with strings on py3, so sort it first.
+        def _sort_key(item):
+            index, group = item[0]
+            return index, tuple((g is not None, g) for g in group)
+
+        stats = []
+        for (index, group), stat in sorted(six.iteritems(results),
+                                           key=_sort_key):
             if period:
-                offset = int(timeutils.delta_seconds(
-                    start_time, ts) / period) * period
-                period_start = start_time + datetime.timedelta(0, offset)
-
-            if not results or not results[-1].period_start == period_start:
-                if period:
-                    period_end = period_start + datetime.timedelta(
-                        0, period)
-                results.append(
-                    models.Statistics(unit='',
-                                      count=0,
-                                      min=0,
-                                      max=0,
-                                      avg=0,
-                                      sum=0,
-                                      period=period,
-                                      period_start=period_start,
-                                      period_end=period_end,
-                                      duration=None,
-                                      duration_start=None,
-                                      duration_end=None,
-                                      groupby=None)
-                )
-            self._update_meter_stats(results[-1], meter[0])
-        return results
+                period_start = start_time + datetime.timedelta(
+                    0, index * period)
+                period_end = period_start + datetime.timedelta(0, period)
+            elif groupby:
+                period_start = stat.duration_start
+                period_end = stat.duration_end
+            stats.append(stat.to_model(
+                period, period_start, period_end,
+                dict(zip(groupby, group)) if groupby else None, aggregate))
+        return stats
+
+
+STATISTICS_GROUPBY = ('user_id', 'project_id', 'resource_id',
+                      'resource_metadata.instance_type')
+SELECTABLE_AGGREGATES = ('max', 'min', 'sum', 'avg', 'count', 'stddev',
+                         'cardinality')
+CARDINALITY_FIELDS = ('resource_id', 'user_id', 'project_id')
+
+
+class _StatisticsAccumulator(object):
+    """Running aggregates of the samples of one period and group."""
+
+    def __init__(self, distinct_fields=()):
+        self.unit = ''
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+        self.sum_sq = 0
+        self.duration_start = None
+        self.duration_end = None
+        # Distinct values are only kept for the requested cardinalities
+        self.distinct = dict((f, set()) for f in distinct_fields)
+
+    def update(self, meter):
+        vol = meter['counter_volume']
+        ts = meter['timestamp']
+        self.unit = meter['counter_unit']
+        self.count += 1
+        self.min = vol if self.min is None else min(vol, self.min)
+        self.max = vol if self.max is None else max(vol, self.max)
+        self.sum += vol
+        self.sum_sq += vol * vol
+        self.duration_start = min(ts, self.duration_start or ts)
+        self.duration_end = max(ts, self.duration_end or ts)
+        for field, values in six.iteritems(self.distinct):
+            if field in meter:
+                values.add(meter[field])
+
+    def _aggregates(self):
+        avg = self.sum / float(self.count)
+        return {'min': self.min,
+                'max': self.max,
+                'sum': self.sum,
+                'count': self.count,
+                'avg': avg,
+                'stddev': math.sqrt(max(self.sum_sq / float(self.count) -
+                                        avg * avg, 0))}
+
+    def to_model(self, period, period_start, period_end, groupby, aggregate):
+        values = self._aggregates()
+        if aggregate:
+            stats_args = {'aggregate': {}}
+            for a in aggregate:
+                if a.func == 'cardinality':
+                    stats_args['aggregate']['cardinality/%s' % a.param] = (
+                        len(self.distinct[a.param]))
+                else:
+                    stats_args['aggregate'][a.func] = values[a.func]
+                    if a.func != 'stddev':
+                        stats_args[a.func] = values[a.func]
+        else:
+            stats_args = dict((k, values[k])
+                              for k in ('min', 'max', 'sum', 'count', 'avg'))
+        return models.Statistics(
+            unit=self.unit,
+            period=period,
+            period_start=period_start,
+            period_end=period_end,
+            duration=timeutils.delta_seconds(self.duration_start,
+                                             self.duration_end),
+            duration_start=self.duration_start,
+            duration_end=self.duration_end,
+            groupby=groupby,
+            **stats_args)
@@ -146,7 +146,7 @@ class Connection(pymongo_base.Connection):
         # requires a new storage connection.
         self.conn = self.CONNECTION_POOL.connect(url)
         self.version = self.conn.server_info()['versionArray']
-        # Require MongoDB 2.4 to use $setOnInsert
+        # Require MongoDB 2.6 to use $min and $max
         if self.version < pymongo_utils.MINIMUM_COMPATIBLE_MONGODB_VERSION:
             raise storage.StorageBadVersion(
                 "Need at least MongoDB %s" %
@@ -247,64 +247,75 @@ class Connection(pymongo_base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
-        # Record the updated resource metadata - we use $setOnInsert to
-        # unconditionally insert sample timestamps and resource metadata
-        # (in the update case, this must be conditional on the sample not
-        # being out-of-order)
-        data = copy.deepcopy(data)
-        data['resource_metadata'] = pymongo_utils.improve_keys(
-            data.pop('resource_metadata'))
-        resource = self.db.resource.find_one_and_update(
-            {'_id': data['resource_id']},
-            {'$set': {'project_id': data['project_id'],
-                      'user_id': data['user_id'],
-                      'source': data['source'],
-                      },
-             '$setOnInsert': {'metadata': data['resource_metadata'],
-                              'first_sample_timestamp': data['timestamp'],
-                              'last_sample_timestamp': data['timestamp'],
-                              },
-             '$addToSet': {'meter': {'counter_name': data['counter_name'],
-                                     'counter_type': data['counter_type'],
-                                     'counter_unit': data['counter_unit'],
-                                     },
-                           },
-             },
-            upsert=True,
-            return_document=pymongo.ReturnDocument.AFTER,
-        )
-
-        # only update last sample timestamp if actually later (the usual
-        # in-order case)
-        last_sample_timestamp = resource.get('last_sample_timestamp')
-        if (last_sample_timestamp is None or
-                last_sample_timestamp <= data['timestamp']):
-            self.db.resource.update_one(
-                {'_id': data['resource_id']},
-                {'$set': {'metadata': data['resource_metadata'],
-                          'last_sample_timestamp': data['timestamp']}}
-            )
-
-        # only update first sample timestamp if actually earlier (the unusual
-        # out-of-order case)
-        # NOTE: a null first sample timestamp is not updated as this indicates
-        # a pre-existing resource document dating from before we started
-        # recording these timestamps in the resource collection
-        first_sample_timestamp = resource.get('first_sample_timestamp')
-        if (first_sample_timestamp is not None and
-                first_sample_timestamp > data['timestamp']):
-            self.db.resource.update_one(
-                {'_id': data['resource_id']},
-                {'$set': {'first_sample_timestamp': data['timestamp']}}
-            )
-
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.copy(data)
-        record['recorded_at'] = timeutils.utcnow()
-
-        self.db.meter.insert_one(record)
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        All the samples of a resource are collapsed into a single upsert of
+        its document and the raw samples are inserted unordered, so a batch
+        costs two round trips whatever its size.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        resources = {}
+        records = []
+        recorded_at = timeutils.utcnow()
+        for data in samples:
+            # Record the raw data for the meter. Use a copy so we do not
+            # modify a data structure owned by our caller (the driver adds
+            # a new key '_id' and improves the metadata keys in place).
+            record = dict(data)
+            record['resource_metadata'] = pymongo_utils.improve_keys(
+                copy.deepcopy(data['resource_metadata']))
+            record['recorded_at'] = recorded_at
+            records.append(record)
+
+            res = resources.get(data['resource_id'])
+            if res is None:
+                res = resources[data['resource_id']] = {
+                    'first': record, 'last': record, 'meters': []}
+            elif record['timestamp'] < res['first']['timestamp']:
+                res['first'] = record
+            elif record['timestamp'] >= res['last']['timestamp']:
+                res['last'] = record
+            meter = {'counter_name': data['counter_name'],
+                     'counter_type': data['counter_type'],
+                     'counter_unit': data['counter_unit']}
+            if meter not in res['meters']:
+                res['meters'].append(meter)
+
+        requests = []
+        for resource_id, res in six.iteritems(resources):
+            last = res['last']
+            # $min/$max only move the sample timestamps if the batch holds
+            # earlier/later samples than the ones already recorded.
+            # NOTE: a null first sample timestamp sorts before any date and
+            # is kept as it indicates a pre-existing resource document dating
+            # from before we started recording these timestamps.
+            requests.append(pymongo.UpdateOne(
+                {'_id': resource_id},
+                {'$set': {'project_id': last['project_id'],
+                          'user_id': last['user_id'],
+                          'source': last['source']},
+                 '$min': {'first_sample_timestamp':
+                          res['first']['timestamp']},
+                 '$max': {'last_sample_timestamp': last['timestamp']},
+                 '$addToSet': {'meter': {'$each': res['meters']}}},
+                upsert=True))
+            # only update the metadata if the newest sample of the batch is
+            # also the newest of the resource (the usual in-order case)
+            requests.append(pymongo.UpdateOne(
+                {'_id': resource_id,
+                 'last_sample_timestamp': {'$lte': last['timestamp']}},
+                {'$set': {'metadata': last['resource_metadata']}}))
+
+        self.db.resource.bulk_write(requests, ordered=True)
+        self.db.meter.insert_many(records, ordered=False)
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
@@ -616,7 +627,7 @@ class Connection(pymongo_base.Connection):
 
         # results is dict in pymongo<=2.6.3 and CommandCursor in >=3.0
         results = self.db.meter.aggregate(aggregation_query,
-                                          **self._make_aggregation_params())
+                                          allowDiskUse=True)
         return [self._stats_result_to_model(point, groupby, aggregate,
                                             period, first_timestamp)
                 for point in self._get_results(results)]
@@ -695,8 +706,3 @@ class Connection(pymongo_base.Connection):
             return results.get('result', [])
         else:
             return results
-
-    def _make_aggregation_params(self):
-        if self.version >= pymongo_utils.COMPLETE_AGGREGATE_COMPATIBLE_VERSION:
-            return {"allowDiskUse": True}
-        return {}
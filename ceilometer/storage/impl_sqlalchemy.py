@@ -14,8 +14,11 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import calendar
+import copy
 import datetime
 import hashlib
+import math
 import os
 
 from oslo_config import cfg
@@ -44,6 +47,8 @@ from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Number of rows fetched at once when streaming the resource listing.
+RESOURCE_FETCH_SIZE = 1000
 
 STANDARD_AGGREGATES = dict(
     avg=func.avg(models.Sample.volume).label('avg'),
@@ -97,6 +102,10 @@ AVAILABLE_STORAGE_CAPABILITIES = {
 }
 
 
+class RollupConflict(Exception):
+    """A rollup read by a writer was removed by a concurrent rebuild."""
+
+
 def apply_metaquery_filter(session, query, metaquery):
     """Apply provided metaquery filter to existing query.
 
@@ -208,6 +217,26 @@ class Connection(base.Connection):
               message_signature: message signature
               message_id: message uuid
               }
+        - sample_rollup
+          - the samples aggregated per meter, resource and period, only
+            maintained for the sql_rollup_granularities
+          - { granularity: period length in seconds
+              meter_id: meter id            (->meter.id)
+              resource_id: resource id      (->resource.internal_id)
+              timestamp: period start
+              first_timestamp: datetime of the oldest sample
+              last_timestamp: datetime of the newest sample
+              count: number of samples
+              sum: sum of the sample volumes
+              min: minimum sample volume
+              max: maximum sample volume
+              }
+        - sample_rollup_build
+          - the granularities whose rollups were built from the samples,
+            only they are read
+          - { granularity: period length in seconds
+              built_until: end of the periods the rollups are complete for
+              }
     """
     CAPABILITIES = utils.update_nested(base.Connection.CAPABILITIES,
                                        AVAILABLE_CAPABILITIES)
@@ -216,6 +245,10 @@ class Connection(base.Connection):
         AVAILABLE_STORAGE_CAPABILITIES,
     )
 
+    # Number of periods of samples aggregated at once when rebuilding the
+    # rollups.
+    ROLLUP_REBUILD_PERIODS = 1000
+
     def __init__(self, url):
         # Set max_retries to 0, since oslo.db in certain cases may attempt
         # to retry making the db connection retried max_retries ^ 2 times
@@ -224,23 +257,52 @@ class Connection(base.Connection):
         options = dict(cfg.CONF.database.items())
         options['max_retries'] = 0
         self._engine_facade = db_session.EngineFacade(url, **options)
+        # NOTE: process local caches of the meter and resource ids used on
+        # the write path, see _record_samples.
+        cache_size = cfg.CONF.database.sql_id_cache_size
+        self._meter_cache = utils.LRUCache(cache_size)
+        self._resource_cache = utils.LRUCache(cache_size)
+        # NOTE: coarsest granularities first, see _split_rollup_range.
+        self._rollup_granularities = sorted(
+            set(int(g) for g in cfg.CONF.database.sql_rollup_granularities),
+            reverse=True)
 
     def upgrade(self):
         # NOTE(gordc): to minimise memory, only import migration when needed
         from oslo_db.sqlalchemy import migration
         path = os.path.join(os.path.abspath(os.path.dirname(__file__)),
                             'sqlalchemy', 'migrate_repo')
-        migration.db_sync(self._engine_facade.get_engine(), path)
+        engine = self._engine_facade.get_engine()
+        migration.db_sync(engine, path)
+
+        # Only build the rollups of the granularities added since they were
+        # last built and bring the others up to date, see rebuild_rollups
+        # to compute them all again.
+        with engine.begin() as conn:
+            self._delete_unused_rollups(conn)
+        built = self._built_rollups()
+        for granularity in self._rollup_granularities:
+            if granularity in built:
+                self._catch_up_rollups(granularity, built[granularity])
+            else:
+                self._build_rollups(granularity)
+
+    def rebuild_rollups(self):
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            self._delete_unused_rollups(conn)
+        for granularity in self._rollup_granularities:
+            self._build_rollups(granularity)
 
     def clear(self):
         engine = self._engine_facade.get_engine()
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
         engine.dispose()
+        self._clear_id_caches()
 
     @staticmethod
     def _create_meter(conn, name, type, unit):
-        # TODO(gordc): implement lru_cache to improve performance
         try:
             meter = models.Meter.__table__
             trans = conn.begin_nested()
@@ -263,16 +325,20 @@ class Connection(base.Connection):
 
         return meter_id
 
+    @staticmethod
+    def _metadata_hash(rmeta):
+        m_hash = jsonutils.dumps(rmeta, sort_keys=True)
+        if six.PY3:
+            m_hash = m_hash.encode('utf-8')
+        return hashlib.md5(m_hash).hexdigest()
+
     @staticmethod
     def _create_resource(conn, res_id, user_id, project_id, source_id,
-                         rmeta):
-        # TODO(gordc): implement lru_cache to improve performance
+                         rmeta, m_hash=None):
         try:
             res = models.Resource.__table__
-            m_hash = jsonutils.dumps(rmeta, sort_keys=True)
-            if six.PY3:
-                m_hash = m_hash.encode('utf-8')
-            m_hash = hashlib.md5(m_hash).hexdigest()
+            if m_hash is None:
+                m_hash = Connection._metadata_hash(rmeta)
             trans = conn.begin_nested()
             if conn.dialect.name == 'sqlite':
                 trans = conn.begin()
@@ -313,39 +379,459 @@ class Connection(base.Connection):
         except dbexc.DBDuplicateEntry:
             # retry function to pick up duplicate committed object
             internal_id = Connection._create_resource(
-                conn, res_id, user_id, project_id, source_id, rmeta)
+                conn, res_id, user_id, project_id, source_id, rmeta, m_hash)
 
         return internal_id
 
-    @api.wrap_db_retry(retry_interval=cfg.CONF.database.retry_interval,
-                       max_retries=cfg.CONF.database.max_retries,
-                       retry_on_deadlock=True)
-    def record_metering_data(self, data):
-        """Write the data to the backend storage system.
+    def _resolve_meters(self, conn, meter_keys):
+        """Return a dict mapping (name, type, unit) keys to meter ids.
 
-        :param data: a dictionary such as returned by
-                     ceilometer.meter.meter_message_from_counter
+        Cached ids are used first, the remaining meters are looked up with a
+        single query and only the missing ones are created.
+        """
+        meter_ids = {}
+        for key in meter_keys:
+            meter_id = self._meter_cache.get(key)
+            if meter_id is not None:
+                meter_ids[key] = meter_id
+        missing = set(meter_keys) - set(meter_ids)
+        if not missing:
+            return meter_ids
+
+        meter = models.Meter.__table__
+        rows = conn.execute(
+            sa.select([meter.c.id, meter.c.name, meter.c.type, meter.c.unit])
+            .where(meter.c.name.in_(set(k[0] for k in missing))))
+        for row in rows:
+            key = (row.name, row.type, row.unit)
+            if key in missing:
+                meter_ids[key] = row.id
+        for key in missing:
+            if key not in meter_ids:
+                meter_ids[key] = self._create_meter(conn, *key)
+        return meter_ids
+
+    def _resolve_resources(self, conn, resources):
+        """Return a dict mapping resource keys to resource internal ids.
+
+        :param resources: dict of (resource_id, user_id, project_id,
+                          source_id, metadata_hash) keys to the resource
+                          metadata
         """
+        internal_ids = {}
+        for key in resources:
+            internal_id = self._resource_cache.get(key)
+            if internal_id is not None:
+                internal_ids[key] = internal_id
+
+        missing = set(resources) - set(internal_ids)
+        if not missing:
+            return internal_ids
+
+        res = models.Resource.__table__
+        rows = conn.execute(
+            sa.select([res.c.internal_id, res.c.resource_id, res.c.user_id,
+                       res.c.project_id, res.c.source_id,
+                       res.c.metadata_hash])
+            .where(sa.and_(
+                res.c.resource_id.in_(set(k[0] for k in missing)),
+                res.c.metadata_hash.in_(set(k[4] for k in missing)))))
+        for row in rows:
+            key = (row.resource_id, row.user_id, row.project_id,
+                   row.source_id, row.metadata_hash)
+            if key in missing:
+                internal_ids[key] = row.internal_id
+        for key in missing:
+            if key not in internal_ids:
+                res_id, user_id, project_id, source_id, m_hash = key
+                internal_ids[key] = self._create_resource(
+                    conn, res_id, user_id, project_id, source_id,
+                    resources[key], m_hash)
+        return internal_ids
+
+    def _clear_id_caches(self):
+        self._meter_cache.clear()
+        self._resource_cache.clear()
+
+    def _record_samples(self, samples):
+        meter_keys = []
+        res_keys = []
+        resources = {}
+        for data in samples:
+            meter_keys.append((data['counter_name'],
+                               data['counter_type'],
+                               data['counter_unit']))
+            res_key = (data['resource_id'], data['user_id'],
+                       data['project_id'], data['source'],
+                       self._metadata_hash(data['resource_metadata']))
+            res_keys.append(res_key)
+            resources.setdefault(res_key, data['resource_metadata'])
+
+        try:
+            meter_ids, res_ids = self._insert_samples(
+                samples, meter_keys, res_keys, resources)
+        except dbexc.DBReferenceError:
+            # NOTE: a cached meter or resource may have been removed by the
+            # expirer, possibly running in another process. Forget about the
+            # cached ids and resolve them again from the database.
+            LOG.debug('Stale meter or resource id cached, retrying')
+            self._clear_id_caches()
+            meter_ids, res_ids = self._insert_samples(
+                samples, meter_keys, res_keys, resources)
+        except (dbexc.DBDuplicateEntry, RollupConflict):
+            # NOTE: another writer or a rebuild created or removed one of the
+            # rollups of the batch concurrently. The whole transaction has
+            # been rolled back, so write it again against the current ones.
+            LOG.debug('Concurrent rollup update, retrying')
+            meter_ids, res_ids = self._insert_samples(
+                samples, meter_keys, res_keys, resources)
+
+        # NOTE: ids are only cached once the transaction which may have
+        # created them is committed.
+        for key, meter_id in six.iteritems(meter_ids):
+            self._meter_cache[key] = meter_id
+        for key, internal_id in six.iteritems(res_ids):
+            self._resource_cache[key] = internal_id
+
+    def _insert_samples(self, samples, meter_keys, res_keys, resources):
         engine = self._engine_facade.get_engine()
         with engine.begin() as conn:
-            # Record the raw data for the sample.
-            m_id = self._create_meter(conn,
-                                      data['counter_name'],
-                                      data['counter_type'],
-                                      data['counter_unit'])
-            res_id = self._create_resource(conn,
-                                           data['resource_id'],
-                                           data['user_id'],
-                                           data['project_id'],
-                                           data['source'],
-                                           data['resource_metadata'])
+            meter_ids = self._resolve_meters(conn, set(meter_keys))
+            res_ids = self._resolve_resources(conn, resources)
             sample = models.Sample.__table__
-            conn.execute(sample.insert(), meter_id=m_id,
-                         resource_id=res_id,
+            rows = [dict(meter_id=meter_ids[m_key],
+                         resource_id=res_ids[r_key],
                          timestamp=data['timestamp'],
                          volume=data['counter_volume'],
                          message_signature=data['message_signature'],
                          message_id=data['message_id'])
+                    for data, m_key, r_key in zip(samples, meter_keys,
+                                                  res_keys)]
+            conn.execute(sample.insert(), rows)
+            if self._rollup_granularities:
+                rollups = {}
+                for row in rows:
+                    self._accumulate_rollups(
+                        rollups, self._rollup_granularities,
+                        row['meter_id'], row['resource_id'],
+                        row['timestamp'], row['volume'])
+                self._store_rollups(conn, rollups)
+        return meter_ids, res_ids
+
+    @staticmethod
+    def _rollup_floor(timestamp, granularity):
+        """Return the start of the rollup period holding a timestamp."""
+        seconds = calendar.timegm(timestamp.utctimetuple())
+        return timestamp - datetime.timedelta(
+            seconds=seconds % granularity,
+            microseconds=timestamp.microsecond)
+
+    @staticmethod
+    def _rollup_ceil(timestamp, granularity):
+        """Return the start of the first rollup period after a timestamp."""
+        start = Connection._rollup_floor(timestamp, granularity)
+        if start == timestamp:
+            return start
+        return start + datetime.timedelta(seconds=granularity)
+
+    @staticmethod
+    def _accumulate_rollups(rollups, granularities, meter_id, resource_id,
+                            timestamp, volume):
+        """Add a sample to the rollups of each granularity.
+
+        :param rollups: dict of (granularity, meter_id, resource_id,
+                        period start) keys to the rollup values
+        """
+        if volume is None:
+            return
+        for granularity in granularities:
+            key = (granularity, meter_id, resource_id,
+                   Connection._rollup_floor(timestamp, granularity))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = dict(first_timestamp=timestamp,
+                                    last_timestamp=timestamp,
+                                    count=1, sum=volume,
+                                    min=volume, max=volume)
+            else:
+                rollup['first_timestamp'] = min(rollup['first_timestamp'],
+                                                timestamp)
+                rollup['last_timestamp'] = max(rollup['last_timestamp'],
+                                               timestamp)
+                rollup['count'] += 1
+                rollup['sum'] += volume
+                rollup['min'] = min(rollup['min'], volume)
+                rollup['max'] = max(rollup['max'], volume)
+
+    @staticmethod
+    def _rollup_rows(rollups):
+        return [dict(granularity=key[0], meter_id=key[1],
+                     resource_id=key[2], timestamp=key[3], **rollup)
+                for key, rollup in six.iteritems(rollups)]
+
+    @staticmethod
+    def _store_rollups(conn, rollups):
+        """Merge rollups into the existing ones or insert them."""
+        if not rollups:
+            return
+        table = models.SampleRollup.__table__
+        existing = Connection._existing_rollups(conn, rollups)
+
+        updates = [dict(('b_%s' % k, v) for k, v in six.iteritems(row))
+                   for row in Connection._rollup_rows(
+                       dict((k, v) for k, v in six.iteritems(rollups)
+                            if k in existing))]
+        if updates:
+            ts_type = models.PreciseTimestamp()
+            first = sa.bindparam('b_first_timestamp', type_=ts_type)
+            last = sa.bindparam('b_last_timestamp', type_=ts_type)
+            vmin = sa.bindparam('b_min')
+            vmax = sa.bindparam('b_max')
+            update = (
+                table.update()
+                .where(sa.and_(
+                    table.c.granularity == sa.bindparam('b_granularity'),
+                    table.c.meter_id == sa.bindparam('b_meter_id'),
+                    table.c.resource_id == sa.bindparam('b_resource_id'),
+                    table.c.timestamp == sa.bindparam('b_timestamp')))
+                .values(
+                    first_timestamp=sa.case(
+                        [(table.c.first_timestamp <= first,
+                          table.c.first_timestamp)], else_=first),
+                    last_timestamp=sa.case(
+                        [(table.c.last_timestamp >= last,
+                          table.c.last_timestamp)], else_=last),
+                    count=table.c.count + sa.bindparam('b_count'),
+                    sum=table.c.sum + sa.bindparam('b_sum'),
+                    min=sa.case([(table.c.min <= vmin, table.c.min)],
+                                else_=vmin),
+                    max=sa.case([(table.c.max >= vmax, table.c.max)],
+                                else_=vmax)))
+            if conn.dialect.supports_sane_multi_rowcount:
+                updated = conn.execute(update, updates).rowcount
+            else:
+                updated = sum(conn.execute(update, row).rowcount
+                              for row in updates)
+            if updated != len(updates):
+                # NOTE: a rebuild removed some of the rollups since they were
+                # read, without the samples of this uncommitted transaction.
+                raise RollupConflict()
+
+        inserts = Connection._rollup_rows(
+            dict((k, v) for k, v in six.iteritems(rollups)
+                 if k not in existing))
+        if inserts:
+            conn.execute(table.insert(), inserts)
+
+    @staticmethod
+    def _existing_rollups(conn, rollups):
+        """Return the keys of the rollups already stored."""
+        table = models.SampleRollup.__table__
+        return set(
+            tuple(row) for row in conn.execute(
+                sa.select([table.c.granularity, table.c.meter_id,
+                           table.c.resource_id, table.c.timestamp])
+                .where(sa.and_(
+                    table.c.meter_id.in_(set(k[1] for k in rollups)),
+                    table.c.resource_id.in_(set(k[2] for k in rollups)),
+                    table.c.timestamp.in_(set(k[3] for k in rollups))))))
+
+    def _delete_unused_rollups(self, conn):
+        """Remove the rollups of granularities not maintained anymore."""
+        for table in (models.SampleRollupBuild.__table__,
+                      models.SampleRollup.__table__):
+            delete = table.delete()
+            if self._rollup_granularities:
+                delete = delete.where(
+                    ~table.c.granularity.in_(self._rollup_granularities))
+            conn.execute(delete)
+
+    def _built_rollups(self):
+        """Return a dict of the built granularities to their built_until."""
+        table = models.SampleRollupBuild.__table__
+        rows = self._engine_facade.get_engine().execute(
+            sa.select([table.c.granularity, table.c.built_until]))
+        return dict((row.granularity, row.built_until) for row in rows)
+
+    def _build_rollups(self, granularity):
+        """Compute the rollups of a granularity from the samples.
+
+        The granularity is not read until its build is recorded. Rollups are
+        built up to the current period, which writers without the granularity
+        configured yet may still be filling, and _catch_up_rollups later
+        builds the periods ended meanwhile.
+        """
+        table = models.SampleRollupBuild.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            conn.execute(table.delete().where(
+                table.c.granularity == granularity))
+        built_until = self._rollup_floor(timeutils.utcnow(), granularity)
+        self._rebuild_rollups(granularity, end=built_until)
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), granularity=granularity,
+                             built_until=built_until)
+        except dbexc.DBDuplicateEntry:
+            # another process built the same granularity concurrently
+            pass
+
+    def _catch_up_rollups(self, granularity, built_until):
+        """Build the rollups of the periods ended since the last build.
+
+        :return: the new end of the build.
+        """
+        end = self._rollup_floor(timeutils.utcnow(), granularity)
+        if built_until >= end:
+            return built_until
+        self._rebuild_rollups(granularity, built_until, end)
+        table = models.SampleRollupBuild.__table__
+        with self._engine_facade.get_engine().begin() as conn:
+            conn.execute(table.update()
+                         .where(sa.and_(table.c.granularity == granularity,
+                                        table.c.built_until < end))
+                         .values(built_until=end))
+        return end
+
+    def _rebuild_rollups(self, granularity, start=None, end=None):
+        """Compute again the rollups of a granularity from the samples.
+
+        The range is rebuilt ROLLUP_REBUILD_PERIODS periods at a time, each
+        in its own transaction, so that a large history is neither locked
+        nor held in a single transaction. Writers keep merging the samples
+        they record into the rollups meanwhile: one merging into a rollup
+        removed by the rebuild is retried, see _store_rollups, and a window
+        conflicting with a rollup created by a writer is rebuilt again.
+
+        :param start: Optional start of the rebuilt range, aligned on the
+                      granularity.
+        :param end: Optional end of the rebuilt range, aligned on the
+                    granularity.
+        """
+        table = models.SampleRollup.__table__
+        sample = models.Sample.__table__
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            query = sa.select([func.min(sample.c.timestamp),
+                               func.max(sample.c.timestamp)])
+            delete = table.delete().where(table.c.granularity == granularity)
+            if start is not None:
+                query = query.where(sample.c.timestamp >= start)
+                delete = delete.where(table.c.timestamp >= start)
+            if end is not None:
+                query = query.where(sample.c.timestamp < end)
+                delete = delete.where(table.c.timestamp < end)
+            tsmin, tsmax = conn.execute(query).first()
+            if tsmin is not None:
+                start = self._rollup_floor(tsmin, granularity)
+                end = self._rollup_floor(tsmax, granularity) + (
+                    datetime.timedelta(seconds=granularity))
+                delete = delete.where(sa.or_(table.c.timestamp < start,
+                                             table.c.timestamp >= end))
+            # Drop the rollups of the periods without samples
+            conn.execute(delete)
+        if tsmin is None:
+            return
+
+        # Aggregate the samples a bounded number of periods at a time
+        window = datetime.timedelta(
+            seconds=granularity * self.ROLLUP_REBUILD_PERIODS)
+        dialect = engine.dialect.name
+        while start < end:
+            stop = min(start + window, end)
+            try:
+                self._rebuild_rollups_chunk(engine, dialect, granularity,
+                                            start, stop)
+            except dbexc.DBDuplicateEntry:
+                LOG.debug('Concurrent rollup creation, rebuilding again')
+                self._rebuild_rollups_chunk(engine, dialect, granularity,
+                                            start, stop)
+            start = stop
+
+    def _rebuild_rollups_chunk(self, engine, dialect, granularity, start,
+                               stop):
+        """Replace the rollups of [start, stop) in one transaction."""
+        table = models.SampleRollup.__table__
+        with engine.begin() as conn:
+            conn.execute(table.delete().where(sa.and_(
+                table.c.granularity == granularity,
+                table.c.timestamp >= start,
+                table.c.timestamp < stop)))
+            self._rebuild_rollups_window(conn, dialect, granularity,
+                                         start, stop)
+
+    def _rebuild_rollups_window(self, conn, dialect, granularity, start,
+                                stop):
+        """Insert the rollups of the samples of [start, stop)."""
+        table = models.SampleRollup.__table__
+        sample = models.Sample.__table__
+        in_window = sa.and_(sample.c.timestamp >= start,
+                            sample.c.timestamp < stop)
+        period_index = self._period_index(dialect, start, granularity)
+        if period_index is None:
+            rollups = {}
+            for row in conn.execute(
+                    sa.select([sample.c.meter_id, sample.c.resource_id,
+                               sample.c.timestamp, sample.c.volume])
+                    .where(in_window)):
+                self._accumulate_rollups(
+                    rollups, [granularity], row.meter_id,
+                    row.resource_id, row.timestamp, row.volume)
+            rows = self._rollup_rows(rollups)
+        else:
+            index_col = sa.literal_column('period_index')
+            query = (
+                sa.select([
+                    sample.c.meter_id, sample.c.resource_id,
+                    period_index.label('period_index'),
+                    func.min(sample.c.timestamp).label('first_timestamp'),
+                    func.max(sample.c.timestamp).label('last_timestamp'),
+                    func.count(sample.c.volume).label('count'),
+                    func.sum(sample.c.volume).label('sum'),
+                    func.min(sample.c.volume).label('min'),
+                    func.max(sample.c.volume).label('max')])
+                .where(in_window)
+                .where(sample.c.volume.isnot(None))
+                .group_by(sample.c.meter_id, sample.c.resource_id,
+                          index_col))
+            rows = [dict(granularity=granularity,
+                         meter_id=r.meter_id,
+                         resource_id=r.resource_id,
+                         timestamp=start + datetime.timedelta(
+                             seconds=int(r.period_index) * granularity),
+                         first_timestamp=r.first_timestamp,
+                         last_timestamp=r.last_timestamp,
+                         count=int(r.count), sum=r.sum,
+                         min=r.min, max=r.max)
+                    for r in conn.execute(query)]
+        if rows:
+            conn.execute(table.insert(), rows)
+
+    @api.wrap_db_retry(retry_interval=cfg.CONF.database.retry_interval,
+                       max_retries=cfg.CONF.database.max_retries,
+                       retry_on_deadlock=True)
+    def record_metering_data(self, data):
+        """Write the data to the backend storage system.
+
+        :param data: a dictionary such as returned by
+                     ceilometer.meter.meter_message_from_counter
+        """
+        self._record_samples([data])
+
+    @api.wrap_db_retry(retry_interval=cfg.CONF.database.retry_interval,
+                       max_retries=cfg.CONF.database.max_retries,
+                       retry_on_deadlock=True)
+    def record_metering_data_batch(self, samples):
+        """Write a batch of samples to the backend storage system.
+
+        Meters and resources of the whole batch are resolved with set-based
+        queries and all the sample rows are written with one executemany.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if samples:
+            self._record_samples(samples)
 
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
@@ -363,6 +849,23 @@ class Connection(base.Connection):
             rows = sample_q.delete()
             LOG.info(_LI("%d samples removed from database"), rows)
 
+        # Drop the rollups of expired periods and compute again the ones
+        # still holding samples which have not expired.
+        with self._engine_facade.get_engine().begin() as conn:
+            table = models.SampleRollup.__table__
+            self._delete_unused_rollups(conn)
+            for granularity in self._rollup_granularities:
+                conn.execute(table.delete().where(sa.and_(
+                    table.c.granularity == granularity,
+                    table.c.timestamp < self._rollup_floor(end,
+                                                           granularity))))
+        for granularity in self._rollup_granularities:
+            period_start = self._rollup_floor(end, granularity)
+            if period_start != end:
+                self._rebuild_rollups(
+                    granularity, period_start,
+                    period_start + datetime.timedelta(seconds=granularity))
+
         if not cfg.CONF.sql_expire_samples_only:
             with session.begin():
                 # remove Meter definitions with no matching samples
@@ -370,22 +873,23 @@ class Connection(base.Connection):
                  .filter(~models.Meter.samples.any())
                  .delete(synchronize_session=False))
 
-            with session.begin():
-                resource_q = (session.query(models.Resource.internal_id)
-                              .filter(~models.Resource.samples.any()))
-                # mark resource with no matching samples for delete
-                resource_q.update({models.Resource.metadata_hash: "delete_"
-                                  + cast(models.Resource.internal_id,
-                                         sa.String)},
-                                  synchronize_session=False)
+            # Forget about the cached ids before marking the resources, so
+            # that the writers of this process do not attach new samples to
+            # a resource about to be deleted.
+            self._clear_id_caches()
+            self._mark_unused_resources(session)
 
+            # NOTE: a writer, possibly of another process, may still have
+            # attached a sample to a resource after it was marked, only
+            # delete the ones left without samples.
             # remove metadata of resources marked for delete
             for table in [models.MetaText, models.MetaBigInt,
                           models.MetaFloat, models.MetaBool]:
                 with session.begin():
                     resource_q = (session.query(models.Resource.internal_id)
                                   .filter(models.Resource.metadata_hash
-                                          .like('delete_%')))
+                                          .like('delete_%'))
+                                  .filter(~models.Resource.samples.any()))
                     resource_subq = resource_q.subquery()
                     (session.query(table)
                      .filter(table.id.in_(resource_subq))
@@ -395,11 +899,54 @@ class Connection(base.Connection):
             with session.begin():
                 resource_q = (session.query(models.Resource.internal_id)
                               .filter(models.Resource.metadata_hash
-                                      .like('delete_%')))
+                                      .like('delete_%'))
+                              .filter(~models.Resource.samples.any()))
                 resource_q.delete(synchronize_session=False)
+            self._unmark_used_resources(session)
+            self._clear_id_caches()
             LOG.info(_LI("Expired residual resource and"
                          " meter definition data"))
 
+    @staticmethod
+    def _mark_unused_resources(session):
+        with session.begin():
+            resource_q = (session.query(models.Resource.internal_id)
+                          .filter(~models.Resource.samples.any()))
+            # mark resource with no matching samples for delete
+            resource_q.update({models.Resource.metadata_hash: "delete_"
+                              + cast(models.Resource.internal_id,
+                                     sa.String)},
+                              synchronize_session=False)
+
+    def _unmark_used_resources(self, session):
+        """Restore the hash of marked resources which got samples.
+
+        Writers holding the id of a resource in their cache attach samples
+        to it even once it is marked. The resource is live again unless a
+        writer resolving it has already created a duplicate, it then keeps
+        its marker and is deleted once its samples have expired.
+        """
+        with session.begin():
+            resource_q = (session.query(models.Resource)
+                          .filter(models.Resource.metadata_hash
+                                  .like('delete_%'))
+                          .filter(models.Resource.samples.any()))
+            for resource in resource_q:
+                m_hash = self._metadata_hash(resource.resource_metadata)
+                duplicate_q = (session.query(models.Resource.internal_id)
+                               .filter(models.Resource.resource_id ==
+                                       resource.resource_id)
+                               .filter(models.Resource.user_id ==
+                                       resource.user_id)
+                               .filter(models.Resource.project_id ==
+                                       resource.project_id)
+                               .filter(models.Resource.source_id ==
+                                       resource.source_id)
+                               .filter(models.Resource.metadata_hash ==
+                                       m_hash))
+                if not session.query(duplicate_q.exists()).scalar():
+                    resource.metadata_hash = m_hash
+
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, start_timestamp_op=None,
                       end_timestamp=None, end_timestamp_op=None,
@@ -430,60 +977,67 @@ class Connection(base.Connection):
                                         resource=resource)
 
         session = self._engine_facade.get_session()
-        # get list of resource_ids
-        has_timestamp = start_timestamp or end_timestamp
-        # NOTE: When sql_expire_samples_only is enabled, there will be some
-        #       resources without any sample, in such case we should use inner
-        #       join on sample table to avoid wrong result.
-        if cfg.CONF.sql_expire_samples_only or has_timestamp:
-            res_q = session.query(distinct(models.Resource.resource_id)).join(
-                models.Sample,
-                models.Sample.resource_id == models.Resource.internal_id)
-        else:
-            res_q = session.query(distinct(models.Resource.resource_id))
-        res_q = make_query_from_filter(session, res_q, s_filter,
-                                       require_meter=False)
-        res_q = res_q.limit(limit) if limit else res_q
-        for res_id in res_q.all():
-
-            # get max and min sample timestamp value
-            min_max_q = (session.query(func.max(models.Sample.timestamp)
-                                       .label('max_timestamp'),
-                                       func.min(models.Sample.timestamp)
-                                       .label('min_timestamp'))
-                                .join(models.Resource,
-                                      models.Resource.internal_id ==
-                                      models.Sample.resource_id)
-                                .filter(models.Resource.resource_id ==
-                                        res_id[0]))
-
-            min_max_q = make_query_from_filter(session, min_max_q, s_filter,
-                                               require_meter=False)
-
-            min_max = min_max_q.first()
-
-            # get resource details for latest sample
-            res_q = (session.query(models.Resource.resource_id,
-                                   models.Resource.user_id,
-                                   models.Resource.project_id,
-                                   models.Resource.source_id,
-                                   models.Resource.resource_metadata)
-                            .join(models.Sample,
-                                  models.Sample.resource_id ==
-                                  models.Resource.internal_id)
-                            .filter(models.Sample.timestamp ==
-                                    min_max.max_timestamp)
-                            .filter(models.Resource.resource_id ==
-                                    res_id[0])
-                            .order_by(models.Sample.id.desc()).limit(1))
-
-            res = res_q.first()
-
+        # NOTE: the resources are listed from their samples, so resources
+        #       left without any sample when sql_expire_samples_only is
+        #       enabled are skipped.
+        # get max and min sample timestamp value of each resource
+        min_max_q = (session.query(models.Resource.resource_id,
+                                   func.min(models.Sample.timestamp)
+                                   .label('min_timestamp'),
+                                   func.max(models.Sample.timestamp)
+                                   .label('max_timestamp'))
+                     .join(models.Sample,
+                           models.Sample.resource_id ==
+                           models.Resource.internal_id))
+        min_max_q = make_query_from_filter(session, min_max_q, s_filter,
+                                           require_meter=False)
+        min_max_q = min_max_q.group_by(models.Resource.resource_id)
+        min_max_q = min_max_q.limit(limit) if limit else min_max_q
+        min_max = min_max_q.subquery()
+
+        # get the latest sample of each resource
+        latest_q = (session.query(min_max.c.resource_id,
+                                  min_max.c.min_timestamp,
+                                  min_max.c.max_timestamp,
+                                  func.max(models.Sample.id)
+                                  .label('sample_id'))
+                    .join(models.Resource,
+                          models.Resource.resource_id ==
+                          min_max.c.resource_id)
+                    .join(models.Sample,
+                          and_(models.Sample.resource_id ==
+                               models.Resource.internal_id,
+                               models.Sample.timestamp ==
+                               min_max.c.max_timestamp))
+                    .group_by(min_max.c.resource_id,
+                              min_max.c.min_timestamp,
+                              min_max.c.max_timestamp))
+        latest = latest_q.subquery()
+
+        # get resource details for latest sample
+        res_q = (session.query(models.Resource.resource_id,
+                               models.Resource.user_id,
+                               models.Resource.project_id,
+                               models.Resource.source_id,
+                               models.Resource.resource_metadata,
+                               latest.c.min_timestamp,
+                               latest.c.max_timestamp)
+                 .select_from(latest)
+                 .join(models.Sample,
+                       models.Sample.id == latest.c.sample_id)
+                 .join(models.Resource,
+                       models.Resource.internal_id ==
+                       models.Sample.resource_id))
+        # NOTE: only columns are selected, so rows can be streamed from
+        #       the cursor without eager loads being cut between batches.
+        res_q = res_q.yield_per(RESOURCE_FETCH_SIZE)
+
+        for res in res_q:
             yield api_models.Resource(
                 resource_id=res.resource_id,
                 project_id=res.project_id,
-                first_sample_timestamp=min_max.min_timestamp,
-                last_sample_timestamp=min_max.max_timestamp,
+                first_sample_timestamp=res.min_timestamp,
+                last_sample_timestamp=res.max_timestamp,
                 source=res.source_id,
                 user_id=res.user_id,
                 metadata=res.resource_metadata
@@ -669,17 +1223,8 @@ class Connection(base.Connection):
 
         session = self._engine_facade.get_session()
 
-        if groupby:
-            group_attributes = []
-            for g in groupby:
-                if g != 'resource_metadata.instance_type':
-                    group_attributes.append(getattr(models.Resource, g))
-                else:
-                    group_attributes.append(
-                        getattr(models.MetaText, 'value')
-                        .label('resource_metadata.instance_type'))
-
-            select.extend(group_attributes)
+        group_attributes = self._group_attributes(groupby)
+        select.extend(group_attributes)
 
         query = (
             session.query(*select)
@@ -688,7 +1233,24 @@ class Connection(base.Connection):
             .join(models.Resource,
                   models.Resource.internal_id == models.Sample.resource_id)
             .group_by(models.Meter.unit))
+        query = self._group_query(query, groupby, group_attributes)
 
+        return make_query_from_filter(session, query, sample_filter)
+
+    @staticmethod
+    def _group_attributes(groupby):
+        group_attributes = []
+        for g in groupby or []:
+            if g != 'resource_metadata.instance_type':
+                group_attributes.append(getattr(models.Resource, g))
+            else:
+                group_attributes.append(
+                    getattr(models.MetaText, 'value')
+                    .label('resource_metadata.instance_type'))
+        return group_attributes
+
+    @staticmethod
+    def _group_query(query, groupby, group_attributes):
         if groupby:
             for g in groupby:
                 if g == 'resource_metadata.instance_type':
@@ -698,6 +1260,54 @@ class Connection(base.Connection):
                     query = query.filter(
                         models.MetaText.meta_key == 'instance_type')
             query = query.group_by(*group_attributes)
+        return query
+
+    def _make_rollup_stats_query(self, sample_filter, groupby, rollups,
+                                 period):
+        """Return the query of the statistics of rollup ranges.
+
+        :param sample_filter: SampleFilter without timestamps.
+        :param rollups: list of (granularity, start, end) ranges.
+        :param period: whether to group by rollup period too.
+        """
+        rollup = models.SampleRollup
+        select = [
+            func.min(rollup.first_timestamp).label('tsmin'),
+            func.max(rollup.last_timestamp).label('tsmax'),
+            models.Meter.unit,
+            func.sum(rollup.count).label('count'),
+            func.sum(rollup.sum).label('sum'),
+            func.min(rollup.min).label('min'),
+            func.max(rollup.max).label('max'),
+        ]
+
+        session = self._engine_facade.get_session()
+
+        group_attributes = self._group_attributes(groupby)
+        select.extend(group_attributes)
+        if period:
+            select.append(rollup.timestamp)
+
+        query = (
+            session.query(*select)
+            .join(models.Meter,
+                  models.Meter.id == rollup.meter_id)
+            .join(models.Resource,
+                  models.Resource.internal_id == rollup.resource_id)
+            .group_by(models.Meter.unit))
+        query = self._group_query(query, groupby, group_attributes)
+        if period:
+            query = query.group_by(rollup.timestamp)
+
+        ranges = []
+        for granularity, start, end in rollups:
+            conditions = [rollup.granularity == granularity]
+            if start is not None:
+                conditions.append(rollup.timestamp >= start)
+            if end is not None:
+                conditions.append(rollup.timestamp < end)
+            ranges.append(and_(*conditions))
+        query = query.filter(sa.or_(*ranges))
 
         return make_query_from_filter(session, query, sample_filter)
 
@@ -734,12 +1344,216 @@ class Connection(base.Connection):
             (g, getattr(result, g)) for g in groupby) if groupby else None)
         return api_models.Statistics(**stats_args)
 
+    @staticmethod
+    def _period_index(dialect, start, period):
+        """Return the SQL expression of the index of the period of a sample.
+
+        Periods of the given length are counted from start, so the index is
+        floor((timestamp - start) / period). None is returned for dialects
+        we do not know how to do date arithmetic with.
+        """
+        if dialect == 'mysql':
+            # NOTE: timestamps are stored as decimal seconds since the epoch
+            ts = sa.type_coerce(models.Sample.timestamp,
+                                sa.Numeric(20, 6, asdecimal=True))
+            return func.floor((ts - utils.dt_to_decimal(start)) / period)
+        if dialect == 'postgresql':
+            return func.floor(
+                sa.extract('epoch', models.Sample.timestamp - start) / period)
+        if dialect == 'sqlite':
+            # NOTE: SQLite has no floor(), so stick to integer arithmetic on
+            # microseconds since the epoch. Only samples later than start
+            # are selected, so the integer division is a floor. strftime()
+            # rounds to the millisecond, so it is only given the whole
+            # seconds of the stored 'YYYY-MM-DD HH:MM:SS.ffffff' text and
+            # the microseconds are read from it as they are.
+            ts = models.Sample.timestamp
+            ts_us = (cast(func.strftime('%s', func.substr(ts, 1, 19)),
+                          sa.Integer) * 1000000 +
+                     cast(func.substr(ts, 21, 6), sa.Integer))
+            start_us = int(utils.dt_to_decimal(start) * 1000000)
+            return (ts_us - start_us) / (period * 1000000)
+        return None
+
+    @staticmethod
+    def _split_rollup_range(lower, upper, granularities, rollups, raw):
+        """Cover [lower, upper) with whole rollup periods.
+
+        The coarsest granularity covers as much of the range as it can and
+        the edges are split again with the finer ones. What is left is
+        appended to raw and has to be computed from the samples.
+
+        :param lower: Start of the range, None if unbounded.
+        :param upper: End of the range, None if unbounded.
+        :param granularities: granularities, coarsest first.
+        :param rollups: list the (granularity, start, end) ranges are
+                        appended to.
+        :param raw: list the (start, end) ranges are appended to.
+        """
+        if lower is not None and upper is not None and lower >= upper:
+            return
+        for i, granularity in enumerate(granularities):
+            start = (None if lower is None
+                     else Connection._rollup_ceil(lower, granularity))
+            end = (None if upper is None
+                   else Connection._rollup_floor(upper, granularity))
+            if start is None or end is None or start < end:
+                rollups.append((granularity, start, end))
+                if start != lower:
+                    Connection._split_rollup_range(
+                        lower, start, granularities[i + 1:], rollups, raw)
+                if end != upper:
+                    Connection._split_rollup_range(
+                        end, upper, granularities[i + 1:], rollups, raw)
+                return
+        raw.append((lower, upper))
+
+    def _plan_rollup_statistics(self, sample_filter, period, aggregate):
+        """Return the rollup and raw ranges answering a statistics query.
+
+        None is returned when the rollups cannot be used, the statistics
+        have then to be computed from the samples only.
+        """
+        if not self._rollup_granularities or sample_filter.message_id:
+            return None
+        if aggregate and any(a.func not in STANDARD_AGGREGATES
+                             for a in aggregate):
+            return None
+
+        start = sample_filter.start_timestamp
+        end = sample_filter.end_timestamp
+        granularities = self._rollup_granularities
+        # Samples are selected in [lower, upper)
+        lower, upper = start, end
+        if start is not None and sample_filter.start_timestamp_op == 'gt':
+            lower = start + datetime.timedelta(microseconds=1)
+        if end is not None and sample_filter.end_timestamp_op == 'le':
+            upper = end + datetime.timedelta(microseconds=1)
+        if period:
+            # Periods boundaries have to be boundaries of the rollups
+            if start is None or end is None:
+                return None
+            granularities = [g for g in granularities
+                             if period % g == 0 and
+                             self._rollup_floor(start, g) == start]
+            periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                    / float(period)))
+            upper = min(upper, start + datetime.timedelta(
+                seconds=periods * period))
+
+        # NOTE: the rollups of a granularity are only complete once built
+        # from the samples, for the periods before the end of that build.
+        # The periods ended since are built first, whether or not the
+        # expirer runs.
+        built = self._built_rollups()
+        granularities = [g for g in granularities if g in built]
+        for g in granularities:
+            built[g] = self._catch_up_rollups(g, built[g])
+        if not granularities:
+            return None
+        built_until = min(built[g] for g in granularities)
+
+        rollups = []
+        raw = []
+        if lower is None or lower < built_until:
+            self._split_rollup_range(
+                lower, built_until if upper is None
+                else min(upper, built_until),
+                granularities, rollups, raw)
+        if not rollups:
+            return None
+        tail = built_until if lower is None else max(lower, built_until)
+        if period:
+            # The samples after the built rollups are read period by period
+            while tail < upper:
+                period_end = start + datetime.timedelta(seconds=period * (
+                    int(timeutils.delta_seconds(start, tail) // period) + 1))
+                raw.append((tail, min(upper, period_end)))
+                tail = period_end
+        elif upper is None or tail < upper:
+            raw.append((tail, upper))
+        return rollups, raw
+
+    def _get_rollup_statistics(self, sample_filter, period, groupby,
+                               aggregate, rollups, raw):
+        # Timestamps are handled by the rollup and raw ranges
+        range_filter = copy.copy(sample_filter)
+        range_filter.start_timestamp = None
+        range_filter.end_timestamp = None
+
+        results = {}
+
+        def add(index, r):
+            key = (index, r.unit,
+                   tuple(getattr(r, g) for g in groupby or []))
+            res = results.get(key)
+            if res is None:
+                results[key] = dict(tsmin=r.tsmin, tsmax=r.tsmax,
+                                    count=int(r.count), sum=r.sum,
+                                    min=r.min, max=r.max)
+            else:
+                res['tsmin'] = min(res['tsmin'], r.tsmin)
+                res['tsmax'] = max(res['tsmax'], r.tsmax)
+                res['count'] += int(r.count)
+                res['sum'] += r.sum
+                res['min'] = min(res['min'], r.min)
+                res['max'] = max(res['max'], r.max)
+
+        for r in self._make_rollup_stats_query(range_filter, groupby,
+                                               rollups, period):
+            index = (int(timeutils.delta_seconds(
+                sample_filter.start_timestamp, r.timestamp) // period)
+                if period else 0)
+            add(index, r)
+        for start, end in raw:
+            query = self._make_stats_query(range_filter, groupby, None)
+            if start is not None:
+                query = query.filter(models.Sample.timestamp >= start)
+            if end is not None:
+                query = query.filter(models.Sample.timestamp < end)
+            # NOTE: a raw range never spans several periods
+            index = (int(timeutils.delta_seconds(
+                sample_filter.start_timestamp, start) // period)
+                if period else 0)
+            for r in query:
+                if r.count:
+                    add(index, r)
+
+        functions = ([a.func for a in aggregate] if aggregate
+                     else STANDARD_AGGREGATES.keys())
+        for (index, unit, group), res in sorted(six.iteritems(results),
+                                                key=lambda r: r[0][0]):
+            values = dict(unit=unit, tsmin=res['tsmin'], tsmax=res['tsmax'],
+                          count=None)
+            for f in functions:
+                values[f] = (res['sum'] / float(res['count']) if f == 'avg'
+                             else res[f])
+            values.update(zip(groupby or [], group))
+            if period:
+                period_start = sample_filter.start_timestamp + (
+                    datetime.timedelta(seconds=index * period))
+                period_end = period_start + datetime.timedelta(
+                    seconds=period)
+            else:
+                period_start, period_end = res['tsmin'], res['tsmax']
+            yield self._stats_result_to_model(
+                result=base.Model(**values),
+                period=period or 0,
+                period_start=period_start,
+                period_end=period_end,
+                groupby=groupby,
+                aggregate=aggregate)
+
     def get_meter_statistics(self, sample_filter, period=None, groupby=None,
                              aggregate=None):
         """Return an iterable of api_models.Statistics instances.
 
         Items are containing meter statistics described by the query
         parameters. The filter must have a meter value set.
+
+        When rollups are maintained, the whole periods of the rollups
+        inside the requested range are read from them and only the edges
+        of the range are computed from the samples.
         """
         if groupby:
             for group in groupby:
@@ -748,6 +1562,14 @@ class Connection(base.Connection):
                     raise ceilometer.NotImplementedError('Unable to group by '
                                                          'these fields')
 
+        plan = self._plan_rollup_statistics(sample_filter, period, aggregate)
+        if plan:
+            for stat in self._get_rollup_statistics(sample_filter, period,
+                                                    groupby, aggregate,
+                                                    *plan):
+                yield stat
+            return
+
         if not period:
             for res in self._make_stats_query(sample_filter,
                                               groupby,
@@ -768,26 +1590,56 @@ class Connection(base.Connection):
                 # sample has found with sample filter(s).
                 return
 
+        start = sample_filter.start_timestamp or res.tsmin
+        end = sample_filter.end_timestamp or res.tsmax
         query = self._make_stats_query(sample_filter, groupby, aggregate)
-        # HACK(jd) This is an awful method to compute stats by period, but
-        # since we're trying to be SQL agnostic we have to write portable
-        # code, so here it is, admire! We're going to do one request to get
-        # stats by period. We would like to use GROUP BY, but there's no
-        # portable way to manipulate timestamp in SQL, so we can't.
-        for period_start, period_end in base.iter_period(
-                sample_filter.start_timestamp or res.tsmin,
-                sample_filter.end_timestamp or res.tsmax,
-                period):
-            q = query.filter(models.Sample.timestamp >= period_start)
-            q = q.filter(models.Sample.timestamp < period_end)
-            for r in q.all():
-                if r.count:
-                    yield self._stats_result_to_model(
-                        result=r,
-                        period=int(timeutils.delta_seconds(period_start,
-                                                           period_end)),
-                        period_start=period_start,
-                        period_end=period_end,
-                        groupby=groupby,
-                        aggregate=aggregate
-                    )
+        dialect = self._engine_facade.get_engine().dialect.name
+        period_index = self._period_index(dialect, start, period)
+        if period_index is None:
+            # HACK(jd) This is an awful method to compute stats by period, but
+            # since we're trying to be SQL agnostic we have to write portable
+            # code, so here it is, admire! We're going to do one request to
+            # get stats by period. Only used for dialects we do not know how
+            # to manipulate timestamps with.
+            for period_start, period_end in base.iter_period(start, end,
+                                                             period):
+                q = query.filter(models.Sample.timestamp >= period_start)
+                q = q.filter(models.Sample.timestamp < period_end)
+                for r in q.all():
+                    if r.count:
+                        yield self._stats_result_to_model(
+                            result=r,
+                            period=int(timeutils.delta_seconds(period_start,
+                                                               period_end)),
+                            period_start=period_start,
+                            period_end=period_end,
+                            groupby=groupby,
+                            aggregate=aggregate
+                        )
+            return
+
+        # Only keep the samples of the periods base.iter_period would yield
+        periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                / float(period)))
+        if periods <= 0:
+            return
+        index_col = sa.literal_column('period_index')
+        q = (query.add_columns(period_index.label('period_index'))
+             .filter(models.Sample.timestamp >= start)
+             .filter(models.Sample.timestamp <
+                     start + datetime.timedelta(seconds=periods * period))
+             .group_by(index_col)
+             .order_by(index_col))
+        for r in q.all():
+            if r.count:
+                period_start = start + datetime.timedelta(
+                    seconds=int(r.period_index) * period)
+                yield self._stats_result_to_model(
+                    result=r,
+                    period=period,
+                    period_start=period_start,
+                    period_end=period_start + datetime.timedelta(
+                        seconds=period),
+                    groupby=groupby,
+                    aggregate=aggregate
+                )
@@ -45,8 +45,7 @@ EVENT_TRAIT_TYPES = {'none': 0, 'string': 1, 'integer': 2, 'float': 3,
                      'datetime': 4}
 OP_SIGN = {'lt': '$lt', 'le': '$lte', 'ne': '$ne', 'gt': '$gt', 'ge': '$gte'}
 
-MINIMUM_COMPATIBLE_MONGODB_VERSION = [2, 4]
-COMPLETE_AGGREGATE_COMPATIBLE_VERSION = [2, 6]
+MINIMUM_COMPATIBLE_MONGODB_VERSION = [2, 6]
 
 FINALIZE_AGGREGATION_LAMBDA = lambda result, param=None: float(result)
 CARDINALITY_VALIDATION = (lambda name, param: param in ['resource_id',
@@ -606,27 +605,18 @@ STDDEV_AGGREGATION = Aggregation(
 
 CARDINALITY_AGGREGATION = Aggregation(
     "cardinality",
-    # $cond operator available only in MongoDB 2.6+
-    [AggregationFields(COMPLETE_AGGREGATE_COMPATIBLE_VERSION,
-                       lambda field: ({"cardinality/%s" % field:
-                                      {"$addToSet": "$%s" % field}}),
-                       lambda field: {
-                           "cardinality/%s" % field: {
-                               "$cond": [
-                                   {"$eq": ["$cardinality/%s" % field, None]},
-                                   0,
-                                   {"$size": "$cardinality/%s" % field}]
-                           }},
-                       validate=CARDINALITY_VALIDATION,
-                       parametrized=True),
-     AggregationFields(MINIMUM_COMPATIBLE_MONGODB_VERSION,
-                       lambda field: ({"cardinality/%s" % field:
-                                       {"$addToSet": "$%s" % field}}),
-                       lambda field: ({"cardinality/%s" % field:
-                                       "$cardinality/%s" % field}),
-                       finalize=len,
-                       validate=CARDINALITY_VALIDATION,
-                       parametrized=True)]
+    AggregationFields(MINIMUM_COMPATIBLE_MONGODB_VERSION,
+                      lambda field: ({"cardinality/%s" % field:
+                                     {"$addToSet": "$%s" % field}}),
+                      lambda field: {
+                          "cardinality/%s" % field: {
+                              "$cond": [
+                                  {"$eq": ["$cardinality/%s" % field, None]},
+                                  0,
+                                  {"$size": "$cardinality/%s" % field}]
+                          }},
+                      validate=CARDINALITY_VALIDATION,
+                      parametrized=True)
 )
 
 
@@ -0,0 +1,52 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sa
+
+from ceilometer.storage.sqlalchemy import models
+
+
+# Add tables of the samples pre-aggregated per meter, resource and period
+# and of up to when the rollups of each granularity were built
+def upgrade(migrate_engine):
+    meta = sa.MetaData(bind=migrate_engine)
+    sa.Table('meter', meta, autoload=True)
+    sa.Table('resource', meta, autoload=True)
+    sample_rollup = sa.Table(
+        'sample_rollup', meta,
+        sa.Column('granularity', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('meter_id', sa.Integer, sa.ForeignKey('meter.id'),
+                  primary_key=True, autoincrement=False),
+        sa.Column('resource_id', sa.Integer,
+                  sa.ForeignKey('resource.internal_id'),
+                  primary_key=True, autoincrement=False),
+        sa.Column('timestamp', models.PreciseTimestamp(), primary_key=True),
+        sa.Column('first_timestamp', models.PreciseTimestamp()),
+        sa.Column('last_timestamp', models.PreciseTimestamp()),
+        sa.Column('count', sa.Integer),
+        sa.Column('sum', sa.Float(53)),
+        sa.Column('min', sa.Float(53)),
+        sa.Column('max', sa.Float(53)),
+        sa.Index('ix_sample_rollup_meter_id_granularity_timestamp',
+                 'meter_id', 'granularity', 'timestamp'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8')
+    sample_rollup.create()
+    sample_rollup_build = sa.Table(
+        'sample_rollup_build', meta,
+        sa.Column('granularity', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('built_until', models.PreciseTimestamp(), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8')
+    sample_rollup_build.create()
@@ -222,6 +222,36 @@ class Sample(Base):
     message_id = Column(String(128))
 
 
+class SampleRollup(Base):
+    """Pre-aggregated metering data of a meter and resource over a period."""
+
+    __tablename__ = 'sample_rollup'
+    __table_args__ = (
+        Index('ix_sample_rollup_meter_id_granularity_timestamp',
+              'meter_id', 'granularity', 'timestamp'),
+    )
+    granularity = Column(Integer, primary_key=True, autoincrement=False)
+    meter_id = Column(Integer, ForeignKey('meter.id'), primary_key=True,
+                      autoincrement=False)
+    resource_id = Column(Integer, ForeignKey('resource.internal_id'),
+                         primary_key=True, autoincrement=False)
+    timestamp = Column(PreciseTimestamp(), primary_key=True)
+    first_timestamp = Column(PreciseTimestamp())
+    last_timestamp = Column(PreciseTimestamp())
+    count = Column(Integer)
+    sum = Column(Float(53))
+    min = Column(Float(53))
+    max = Column(Float(53))
+
+
+class SampleRollupBuild(Base):
+    """Period up to which the rollups of a granularity are complete."""
+
+    __tablename__ = 'sample_rollup_build'
+    granularity = Column(Integer, primary_key=True, autoincrement=False)
+    built_until = Column(PreciseTimestamp(), nullable=False)
+
+
 class FullSample(object):
     """A fake model for query samples."""
     id = Sample.id
@@ -20,6 +20,8 @@
   running the tests. Make sure the Thrift server is running on that server.
 
 """
+import datetime
+
 import mock
 
 
@@ -29,8 +31,14 @@ except ImportError:
     import testtools.testcase
     raise testtools.testcase.TestSkipped("happybase is needed")
 
+import ceilometer
 from ceilometer.alarm.storage import impl_hbase as hbase_alarm
+from ceilometer.api.controllers.v2 import meters
 from ceilometer.event.storage import impl_hbase as hbase_event
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
+from ceilometer.storage.hbase import inmemory as hbase_inmemory
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
@@ -58,6 +66,236 @@ class ConnectionTest(tests_db.TestBase,
         self.assertIsInstance(conn.conn_pool, TestConn)
 
 
+@tests_db.run_with('hbase')
+class RecordMeteringDataBatchTest(tests_db.TestBase,
+                                  tests_db.MixinTestsWithBackendScenarios):
+
+    def _make_msg(self, minute, tag):
+        s = sample.Sample(
+            'instance', sample.TYPE_GAUGE, unit='', volume=minute,
+            user_id='user-id', project_id='project-id',
+            resource_id='resource-id-batch',
+            timestamp=datetime.datetime(2012, 7, 2, 10, minute),
+            resource_metadata={'display_name': 'test-server', 'tag': tag},
+            source='test')
+        return utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret)
+
+    def test_record_metering_data_batch(self):
+        with self.conn.conn_pool.connection() as conn:
+            resource_table = conn.table(self.conn.RESOURCE_TABLE)
+            with mock.patch.object(resource_table, 'put',
+                                   wraps=resource_table.put) as put:
+                self.conn.record_metering_data_batch([
+                    self._make_msg(41, 'second'),
+                    self._make_msg(42, 'newest'),
+                    self._make_msg(40, 'oldest')])
+        self.assertEqual(1, put.call_count)
+
+        resources = list(self.conn.get_resources(
+            resource='resource-id-batch'))
+        self.assertEqual(1, len(resources))
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 40),
+                         resources[0].first_sample_timestamp)
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 42),
+                         resources[0].last_sample_timestamp)
+        self.assertEqual('newest', resources[0].metadata['tag'])
+        samples = list(self.conn.get_samples(
+            storage.SampleFilter(resource='resource-id-batch')))
+        self.assertEqual([42, 41, 40],
+                         [s.counter_volume for s in samples])
+
+
+@tests_db.run_with('hbase')
+class StatisticsAggregateTest(tests_db.TestBase,
+                              tests_db.MixinTestsWithBackendScenarios):
+
+    def setUp(self):
+        super(StatisticsAggregateTest, self).setUp()
+        samples = []
+        for i, resource in enumerate(['resource-1', 'resource-1',
+                                      'resource-2', 'resource-3']):
+            s = sample.Sample(
+                'cpu_util', sample.TYPE_GAUGE, unit='%', volume=i + 1,
+                user_id='user-id', project_id='project-id',
+                resource_id=resource,
+                timestamp=datetime.datetime(2012, 7, 2, 10, 10 * i),
+                resource_metadata={'instance_type': '8%d' % (i % 2)},
+                source='test')
+            samples.append(utils.meter_message_from_counter(
+                s, self.CONF.publisher.telemetry_secret))
+        self.conn.record_metering_data_batch(samples)
+
+    def test_selectable_aggregates(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        aggregate = [meters.Aggregate(func='stddev'),
+                     meters.Aggregate(func='max'),
+                     meters.Aggregate(func='cardinality',
+                                      param='resource_id')]
+        results = list(self.conn.get_meter_statistics(f, aggregate=aggregate))
+        self.assertEqual(1, len(results))
+        self.assertEqual(4, results[0].max)
+        self.assertFalse(hasattr(results[0], 'avg'))
+        self.assertEqual({'max': 4,
+                          'cardinality/resource_id': 3},
+                         dict((k, v) for k, v in
+                              results[0].aggregate.items()
+                              if k != 'stddev'))
+        self.assertAlmostEqual(1.118034, results[0].aggregate['stddev'])
+
+    def test_aggregates_with_period(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        aggregate = [meters.Aggregate(func='count')]
+        results = list(self.conn.get_meter_statistics(f, period=1200,
+                                                      aggregate=aggregate))
+        self.assertEqual([2, 2], [r.count for r in results])
+        self.assertEqual([datetime.datetime(2012, 7, 2, 10, 0),
+                          datetime.datetime(2012, 7, 2, 10, 20)],
+                         [r.period_start for r in results])
+
+    def test_group_by_resource(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        results = list(self.conn.get_meter_statistics(
+            f, groupby=['resource_id']))
+        self.assertEqual([{'resource_id': 'resource-1'},
+                          {'resource_id': 'resource-2'},
+                          {'resource_id': 'resource-3'}],
+                         [r.groupby for r in results])
+        self.assertEqual([2, 1, 1], [r.count for r in results])
+        self.assertEqual([3, 3, 4], [r.sum for r in results])
+        self.assertEqual([1, 3, 4], [r.min for r in results])
+        self.assertEqual([1.5, 3, 4], [r.avg for r in results])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 0),
+                         results[0].period_start)
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 10),
+                         results[0].period_end)
+        self.assertEqual(600, results[0].duration)
+
+    def test_group_by_metadata(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        results = list(self.conn.get_meter_statistics(
+            f, groupby=['resource_metadata.instance_type']))
+        self.assertEqual([{'resource_metadata.instance_type': '80'},
+                          {'resource_metadata.instance_type': '81'}],
+                         [r.groupby for r in results])
+        self.assertEqual([4, 6], [r.sum for r in results])
+
+    def test_group_by_with_missing_value(self):
+        s = sample.Sample(
+            'cpu_util', sample.TYPE_GAUGE, unit='%', volume=10,
+            user_id='user-id', project_id='project-id',
+            resource_id='resource-4',
+            timestamp=datetime.datetime(2012, 7, 2, 10, 50),
+            resource_metadata={}, source='test')
+        self.conn.record_metering_data(utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret))
+        f = storage.SampleFilter(meter='cpu_util')
+        results = list(self.conn.get_meter_statistics(
+            f, groupby=['resource_metadata.instance_type']))
+        self.assertEqual([{'resource_metadata.instance_type': None},
+                          {'resource_metadata.instance_type': '80'},
+                          {'resource_metadata.instance_type': '81'}],
+                         [r.groupby for r in results])
+        self.assertEqual([10, 4, 6], [r.sum for r in results])
+
+    def test_group_by_with_period(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        aggregate = [meters.Aggregate(func='cardinality',
+                                      param='resource_id')]
+        results = list(self.conn.get_meter_statistics(
+            f, period=1200, groupby=['resource_id'], aggregate=aggregate))
+        self.assertEqual([(datetime.datetime(2012, 7, 2, 10, 0),
+                           {'resource_id': 'resource-1'}, 2),
+                          (datetime.datetime(2012, 7, 2, 10, 20),
+                           {'resource_id': 'resource-2'}, 1),
+                          (datetime.datetime(2012, 7, 2, 10, 20),
+                           {'resource_id': 'resource-3'}, 1)],
+                         [(r.period_start, r.groupby,
+                           r.aggregate['cardinality/resource_id'])
+                          for r in results])
+
+    def test_group_by_unsupported_field(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        self.assertRaises(ceilometer.NotImplementedError,
+                          self.conn.get_meter_statistics,
+                          f, groupby=['source'])
+
+    def _scan_meters(self, sample_filter, **kwargs):
+        with self.conn.conn_pool.connection() as conn:
+            meter_table = conn.table(self.conn.METER_TABLE)
+            with mock.patch.object(meter_table, 'scan',
+                                   wraps=meter_table.scan) as scan:
+                results = list(self.conn.get_meter_statistics(
+                    sample_filter, **kwargs))
+        return scan.call_count, results
+
+    def test_period_without_start_scans_once(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        scans, results = self._scan_meters(f, period=1500)
+        self.assertEqual(1, scans)
+        self.assertEqual([datetime.datetime(2012, 7, 2, 10, 0),
+                          datetime.datetime(2012, 7, 2, 10, 25)],
+                         [r.period_start for r in results])
+        self.assertEqual([3, 1], [r.count for r in results])
+
+    def test_period_with_start_scans_once(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 5))
+        scans, results = self._scan_meters(f, period=1200)
+        self.assertEqual(1, scans)
+        self.assertEqual([datetime.datetime(2012, 7, 2, 10, 5),
+                          datetime.datetime(2012, 7, 2, 10, 25)],
+                         [r.period_start for r in results])
+        self.assertEqual([2, 1], [r.count for r in results])
+
+    def test_no_period_scans_once(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        scans, results = self._scan_meters(f)
+        self.assertEqual(1, scans)
+        self.assertEqual(4, results[0].count)
+
+    def test_bad_cardinality_param(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        aggregate = [meters.Aggregate(func='cardinality', param='source')]
+        self.assertRaises(storage.StorageBadAggregate,
+                          self.conn.get_meter_statistics,
+                          f, aggregate=aggregate)
+
+
+class InMemoryBatchTest(test_base.BaseTestCase):
+
+    def test_batch_sends_on_exit(self):
+        table = hbase_inmemory.MTable('test', {})
+        with table.batch() as batch:
+            batch.put('row1', {'f:a': '1'})
+            batch.put('row2', {'f:a': '2'})
+            self.assertEqual({}, table.row('row1'))
+        self.assertEqual({'f:a': '1'}, table.row('row1'))
+        self.assertEqual({'f:a': '2'}, table.row('row2'))
+
+    def test_batch_sends_by_size(self):
+        table = hbase_inmemory.MTable('test', {})
+        batch = table.batch(batch_size=2)
+        batch.put('row1', {'f:a': '1'})
+        self.assertEqual({}, table.row('row1'))
+        batch.put('row2', {'f:a': '2'})
+        self.assertEqual({'f:a': '1'}, table.row('row1'))
+        batch.delete('row1')
+        batch.send()
+        self.assertEqual({}, table.row('row1'))
+
+    def test_transaction_batch_dropped_on_error(self):
+        table = hbase_inmemory.MTable('test', {})
+        try:
+            with table.batch(transaction=True) as batch:
+                batch.put('row1', {'f:a': '1'})
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual({}, table.row('row1'))
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -73,19 +311,19 @@ class CapabilitiesTest(test_base.BaseTestCase):
             'samples': {'query': {'simple': True,
                                   'metadata': True,
                                   'complex': False}},
-            'statistics': {'groupby': False,
+            'statistics': {'groupby': True,
                            'query': {'simple': True,
                                      'metadata': True,
                                      'complex': False},
                            'aggregation': {'standard': True,
                                            'selectable': {
-                                               'max': False,
-                                               'min': False,
-                                               'sum': False,
-                                               'avg': False,
-                                               'count': False,
-                                               'stddev': False,
-                                               'cardinality': False}}
+                                               'max': True,
+                                               'min': True,
+                                               'sum': True,
+                                               'avg': True,
+                                               'count': True,
+                                               'stddev': True,
+                                               'cardinality': True}}
                            },
         }
 
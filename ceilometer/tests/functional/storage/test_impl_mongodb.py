@@ -20,9 +20,17 @@
   server before running the tests.
 
 """
+import datetime
+
+import mock
+import pymongo
 
 from ceilometer.alarm.storage import impl_mongodb as impl_mongodb_alarm
 from ceilometer.event.storage import impl_mongodb as impl_mongodb_event
+from ceilometer.event.storage import models as event_models
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_mongodb
 from ceilometer.tests import base as test_base
 from ceilometer.tests import db as tests_db
@@ -50,6 +58,84 @@ class MongoDBConnection(tests_db.TestBase,
         expect = {'k3': {'$lt': 'v3'}, 'k2': {'eq': 'v2'}, 'k1': {'eq': 'v1'}}
         self.assertEqual(expect, ret)
 
+    def _make_msg(self, minute, name='instance', tag='self.counter'):
+        s = sample.Sample(
+            name, sample.TYPE_GAUGE, unit='', volume=1,
+            user_id='user-id', project_id='project-id',
+            resource_id='resource-id',
+            timestamp=datetime.datetime(2012, 7, 2, 10, minute),
+            resource_metadata={'display_name': 'test-server', 'tag': tag},
+            source='test')
+        return utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret)
+
+    def test_record_metering_data_batch(self):
+        self.conn.record_metering_data_batch([
+            self._make_msg(41, tag='second'),
+            self._make_msg(42, name='other', tag='newest'),
+            self._make_msg(40, tag='oldest')])
+        resource = self.conn.db.resource.find_one({'_id': 'resource-id'})
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 40),
+                         resource['first_sample_timestamp'])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 42),
+                         resource['last_sample_timestamp'])
+        self.assertEqual('newest', resource['metadata']['tag'])
+        self.assertEqual(set(['instance', 'other']),
+                         set(m['counter_name'] for m in resource['meter']))
+        self.assertEqual(3, self.conn.db.meter.count())
+
+        # an out-of-order batch only moves the first sample timestamp
+        self.conn.record_metering_data_batch([self._make_msg(39,
+                                                             tag='late')])
+        resource = self.conn.db.resource.find_one({'_id': 'resource-id'})
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 39),
+                         resource['first_sample_timestamp'])
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 42),
+                         resource['last_sample_timestamp'])
+        self.assertEqual('newest', resource['metadata']['tag'])
+        self.assertEqual(4, self.conn.db.meter.count())
+
+    def _make_events(self, count):
+        now = datetime.datetime.utcnow()
+        return [event_models.Event('id_%d' % i, 'Foo', now,
+                                   [event_models.Trait(
+                                       'trait', event_models.Trait.INT_TYPE,
+                                       i)], {}) for i in range(count)]
+
+    def test_record_events_duplicate(self):
+        events = self._make_events(3)
+        self.event_conn.record_events(events[:1])
+        with mock.patch('%s.LOG' %
+                        self.event_conn.record_events.__module__) as log:
+            self.event_conn.record_events(events)
+            self.assertEqual(1, log.info.call_count)
+            self.assertFalse(log.error.called)
+        self.assertEqual(3, self.event_conn.db.event.count())
+
+    def test_record_events_write_error(self):
+        error = pymongo.errors.BulkWriteError(
+            {'writeErrors': [{'index': 0, 'code': 11000,
+                              'errmsg': 'E11000 duplicate key error'},
+                             {'index': 1, 'code': 2,
+                              'errmsg': 'bad value'}],
+             'writeConcernErrors': []})
+        with mock.patch.object(self.event_conn, 'db') as db:
+            db.event.insert_many.side_effect = error
+            with mock.patch('%s.LOG' %
+                            self.event_conn.record_events.__module__) as log:
+                self.assertRaises(pymongo.errors.BulkWriteError,
+                                  self.event_conn.record_events,
+                                  self._make_events(2))
+                self.assertEqual(1, log.info.call_count)
+                self.assertEqual(1, log.error.call_count)
+        self.assertEqual(1, db.event.insert_many.call_count)
+
+    def test_event_write_concern(self):
+        self.CONF.set_override('mongodb_event_write_concern', '1',
+                               group='database')
+        conn = impl_mongodb_event.Connection(self.db_manager.url)
+        self.assertEqual({'w': 1}, conn.db.conn.write_concern.document)
+
 
 @tests_db.run_with('mongodb')
 class IndexTest(tests_db.TestBase,
@@ -107,6 +193,18 @@ class IndexTest(tests_db.TestBase,
                                      'alarm_history_time_to_live')
 
 
+class ServerVersionTest(test_base.BaseTestCase):
+
+    def test_mongodb_2_4_rejected(self):
+        conn = mock.Mock()
+        conn.server_info.return_value = {'versionArray': [2, 4, 14, 0]}
+        with mock.patch.object(impl_mongodb.Connection.CONNECTION_POOL,
+                               'connect', return_value=conn):
+            self.assertRaises(storage.StorageBadVersion,
+                              impl_mongodb.Connection,
+                              'mongodb://localhost/ceilometer')
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
@@ -21,12 +21,18 @@
 import datetime
 
 import mock
+from oslo_db import exception as dbexc
 from oslo_utils import timeutils
 from six.moves import reprlib
+import sqlalchemy as sa
 
 from ceilometer.alarm.storage import impl_sqlalchemy as impl_sqla_alarm
+from ceilometer.api.controllers.v2 import meters
 from ceilometer.event.storage import impl_sqlalchemy as impl_sqla_event
 from ceilometer.event.storage import models
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage.sqlalchemy import models as sql_models
 from ceilometer.tests import base as test_base
@@ -103,6 +109,50 @@ class EventTest(tests_db.TestBase):
         ev.id = 100
         self.assertTrue(reprlib.repr(ev))
 
+    def _make_events(self, count):
+        now = datetime.datetime.utcnow()
+        return [models.Event('id_%d' % i, 'type_%d' % (i % 2), now,
+                             [models.Trait('Foo', models.Trait.TEXT_TYPE,
+                                           'text_%d' % i),
+                              models.Trait('Bar', models.Trait.INT_TYPE, i)],
+                             {}) for i in range(count)]
+
+    def _verify_count(self, count):
+        session = self.event_conn._engine_facade.get_session()
+        self.assertEqual(count, session.query(sql_models.Event).count())
+        self.assertEqual(count, session.query(sql_models.TraitText).count())
+        self.assertEqual(count, session.query(sql_models.TraitInt).count())
+
+    def test_record_events_batch(self):
+        self.event_conn.record_events(self._make_events(4))
+        self._verify_count(4)
+        self.assertEqual(set(['type_0', 'type_1']),
+                         set(self.event_conn._event_type_ids))
+        events = list(self.event_conn.get_events(storage.EventFilter(
+            message_id='id_3')))
+        self.assertEqual(1, len(events))
+        self.assertEqual('type_1', events[0].event_type)
+        self.assertEqual(set([('Foo', 'text_3'), ('Bar', 3)]),
+                         set((t.name, t.value) for t in events[0].traits))
+
+    def test_record_events_duplicate_skipped(self):
+        events = self._make_events(3)
+        self.event_conn.record_events(events[:1])
+        with mock.patch('%s.LOG' % impl_sqla_event.__name__) as log:
+            self.event_conn.record_events(events)
+            self.assertEqual(1, log.info.call_count)
+            self.assertFalse(log.warning.called)
+        self._verify_count(3)
+
+    def test_record_events_batch_failure(self):
+        with mock.patch.object(self.event_conn, '_record_batch',
+                               side_effect=Exception('boom')):
+            with mock.patch('%s.LOG' % impl_sqla_event.__name__) as log:
+                self.event_conn.record_events(self._make_events(2))
+                self.assertEqual(1, log.warning.call_count)
+                self.assertFalse(log.exception.called)
+        self._verify_count(2)
+
 
 @tests_db.run_with('sqlite', 'mysql', 'pgsql')
 class RelationshipTest(scenarios.DBTestBase):
@@ -130,6 +180,502 @@ class RelationshipTest(scenarios.DBTestBase):
         self.assertEqual(set(resource_ids.all()), s)
 
 
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class RecordMeteringDataBatchTest(scenarios.DBTestBase):
+
+    def _make_msg(self, volume, resource_id='resource-id', name='instance',
+                  metadata=None):
+        s = sample.Sample(
+            name, sample.TYPE_GAUGE, unit='', volume=volume,
+            user_id='user-id', project_id='project-id',
+            resource_id=resource_id,
+            timestamp=datetime.datetime(2012, 7, 2, 11, volume),
+            resource_metadata=metadata or {'display_name': 'test-server',
+                                           'tag': 'self.counter'},
+            source='test-batch')
+        return utils.meter_message_from_counter(
+            s, self.CONF.publisher.telemetry_secret)
+
+    def test_record_batch_reuses_meters_and_resources(self):
+        session = self.conn._engine_facade.get_session()
+        meters = session.query(sql_models.Meter).count()
+        resources = session.query(sql_models.Resource).count()
+
+        msgs = [self._make_msg(1),
+                self._make_msg(2, resource_id='resource-id-batch'),
+                self._make_msg(3, name='instance-batch'),
+                self._make_msg(4, resource_id='resource-id-batch')]
+        self.conn.record_metering_data_batch(msgs)
+
+        self.assertEqual(meters + 2,
+                         session.query(sql_models.Meter).count())
+        self.assertEqual(resources + 2,
+                         session.query(sql_models.Resource).count())
+        results = list(self.conn.get_samples(
+            storage.SampleFilter(source='test-batch')))
+        self.assertEqual([4, 3, 2, 1],
+                         [r.counter_volume for r in results])
+
+    def test_record_caches_meter_and_resource_ids(self):
+        self.conn.record_metering_data(self._make_msg(1))
+        meter_hits = self.conn._meter_cache.hits
+        resource_hits = self.conn._resource_cache.hits
+        with mock.patch.object(self.conn, '_create_meter') as create_meter:
+            with mock.patch.object(self.conn,
+                                   '_create_resource') as create_resource:
+                self.conn.record_metering_data_batch([self._make_msg(2),
+                                                      self._make_msg(3)])
+        self.assertFalse(create_meter.called)
+        self.assertFalse(create_resource.called)
+        self.assertEqual(meter_hits + 1, self.conn._meter_cache.hits)
+        self.assertEqual(resource_hits + 1, self.conn._resource_cache.hits)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_invalidates_id_caches(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 10, 45)
+        self.conn.record_metering_data(self._make_msg(1))
+        self.assertNotEqual(0, len(self.conn._meter_cache))
+        self.conn.clear_expired_metering_data(3 * 60)
+        self.assertEqual(0, len(self.conn._meter_cache))
+        self.assertEqual(0, len(self.conn._resource_cache))
+
+    def _resource_of(self, volume):
+        session = self.conn._engine_facade.get_session()
+        return (session.query(sql_models.Resource.internal_id,
+                              sql_models.Resource.metadata_hash)
+                .join(sql_models.Sample)
+                .filter(sql_models.Resource.source_id == 'test-batch')
+                .filter(sql_models.Sample.volume == volume).one())
+
+    def _mark_resource(self, internal_id):
+        # the expirer of another process marks the resource
+        engine = self.conn._engine_facade.get_engine()
+        res = sql_models.Resource.__table__
+        engine.execute(res.update()
+                       .where(res.c.internal_id == internal_id)
+                       .values(metadata_hash='delete_%d' % internal_id))
+
+    def test_record_uses_cached_resource_without_query(self):
+        self.conn.record_metering_data(self._make_msg(1))
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = self.conn._engine_facade.get_engine()
+        sa.event.listen(engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        self.addCleanup(sa.event.remove, engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        self.conn.record_metering_data(self._make_msg(2))
+        self.assertEqual([], [st for st in statements
+                              if 'FROM resource' in st])
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_unmarks_cached_resource_sampled(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 12, 0)
+        msg = self._make_msg(1)
+        self.conn.record_metering_data(msg)
+        internal_id = self._resource_of(1).internal_id
+        self._mark_resource(internal_id)
+        # the cached id is still used by the writers of this process
+        self.conn.record_metering_data(self._make_msg(2))
+        self.assertEqual(internal_id, self._resource_of(2).internal_id)
+
+        self.conn.clear_expired_metering_data(2 * 3600)
+        resource = self._resource_of(2)
+        self.assertEqual(internal_id, resource.internal_id)
+        self.assertEqual(self.conn._metadata_hash(msg['resource_metadata']),
+                         resource.metadata_hash)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(2, session.query(sql_models.MetaText).filter(
+            sql_models.MetaText.id == internal_id).count())
+
+        # writers resolving the resource again find it
+        self.conn.record_metering_data(self._make_msg(3))
+        self.assertEqual(internal_id, self._resource_of(3).internal_id)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_evicts_id_caches_before_marking(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 10, 45)
+        self.conn.record_metering_data(self._make_msg(1))
+        mark = self.conn._mark_unused_resources
+
+        def _mark(session):
+            self.assertEqual(0, len(self.conn._resource_cache))
+            mark(session)
+
+        with mock.patch.object(self.conn, '_mark_unused_resources',
+                               side_effect=_mark) as mark_resources:
+            self.conn.clear_expired_metering_data(3 * 60)
+        self.assertTrue(mark_resources.called)
+
+    @mock.patch.object(timeutils, 'utcnow')
+    def test_expirer_keeps_marker_of_duplicated_resource(self, mock_utcnow):
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 12, 0)
+        self.conn.record_metering_data(self._make_msg(1))
+        internal_id = self._resource_of(1).internal_id
+        self._mark_resource(internal_id)
+        self.conn.record_metering_data(self._make_msg(2))
+        # a writer of another process resolves the resource again and
+        # creates a live duplicate of the marked one
+        self.conn._clear_id_caches()
+        self.conn.record_metering_data(self._make_msg(3))
+        live = self._resource_of(3)
+        self.assertNotEqual(internal_id, live.internal_id)
+
+        self.conn.clear_expired_metering_data(2 * 3600)
+        # the marked resource is kept along with its samples
+        self.assertEqual('delete_%d' % internal_id,
+                         self._resource_of(2).metadata_hash)
+        self.assertEqual(live, self._resource_of(3))
+
+        # and deleted once its samples have expired
+        mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 13, 0)
+        self.conn.clear_expired_metering_data(30 * 60)
+        session = self.conn._engine_facade.get_session()
+        self.assertEqual(0, session.query(sql_models.Resource).filter(
+            sql_models.Resource.internal_id == internal_id).count())
+
+    def test_record_empty_batch(self):
+        session = self.conn._engine_facade.get_session()
+        samples = session.query(sql_models.Sample).count()
+        self.conn.record_metering_data_batch([])
+        self.assertEqual(samples, session.query(sql_models.Sample).count())
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class StatisticsPeriodTest(scenarios.DBTestBase):
+
+    def _assert_same_as_fallback(self, sample_filter, period, groupby=None):
+        bucketed = list(self.conn.get_meter_statistics(
+            sample_filter, period=period, groupby=groupby))
+        with mock.patch.object(self.conn, '_period_index',
+                               return_value=None):
+            looped = list(self.conn.get_meter_statistics(
+                sample_filter, period=period, groupby=groupby))
+        self.assertNotEqual([], bucketed)
+        key = lambda s: (s.period_start, sorted((s.groupby or {}).items()))
+        self.assertEqual([s.as_dict() for s in sorted(looped, key=key)],
+                         [s.as_dict() for s in sorted(bucketed, key=key)])
+
+    def test_period_bucketing_matches_fallback(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 39, 30),
+            end_timestamp=datetime.datetime(2012, 7, 2, 10, 45))
+        self._assert_same_as_fallback(f, 60)
+        self._assert_same_as_fallback(f, 120, groupby=['resource_id'])
+
+    def test_period_bucketing_without_end_matches_fallback(self):
+        f = storage.SampleFilter(
+            meter='instance',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 39))
+        self._assert_same_as_fallback(f, 3600 * 24 * 30)
+
+    def test_period_bucketing_near_sub_millisecond_boundary(self):
+        for microsecond in (300, 500):
+            self.create_and_store_sample(
+                timestamp=datetime.datetime(2012, 7, 2, 10, 51, 0,
+                                            microsecond),
+                name='precise', volume=microsecond)
+        f = storage.SampleFilter(
+            meter='precise',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 50, 0, 400))
+        self._assert_same_as_fallback(f, 60)
+        stats = list(self.conn.get_meter_statistics(f, period=60))
+        self.assertEqual([300, 500], [s.sum for s in stats])
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class GetResourcesTest(scenarios.DBTestBase):
+
+    def test_get_resources_in_one_query(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            # NOTE: ignore the connection liveness checks
+            if 'sample' in statement:
+                statements.append(statement)
+
+        engine = self.conn._engine_facade.get_engine()
+        sa.event.listen(engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        self.addCleanup(sa.event.remove, engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        resources = list(self.conn.get_resources())
+        self.assertEqual(len(set(m['resource_id'] for m in self.msgs)),
+                         len(resources))
+        self.assertEqual(1, len(statements))
+
+    def test_latest_sample_metadata(self):
+        timestamp = datetime.datetime(2012, 7, 2, 10, 39)
+        for tag in ('first', 'second'):
+            self.create_and_store_sample(
+                timestamp=timestamp, resource_id='resource-same-ts',
+                metadata={'display_name': 'test-server', 'tag': tag})
+        resources = list(self.conn.get_resources(
+            resource='resource-same-ts'))
+        self.assertEqual(1, len(resources))
+        self.assertEqual('second', resources[0].metadata['tag'])
+        self.assertEqual(timestamp, resources[0].first_sample_timestamp)
+        self.assertEqual(timestamp, resources[0].last_sample_timestamp)
+
+
+@tests_db.run_with('sqlite', 'mysql', 'pgsql')
+class RollupStatisticsTest(scenarios.DBTestBase):
+
+    def prepare_data(self):
+        self.conn._rollup_granularities = [3600, 300]
+        start = datetime.datetime(2012, 7, 2, 10, 0)
+        for i in range(30):
+            self.create_and_store_sample(
+                timestamp=start + datetime.timedelta(minutes=7 * i),
+                name='cpu_util', sample_type=sample.TYPE_GAUGE,
+                volume=i % 7, resource_id='resource-%d' % (i % 2),
+                source='test-rollup')
+        self.conn.rebuild_rollups()
+
+    def _get_stats(self, sample_filter, **kwargs):
+        key = lambda s: (s.period_start, sorted((s.groupby or {}).items()))
+        return [s.as_dict() for s in sorted(
+            self.conn.get_meter_statistics(sample_filter, **kwargs),
+            key=key)]
+
+    def _assert_same_as_samples(self, sample_filter, **kwargs):
+        with mock.patch.object(self.conn, '_rollup_granularities', []):
+            expected = self._get_stats(sample_filter, **kwargs)
+        self.assertNotEqual([], expected)
+        self.assertEqual(expected, self._get_stats(sample_filter, **kwargs))
+
+    def test_aligned_range_reads_rollups_only(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 11, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 0))
+        self._assert_same_as_samples(f)
+        with mock.patch.object(self.conn, '_make_stats_query',
+                               side_effect=AssertionError):
+            self.assertEqual(1, len(self._get_stats(f)))
+
+    def test_unaligned_range(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 14),
+            start_timestamp_op='gt',
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 2),
+            end_timestamp_op='le')
+        self._assert_same_as_samples(f)
+        self._assert_same_as_samples(f, groupby=['resource_id'])
+        rollups, raw = self.conn._plan_rollup_statistics(f, None, None)
+        self.assertEqual([(3600, datetime.datetime(2012, 7, 2, 11, 0),
+                           datetime.datetime(2012, 7, 2, 13, 0)),
+                          (300, datetime.datetime(2012, 7, 2, 10, 15),
+                           datetime.datetime(2012, 7, 2, 11, 0))], rollups)
+        self.assertEqual([(datetime.datetime(2012, 7, 2, 10, 14, 0, 1),
+                           datetime.datetime(2012, 7, 2, 10, 15)),
+                          (datetime.datetime(2012, 7, 2, 13, 0),
+                           datetime.datetime(2012, 7, 2, 13, 2, 0, 1))], raw)
+
+    def test_unbounded_range(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        self._assert_same_as_samples(f)
+        self._assert_same_as_samples(f, groupby=['user_id', 'resource_id'])
+
+    def test_period(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 25))
+        self._assert_same_as_samples(f, period=3600)
+        self._assert_same_as_samples(f, period=1800,
+                                     groupby=['resource_id'])
+        self._assert_same_as_samples(f, period=900)
+
+    def test_period_not_aligned_reads_samples(self):
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 1),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 0))
+        self.assertIsNone(self.conn._plan_rollup_statistics(f, 3600, None))
+        self.assertIsNone(self.conn._plan_rollup_statistics(f, 450, None))
+
+    def test_selectable_aggregates(self):
+        f = storage.SampleFilter(meter='cpu_util')
+        self._assert_same_as_samples(
+            f, aggregate=[meters.Aggregate(func='max'),
+                          meters.Aggregate(func='count')])
+        self.assertIsNone(self.conn._plan_rollup_statistics(
+            f, None, [meters.Aggregate(func='stddev')]))
+
+    def test_expirer_keeps_rollups_consistent(self):
+        self.mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 11, 23)
+        self.conn.clear_expired_metering_data(0)
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 11, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 14, 0))
+        self._assert_same_as_samples(f, period=3600)
+
+    def test_unbuilt_granularity_not_read(self):
+        # writers maintain the rollups of a granularity before its build
+        engine = self.conn._engine_facade.get_engine()
+        table = sql_models.SampleRollupBuild.__table__
+        engine.execute(table.delete().where(table.c.granularity == 3600))
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 11, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 0))
+        rollups, raw = self.conn._plan_rollup_statistics(f, None, None)
+        self.assertEqual([300], list(set(r[0] for r in rollups)))
+        engine.execute(table.delete())
+        self.assertIsNone(self.conn._plan_rollup_statistics(f, None, None))
+        self._assert_same_as_samples(f)
+
+    def test_upgrade_with_other_granularities(self):
+        # another process runs dbsync without the 300 granularity
+        with mock.patch.object(self.conn, '_rollup_granularities', [3600]):
+            self.conn.upgrade()
+        self.assertEqual([3600], list(self.conn._built_rollups()))
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 14),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 2))
+        rollups, raw = self.conn._plan_rollup_statistics(f, None, None)
+        self.assertEqual([(3600, datetime.datetime(2012, 7, 2, 11, 0),
+                           datetime.datetime(2012, 7, 2, 13, 0))], rollups)
+        self._assert_same_as_samples(f)
+
+    def test_rollups_read_until_built(self):
+        self.mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 12, 10)
+        self.conn.rebuild_rollups()
+        self.assertEqual({3600: datetime.datetime(2012, 7, 2, 12, 0),
+                          300: datetime.datetime(2012, 7, 2, 12, 10)},
+                         self.conn._built_rollups())
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 11, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 0))
+        self.assertEqual(
+            ([(3600, datetime.datetime(2012, 7, 2, 11, 0),
+               datetime.datetime(2012, 7, 2, 12, 0))],
+             [(datetime.datetime(2012, 7, 2, 12, 0),
+               datetime.datetime(2012, 7, 2, 13, 0))]),
+            self.conn._plan_rollup_statistics(f, None, None))
+        self._assert_same_as_samples(f)
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 10, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 25))
+        self._assert_same_as_samples(f, period=1800)
+        self._assert_same_as_samples(f, period=3600,
+                                     groupby=['resource_id'])
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+
+    def test_statistics_catch_up_rollups(self):
+        self.mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 12, 10)
+        self.conn.rebuild_rollups()
+        self.mock_utcnow.return_value = datetime.datetime(2012, 7, 2, 13, 37)
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+        self.assertEqual({3600: datetime.datetime(2012, 7, 2, 13, 0),
+                          300: datetime.datetime(2012, 7, 2, 13, 35)},
+                         self.conn._built_rollups())
+        with mock.patch.object(self.conn, '_rebuild_rollups') as rebuild:
+            self._get_stats(storage.SampleFilter(meter='cpu_util'))
+        self.assertFalse(rebuild.called)
+
+    def test_record_retries_rollup_removed_by_rebuild(self):
+        existing = impl_sqlalchemy.Connection._existing_rollups
+        stale = [True]
+
+        def _existing(conn, rollups):
+            keys = existing(conn, rollups)
+            if stale:
+                stale.pop()
+                # a rebuild removes the rollups after they were read
+                table = sql_models.SampleRollup.__table__
+                conn.execute(table.delete())
+            return keys
+
+        with mock.patch.object(impl_sqlalchemy.Connection,
+                               '_existing_rollups',
+                               side_effect=_existing) as read:
+            self.create_and_store_sample(
+                timestamp=datetime.datetime(2012, 7, 2, 12, 1),
+                name='cpu_util', sample_type=sample.TYPE_GAUGE,
+                volume=42, resource_id='resource-0', source='test-rollup')
+        self.assertEqual(2, read.call_count)
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+
+    def test_rebuild_retries_rollup_created_by_writer(self):
+        window = self.conn._rebuild_rollups_window
+        conflicts = [dbexc.DBDuplicateEntry()]
+
+        def _window(conn, dialect, granularity, start, stop):
+            window(conn, dialect, granularity, start, stop)
+            if conflicts:
+                raise conflicts.pop()
+
+        with mock.patch.object(self.conn, '_rebuild_rollups_window',
+                               side_effect=_window):
+            self.conn.rebuild_rollups()
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+
+    def test_build_rollups_in_chunks(self):
+        window = self.conn._rebuild_rollups_window
+
+        def _window(conn, dialect, granularity, start, stop):
+            # the granularity is not read while it is built
+            self.assertNotIn(granularity, self.conn._built_rollups())
+            window(conn, dialect, granularity, start, stop)
+
+        with mock.patch.object(self.conn, 'ROLLUP_REBUILD_PERIODS', 2):
+            with mock.patch.object(self.conn, '_rebuild_rollups_window',
+                                   side_effect=_window) as rebuild:
+                self.conn.rebuild_rollups()
+        # 4 hourly and 41 five minutes periods, two at a time
+        self.assertEqual(2 + 21, rebuild.call_count)
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+
+    def test_upgrade_rebuilds_rollups(self):
+        engine = self.conn._engine_facade.get_engine()
+        engine.execute(sql_models.SampleRollup.__table__.delete())
+        engine.execute(sql_models.SampleRollupBuild.__table__.delete())
+        self.conn.upgrade()
+        f = storage.SampleFilter(meter='cpu_util')
+        self._assert_same_as_samples(f)
+        self._assert_same_as_samples(f, groupby=['resource_id'])
+
+    def test_upgrade_keeps_existing_rollups(self):
+        with mock.patch.object(self.conn, '_rebuild_rollups') as rebuild:
+            self.conn.upgrade()
+        self.assertFalse(rebuild.called)
+
+    def test_upgrade_builds_added_granularity(self):
+        self.conn._rollup_granularities = [86400, 3600, 300]
+        with mock.patch.object(self.conn, '_rebuild_rollups',
+                               wraps=self.conn._rebuild_rollups) as rebuild:
+            self.conn.upgrade()
+        self.assertEqual([86400], [c[0][0] for c in rebuild.call_args_list])
+        self._assert_same_as_samples(storage.SampleFilter(meter='cpu_util'))
+
+    def test_rebuild_rollups(self):
+        engine = self.conn._engine_facade.get_engine()
+        table = sql_models.SampleRollup.__table__
+        engine.execute(table.delete().where(table.c.granularity == 300))
+        with mock.patch.object(self.conn, '_rebuild_rollups',
+                               wraps=self.conn._rebuild_rollups) as rebuild:
+            self.conn.rebuild_rollups()
+        self.assertEqual([3600, 300],
+                         [c[0][0] for c in rebuild.call_args_list])
+        f = storage.SampleFilter(
+            meter='cpu_util',
+            start_timestamp=datetime.datetime(2012, 7, 2, 11, 0),
+            end_timestamp=datetime.datetime(2012, 7, 2, 13, 0))
+        self._assert_same_as_samples(f, period=300)
+
+
 class CapabilitiesTest(test_base.BaseTestCase):
     # Check the returned capabilities list, which is specific to each DB
     # driver
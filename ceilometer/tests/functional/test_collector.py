@@ -12,7 +12,9 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import errno
 import socket
+import threading
 
 import mock
 import msgpack
@@ -117,8 +119,11 @@ class TestCollector(tests_base.BaseTestCase):
 
     def _verify_udp_socket(self, udp_socket):
         conf = self.CONF.collector
-        udp_socket.setsockopt.assert_called_once_with(socket.SOL_SOCKET,
-                                                      socket.SO_REUSEADDR, 1)
+        udp_socket.setsockopt.assert_any_call(socket.SOL_SOCKET,
+                                              socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            udp_socket.setsockopt.assert_any_call(socket.SOL_SOCKET,
+                                                  socket.SO_REUSEPORT, 1)
         udp_socket.bind.assert_called_once_with((conf.udp_address,
                                                  conf.udp_port))
 
@@ -149,7 +154,46 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
+
+    def _make_fake_burst_socket(self, samples):
+        datagrams = [msgpack.dumps(s) for s in samples]
+
+        def recvfrom(size):
+            if not datagrams:
+                # Make the loop stop once the burst has been drained
+                self.srv.stop()
+                raise socket.error(errno.EAGAIN, 'Resource unavailable')
+            return datagrams.pop(0), ('127.0.0.1', 12345)
+
+        sock = mock.Mock()
+        sock.recvfrom = recvfrom
+        return sock
+
+    def test_udp_receive_burst(self):
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        samples = [{'counter_volume': i} for i in range(5)]
+        udp_socket = self._make_fake_burst_socket(samples)
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(samples)
+        udp_socket.setblocking.assert_has_calls([mock.call(False),
+                                                 mock.call(True)])
+
+    def test_udp_receive_burst_limit(self):
+        self._setup_messaging(False)
+        self.CONF.set_override('udp_batch_size', 2, group='collector')
+        mock_dispatcher = self._setup_fake_dispatcher()
+        samples = [{'counter_volume': i} for i in range(5)]
+        udp_socket = self._make_fake_burst_socket(samples)
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        self.assertEqual([mock.call(samples[0:2]), mock.call(samples[2:4]),
+                          mock.call(samples[4:])],
+                         mock_dispatcher.record_metering_data.call_args_list)
 
     def test_udp_socket_ipv6(self):
         self._setup_messaging(False)
@@ -162,6 +206,25 @@ class TestCollector(tests_base.BaseTestCase):
             self.srv.start()
             mock_socket.assert_called_with(socket.AF_INET6, socket.SOCK_DGRAM)
 
+    @mock.patch.object(socket, 'SO_REUSEPORT', 15, create=True)
+    def test_udp_socket_reuseport_unsupported(self):
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        udp_socket = self._make_fake_socket(self.counter)
+
+        def setsockopt(level, option, value):
+            if option == socket.SO_REUSEPORT:
+                raise socket.error(errno.ENOPROTOOPT, 'Protocol not available')
+        udp_socket.setsockopt.side_effect = setsockopt
+
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        udp_socket.bind.assert_called_once_with(
+            (self.CONF.collector.udp_address, self.CONF.collector.udp_port))
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.counter])
+
     def test_udp_receive_storage_error(self):
         self._setup_messaging(False)
         mock_dispatcher = self._setup_fake_dispatcher()
@@ -180,7 +243,7 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     @staticmethod
     def _raise_error(*args, **kwargs):
@@ -228,7 +291,7 @@ class TestCollector(tests_base.BaseTestCase):
                         return_value=self._make_fake_socket(self.utf8_msg)):
             self.srv.start()
             self.assertTrue(utils.verify_signature(
-                mock_dispatcher.method_calls[0][1][0],
+                mock_dispatcher.method_calls[0][1][0][0],
                 "not-so-secret"))
 
     @mock.patch('ceilometer.storage.impl_log.LOG')
@@ -305,3 +368,95 @@ class TestCollector(tests_base.BaseTestCase):
                                group='collector')
         self.CONF.set_override('store_events', True, group='notification')
         self._test_collector_no_requeue('event_listener')
+
+    def _start_batching(self, listener, batch_size, batch_timeout=None):
+        self.CONF.set_override('batch_size', batch_size, group='collector')
+        if batch_timeout is not None:
+            self.CONF.set_override('batch_timeout', batch_timeout,
+                                   group='collector')
+        self.CONF.set_override('store_events', True, group='notification')
+        self.srv.start()
+        return getattr(self.srv, listener).dispatcher.endpoints[0]
+
+    @staticmethod
+    def _concurrent_sample(endp, payloads):
+        results = [None] * len(payloads)
+
+        def sample(i):
+            results[i] = endp.sample({}, 'pub_id', 'event', payloads[i], {})
+
+        threads = [threading.Thread(target=sample, args=(i,))
+                   for i in range(len(payloads))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_sample_batch(self):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        endp = self._start_batching('sample_listener', 3)
+        self._concurrent_sample(endp, [[{'id': 1}, {'id': 2}], {'id': 3}])
+        self.assertEqual(1, mock_dispatcher.record_metering_data.call_count)
+        data = mock_dispatcher.record_metering_data.call_args[0][0]
+        self.assertEqual([1, 2, 3], sorted(d['id'] for d in data))
+        self.assertEqual(0, endp.buffer.queue_depth)
+        self.assertEqual(3, endp.buffer.last_batch_size)
+        self.assertEqual(1, endp.buffer.flush_count)
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_event_batch_requeue(self):
+        self.CONF.set_override('requeue_event_on_dispatcher_error', True,
+                               group='collector')
+        mock_dispatcher = self._setup_fake_dispatcher()
+        mock_dispatcher.record_events.side_effect = Exception('boom')
+        endp = self._start_batching('event_listener', 2)
+        results = self._concurrent_sample(endp, [{'id': 1}, {'id': 2}])
+        self.assertEqual([oslo_messaging.NotificationResult.REQUEUE] * 2,
+                         results)
+        self.assertEqual(1, mock_dispatcher.record_events.call_count)
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_batch_no_requeue(self):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        mock_dispatcher.record_metering_data.side_effect = FakeException(
+            'boom')
+        endp = self._start_batching('sample_listener', 2)
+        self.assertRaises(FakeException, endp.sample, {}, 'pub_id',
+                          'event', {'id': 1}, {})
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_batch_timeout(self):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        endp = self._start_batching('sample_listener', 10, batch_timeout=2)
+        self.assertEqual(2, endp.buffer.batch_timeout)
+        self.assertIsNone(endp.sample({}, 'pub_id', 'event', {'id': 1}, {}))
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [{'id': 1}])
+        self.assertEqual(1, endp.buffer.last_batch_size)
+
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.Mock())
+    @mock.patch.object(collector.CollectorService, 'start_udp', mock.Mock())
+    def test_collector_partial_batch_default_timeout(self):
+        # batch_timeout is not configured, the partial batch of two
+        # messages is still flushed by the default timeout
+        mock_dispatcher = self._setup_fake_dispatcher()
+        endp = self._start_batching('sample_listener', 10)
+        self.assertEqual(1, endp.buffer.batch_timeout)
+        self.assertEqual([None, None],
+                         self._concurrent_sample(endp, [{'id': 1},
+                                                        {'id': 2}]))
+        self.assertEqual(1, mock_dispatcher.record_metering_data.call_count)
+        data = mock_dispatcher.record_metering_data.call_args[0][0]
+        self.assertEqual([1, 2], sorted(d['id'] for d in data))
+        self.assertEqual(0, endp.buffer.queue_depth)
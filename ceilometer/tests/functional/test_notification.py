@@ -15,6 +15,7 @@
 """Tests for Ceilometer notify daemon."""
 
 import shutil
+import threading
 
 import eventlet
 import mock
@@ -22,6 +23,7 @@ from oslo_config import fixture as fixture_config
 from oslo_context import context
 import oslo_messaging
 import oslo_messaging.conffixture
+from oslo_messaging.notify import dispatcher as notify_dispatcher
 import oslo_service.service
 from oslo_utils import fileutils
 from oslo_utils import timeutils
@@ -32,6 +34,7 @@ import yaml
 from ceilometer.compute.notifications import instance
 from ceilometer import messaging
 from ceilometer import notification
+from ceilometer import pipeline
 from ceilometer.publisher import test as test_publisher
 from ceilometer import service
 from ceilometer.tests import base as tests_base
@@ -154,6 +157,132 @@ class TestNotification(tests_base.BaseTestCase):
         self.assertEqual(self.fake_event_endpoint,
                          self.srv.listeners[0].dispatcher.endpoints[0])
 
+    def test_batch_endpoint_per_listener(self):
+        urls = ["fake://vhost1", "fake://vhost2"]
+        self.CONF.set_override("messaging_urls", urls, group="notification")
+        self.CONF.set_override("batch_size", 2, group="notification")
+        self._do_process_notification_manager_start()
+        endpoints = [listener.dispatcher.endpoints
+                     for listener in self.srv.listeners]
+        self.assertEqual([1, 1], [len(e) for e in endpoints])
+        self.assertIsInstance(endpoints[0][0],
+                              notification.BatchNotificationEndpoint)
+        self.assertIsNot(endpoints[0][0].dispatcher,
+                         endpoints[1][0].dispatcher)
+
+    def test_batch_endpoint_dispatch(self):
+        dispatcher = mock.Mock()
+        dispatcher.dispatch.side_effect = lambda f, *args: f(*args)
+        skipped = mock.Mock(spec=['info', 'filter_rule'])
+        skipped.filter_rule.match.return_value = False
+        requeued = mock.Mock(spec=['info', 'error'])
+        requeued.info.return_value = (
+            oslo_messaging.NotificationResult.REQUEUE)
+        last = mock.Mock(spec=['info'])
+        endpoint = notification.BatchNotificationEndpoint(
+            dispatcher, [skipped, requeued, last], allow_requeue=True)
+        self.assertFalse(hasattr(endpoint, 'sample'))
+
+        args = (TEST_NOTICE_CTXT, 'compute.vagrant-precise',
+                'compute.instance.create.end', TEST_NOTICE_PAYLOAD,
+                TEST_NOTICE_METADATA)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE,
+                         endpoint.info(*args))
+        self.assertFalse(skipped.info.called)
+        requeued.info.assert_called_once_with(*args)
+        self.assertFalse(last.info.called)
+
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED,
+                         endpoint.error(*args))
+        requeued.error.assert_called_once_with(*args)
+        self.assertEqual(2, dispatcher.dispatch.call_count)
+
+    def test_batch_endpoint_dispatch_without_requeue(self):
+        dispatcher = mock.Mock()
+        dispatcher.dispatch.side_effect = lambda f, *args: f(*args)
+        requeued = mock.Mock(spec=['info'])
+        requeued.info.return_value = (
+            oslo_messaging.NotificationResult.REQUEUE)
+        last = mock.Mock(spec=['info'])
+        endpoint = notification.BatchNotificationEndpoint(
+            dispatcher, [requeued, last])
+        args = (TEST_NOTICE_CTXT, 'compute.vagrant-precise',
+                'compute.instance.create.end', TEST_NOTICE_PAYLOAD,
+                TEST_NOTICE_METADATA)
+        # as oslo.messaging, a listener which cannot requeue goes on
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED,
+                         endpoint.info(*args))
+        last.info.assert_called_once_with(*args)
+
+    def test_batch_endpoint_priorities(self):
+        # NOTE: fails if oslo.messaging changes the priorities it dispatches
+        self.assertEqual(sorted(notify_dispatcher.PRIORITIES),
+                         sorted(notification.NOTIFICATION_PRIORITIES))
+
+    def test_batch_endpoint_filter_rule(self):
+        dispatcher = mock.Mock()
+        dispatcher.dispatch.side_effect = lambda f, *args: f(*args)
+        screened = mock.Mock(spec=['info', 'filter_rule'])
+        screened.filter_rule = oslo_messaging.NotificationFilter(
+            event_type='compute.instance.create.end',
+            payload={'state': 'active'})
+        endpoint = notification.BatchNotificationEndpoint(dispatcher,
+                                                          [screened])
+        for event_type, state in (('compute.instance.delete.end', 'active'),
+                                  ('compute.instance.create.end', 'error'),
+                                  ('compute.instance.create.end', 'active')):
+            endpoint.info(TEST_NOTICE_CTXT, 'compute.vagrant-precise',
+                          event_type, dict(TEST_NOTICE_PAYLOAD, state=state),
+                          TEST_NOTICE_METADATA)
+        self.assertEqual(1, screened.info.call_count)
+        self.assertEqual('compute.instance.create.end',
+                         screened.info.call_args[0][2])
+
+    def test_batch_endpoint_requeues_batch_on_publish_error(self):
+        manager = mock.Mock()
+        manager.publisher.return_value.__enter__ = mock.Mock(
+            return_value=mock.Mock())
+        manager.publisher.return_value.__exit__ = mock.Mock(
+            side_effect=ValueError('boom'))
+        batch_manager = pipeline.BatchPublishManager(manager)
+
+        class Publishing(object):
+            def info(self, ctxt, publisher_id, event_type, payload,
+                     metadata):
+                with batch_manager.publisher(ctxt) as p:
+                    p(payload)
+
+        endpoint = notification.BatchNotificationEndpoint(
+            pipeline.BatchDispatcher('test', 2, 1, requeue_on_error=True),
+            [Publishing()], allow_requeue=True)
+        results = []
+
+        def info():
+            results.append(endpoint.info(
+                TEST_NOTICE_CTXT, 'compute.vagrant-precise',
+                'compute.instance.create.end', TEST_NOTICE_PAYLOAD,
+                TEST_NOTICE_METADATA))
+
+        threads = [threading.Thread(target=info) for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([oslo_messaging.NotificationResult.REQUEUE] * 2,
+                         results)
+        self.assertEqual(1, manager.publisher.call_count)
+
+    def test_batch_listener_requeues_on_event_error(self):
+        self.CONF.set_override("batch_size", 2, group="notification")
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        self._do_process_notification_manager_start()
+        listener = self.srv.listeners[0]
+        self.assertTrue(listener.dispatcher.allow_requeue)
+        endpoint = listener.dispatcher.endpoints[0]
+        self.assertTrue(endpoint.allow_requeue)
+        self.assertTrue(endpoint.dispatcher.requeue_on_error)
+
     @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
     @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
                        mock.MagicMock())
@@ -172,6 +301,26 @@ class TestNotification(tests_base.BaseTestCase):
             self.srv.start()
             self.assertEqual(1, len(self.srv.listeners[0].dispatcher.targets))
 
+    @mock.patch.object(oslo_messaging.MessageHandlingServer, 'start',
+                       mock.MagicMock())
+    @mock.patch('ceilometer.notification.LOG')
+    def _test_workers_transformers(self, workers, transformers, log):
+        self.CONF.set_override('workers', workers, group='notification')
+        pipe = mock.MagicMock()
+        pipe.sink.transformers = transformers
+        with mock.patch('ceilometer.pipeline.setup_pipeline') as setup:
+            setup.return_value.pipelines = [pipe]
+            srv = notification.NotificationService()
+            srv.start()
+        srv.stop()
+        return any('transformers' in call[0][0]
+                   for call in log.warning.call_args_list)
+
+    def test_workers_with_transformers(self):
+        self.assertTrue(self._test_workers_transformers(2, [mock.Mock()]))
+        self.assertFalse(self._test_workers_transformers(1, [mock.Mock()]))
+        self.assertFalse(self._test_workers_transformers(2, []))
+
 
 class BaseRealNotification(tests_base.BaseTestCase):
     def setup_pipeline(self, counter_names):
@@ -510,6 +510,28 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('b',
                          getattr(self.TransformerClass.samples[1], "name"))
 
+    def test_multiple_pipeline_routing(self):
+        self._augment_pipeline_cfg()
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        self.assertEqual([pipeline_manager.pipelines[0]],
+                         pipeline_manager.get_pipelines('a'))
+        self.assertEqual([pipeline_manager.pipelines[1]],
+                         pipeline_manager.get_pipelines('b'))
+        self.assertEqual([], pipeline_manager.get_pipelines('c'))
+
+        with mock.patch.object(pipeline_manager.pipelines[1],
+                               'publish_data') as publish_data:
+            with mock.patch.object(pipeline_manager.pipelines[1],
+                                   'flush') as flush:
+                with pipeline_manager.publisher(None) as p:
+                    p([self.test_counter])
+        self.assertFalse(publish_data.called)
+        self.assertFalse(flush.called)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(1, len(publisher.samples))
+        self.assertEqual('a_update', getattr(publisher.samples[0], "name"))
+
     def test_multiple_pipeline_exception(self):
         self._reraise_exception = False
         self._break_pipeline_cfg()
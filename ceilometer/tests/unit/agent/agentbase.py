@@ -316,7 +316,12 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.mgr.setup_polling_tasks.assert_called_once_with()
         timer_call = mock.call(1.0, self.mgr.partition_coordinator.heartbeat)
         self.assertEqual([timer_call], self.mgr.tg.add_timer.call_args_list)
+        discoveries = [ext.obj for ext in self.mgr.discovery_manager]
+        for d in discoveries:
+            d.stop = mock.Mock()
         self.mgr.stop()
+        for d in discoveries:
+            d.stop.assert_called_once_with()
         self.mgr.partition_coordinator.stop.assert_called_once_with()
 
     @mock.patch('ceilometer.pipeline.setup_polling')
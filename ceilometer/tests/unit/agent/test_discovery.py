@@ -14,6 +14,7 @@
 # under the License.
 """Tests for ceilometer/central/manager.py
 """
+import datetime
 
 import mock
 from oslo_config import fixture as fixture_config
@@ -21,6 +22,7 @@ from oslotest import base
 
 from ceilometer.agent.discovery import endpoint
 from ceilometer.agent.discovery import localnode
+from ceilometer.compute import discovery as compute
 from ceilometer.hardware import discovery as hardware
 
 
@@ -106,3 +108,131 @@ class TestHardwareDiscovery(base.BaseTestCase):
         self.discovery.nova_cli.instance_get_all.return_value = [instance]
         resources = self.discovery.discover(self.manager)
         self.assertEqual(0, len(resources))
+
+
+class TestInstanceDiscovery(base.BaseTestCase):
+    class MockInstance(object):
+        def __init__(self, id, vm_state='active'):
+            self.id = id
+            setattr(self, 'OS-EXT-STS:vm_state', vm_state)
+
+    def setUp(self):
+        super(TestInstanceDiscovery, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('host', 'compute-1')
+        self.discovery = compute.InstanceDiscovery()
+        self.discovery.nova_cli = mock.MagicMock()
+        self.get_all = self.discovery.nova_cli.instance_get_all_by_host
+        self.manager = mock.MagicMock()
+
+    def _discover(self):
+        return sorted(i.id for i in self.discovery.discover(self.manager))
+
+    def _notify(self, event_type, instance_id, host='compute-1',
+                state='active'):
+        self.discovery.info({}, 'compute.%s' % host, event_type,
+                            {'instance_id': instance_id, 'host': host,
+                             'state': state}, {})
+
+    def test_instance_discovery(self):
+        self.get_all.return_value = [self.MockInstance('a'),
+                                     self.MockInstance('b')]
+        self.assertEqual(['a', 'b'], self._discover())
+        self.get_all.return_value = [self.MockInstance('a', 'deleted')]
+        self.assertEqual(['b'], self._discover())
+        self.assertEqual(2, self.get_all.call_count)
+        self.assertIsNotNone(self.get_all.call_args[0][1])
+
+    @mock.patch('ceilometer.compute.discovery.InstanceDiscovery.'
+                'start_listener')
+    def test_instance_discovery_notifications(self, start_listener):
+        self.CONF.set_override('instance_notifications', True,
+                               group='compute')
+        self.get_all.return_value = [self.MockInstance('a'),
+                                     self.MockInstance('b')]
+        self.assertEqual(['a', 'b'], self._discover())
+        start_listener.assert_called_once_with()
+        self.get_all.assert_called_once_with('compute-1')
+
+        # nova isn't queried while nothing changed on this host
+        self._notify('compute.instance.create.end', 'x', host='compute-2')
+        self.assertEqual(['a', 'b'], self._discover())
+        self.assertEqual(1, self.get_all.call_count)
+
+        # deletions and migrations to other hosts apply immediately
+        self._notify('compute.instance.delete.end', 'a', state='deleted')
+        self._notify('compute.instance.live_migration.post.dest.end', 'b',
+                     host='compute-2')
+        self.assertEqual([], self._discover())
+        self.assertEqual(1, self.get_all.call_count)
+
+        # new instances are listed with changes-since
+        self._notify('compute.instance.create.end', 'c')
+        self._notify('compute.instance.finish_resize.end', 'd')
+        self.get_all.return_value = [self.MockInstance('c'),
+                                     self.MockInstance('d')]
+        self.assertEqual(['c', 'd'], self._discover())
+        self.assertEqual(2, self.get_all.call_count)
+        self.assertIsNotNone(self.get_all.call_args[0][1])
+        self.assertEqual(['c', 'd'], self._discover())
+        self.assertEqual(2, self.get_all.call_count)
+
+    @mock.patch('ceilometer.compute.discovery.InstanceDiscovery.'
+                'start_listener', mock.Mock())
+    def test_instance_discovery_resync(self):
+        self.CONF.set_override('instance_notifications', True,
+                               group='compute')
+        self.CONF.set_override('instance_resync_interval', 600,
+                               group='compute')
+        self.get_all.return_value = [self.MockInstance('a')]
+        with mock.patch('oslo_utils.timeutils.utcnow') as utcnow:
+            utcnow.return_value = datetime.datetime(2015, 1, 1, 0, 0)
+            self.assertEqual(['a'], self._discover())
+            # a lost notification is caught up by the next resync
+            self.get_all.return_value = [self.MockInstance('b')]
+            utcnow.return_value = datetime.datetime(2015, 1, 1, 0, 5)
+            self.assertEqual(['a'], self._discover())
+            utcnow.return_value = datetime.datetime(2015, 1, 1, 0, 11)
+            self.assertEqual(['b'], self._discover())
+        self.assertEqual([mock.call('compute-1'), mock.call('compute-1')],
+                         self.get_all.call_args_list)
+
+    def test_instance_discovery_nova_error(self):
+        self.CONF.set_override('instance_notifications', True,
+                               group='compute')
+        self.discovery.listener = mock.Mock()
+        self.discovery.last_resync = datetime.datetime.utcnow()
+        self.get_all.side_effect = Exception()
+        self.assertEqual([], self._discover())
+        self.get_all.side_effect = None
+        self.get_all.return_value = [self.MockInstance('a')]
+        self.assertEqual(['a'], self._discover())
+
+    @mock.patch('ceilometer.compute.discovery.InstanceDiscovery.'
+                'start_listener', mock.Mock())
+    def test_instance_discovery_resync_error(self):
+        self.CONF.set_override('instance_notifications', True,
+                               group='compute')
+        self.CONF.set_override('instance_resync_interval', 600,
+                               group='compute')
+        self.get_all.return_value = [self.MockInstance('a')]
+        with mock.patch('oslo_utils.timeutils.utcnow') as utcnow:
+            utcnow.return_value = datetime.datetime(2015, 1, 1, 0, 0)
+            self.assertEqual(['a'], self._discover())
+            # the known instances are kept when nova can't be reached
+            self.get_all.side_effect = Exception()
+            utcnow.return_value = datetime.datetime(2015, 1, 1, 0, 11)
+            self.assertEqual(['a'], self._discover())
+            self.get_all.side_effect = None
+            self.get_all.return_value = [self.MockInstance('b')]
+            self.assertEqual(['b'], self._discover())
+
+    def test_instance_discovery_stop(self):
+        listener = mock.Mock()
+        self.discovery.listener = listener
+        self.discovery.stop()
+        listener.stop.assert_called_once_with()
+        listener.wait.assert_called_once_with()
+        self.assertIsNone(self.discovery.listener)
+        self.discovery.stop()
+        self.assertEqual(1, listener.stop.call_count)
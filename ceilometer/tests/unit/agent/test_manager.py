@@ -19,6 +19,7 @@ import shutil
 
 import eventlet
 from keystoneclient import exceptions as ks_exceptions
+from keystoneclient.v2_0 import tenants as ks_tenants
 import mock
 from novaclient import client as novaclient
 from oslo_service import service as os_service
@@ -166,6 +167,35 @@ class TestManager(base.BaseTestCase):
                 self.assertIsInstance(ext.obj, agentbase.TestPollster)
 
 
+class TestResourceSet(base.BaseTestCase):
+
+    def test_strings_and_dicts(self):
+        resources = manager._ResourceSet(['test://',
+                                          {'id': 'a', 'tags': ['x']}])
+        self.assertIn('test://', resources)
+        self.assertIn({'tags': ['x'], 'id': 'a'}, resources)
+        self.assertNotIn({'id': 'a', 'tags': ['y']}, resources)
+        self.assertFalse(resources.add('test://'))
+        self.assertTrue(resources.add('other://'))
+        self.assertEqual(3, len(resources))
+
+    def test_client_resources(self):
+        tenant = ks_tenants.Tenant(None, {'id': 'tenant', 'name': 'a'})
+        same = ks_tenants.Tenant(None, {'id': 'tenant', 'name': 'a'})
+        other = ks_tenants.Tenant(None, {'id': 'tenant', 'name': 'b'})
+        resources = manager._ResourceSet([tenant])
+        self.assertIn(same, resources)
+        self.assertNotIn(other, resources)
+        self.assertFalse(resources.add(same))
+
+    def test_unhashable_resources(self):
+        resources = manager._ResourceSet([{'id': 'a', 'tags': set(['x'])}])
+        self.assertEqual(1, len(resources))
+        self.assertIn({'id': 'a', 'tags': set(['x'])}, resources)
+        self.assertFalse(resources.add({'id': 'a', 'tags': set(['x'])}))
+        self.assertTrue(resources.add({'id': 'b', 'tags': set(['x'])}))
+
+
 class TestPollsterKeystone(agentbase.TestPollster):
     def get_samples(self, manager, cache, resources):
         # Just try to use keystone, that will raise an exception
@@ -377,6 +407,131 @@ class TestRunTasks(agentbase.BaseAgentManagerTestCase):
             'polling source %(source)s anymore!')
             % ({'name': pollster.name, 'source': source_name}))
 
+    def _polling_task(self, *pollsters):
+        source = mock.Mock(resources=['test://'], discovery=[])
+        source.name = 'test_source'
+        source.get_interval.return_value = 600
+        polling_task = self.mgr.create_polling_task()
+        for i, pollster in enumerate(pollsters):
+            polling_task.add(extension.Extension('pollster%d' % i, None,
+                                                 None, pollster), source)
+        return polling_task
+
+    @mock.patch('ceilometer.agent.manager.LOG')
+    def test_pollsters_run_concurrently(self, LOG):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        self.CONF.set_override('pollster_timeout', 5, group='polling')
+        events = [eventlet.event.Event(), eventlet.event.Event()]
+
+        class Pollster(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def __init__(self, ready, other):
+                super(Pollster, self).__init__()
+                self.ready = ready
+                self.other = other
+
+            def get_samples(self, manager, cache, resources):
+                # run by turn, both pollsters only return if the other
+                # one is running at the same time
+                self.ready.send()
+                self.other.wait()
+                return super(Pollster, self).get_samples(manager, cache,
+                                                         resources)
+
+        polling_task = self._polling_task(Pollster(events[0], events[1]),
+                                          Pollster(events[1], events[0]))
+        polling_task.poll_and_notify()
+        self.assertEqual(2, len(self.notified_samples))
+        self.assertFalse(LOG.warning.called)
+        self.assertEqual(2, len(polling_task.durations))
+
+    @mock.patch('ceilometer.agent.manager.LOG')
+    def test_pollster_timeout(self, LOG):
+        self.CONF.set_override('pollster_timeout', 1, group='polling')
+
+        class SlowPollster(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                eventlet.sleep(30)
+                return super(SlowPollster, self).get_samples(
+                    manager, cache, resources)
+
+        polling_task = self._polling_task(SlowPollster(), self.Pollster())
+        start = timeutils.utcnow()
+        polling_task.poll_and_notify()
+        self.assertLess(timeutils.delta_seconds(start, timeutils.utcnow()),
+                        30)
+        self.assertEqual(1, len(self.notified_samples))
+        self.assertEqual(1, LOG.warning.call_count)
+        self.assertGreaterEqual(
+            polling_task.durations['test_source-pollster0'], 1)
+
+    def test_outer_timeout_not_swallowed(self):
+        self.CONF.set_override('pollster_timeout', 5, group='polling')
+        outer = eventlet.Timeout()
+
+        class TimedOutPollster(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                raise outer
+
+        polling_task = self._polling_task(TimedOutPollster())
+        pollster = list(polling_task.pollster_matches['test_source'])[0]
+        try:
+            polling_task._poll('test_source', pollster, {}, ['test://'])
+        except eventlet.Timeout as t:
+            self.assertIs(outer, t)
+        else:
+            self.fail('The outer timeout was swallowed')
+
+    @mock.patch('ceilometer.agent.manager.LOG')
+    def test_polling_cycle_overrun(self, LOG):
+        class SlowPollster(agentbase.TestPollster):
+            samples = []
+            resources = []
+
+            def get_samples(self, manager, cache, resources):
+                eventlet.sleep(0.2)
+                return super(SlowPollster, self).get_samples(
+                    manager, cache, resources)
+
+        polling_task = self._polling_task(self.Pollster(), SlowPollster())
+        self.assertEqual(600, polling_task.interval)
+        polling_task.poll_and_notify()
+        self.assertFalse(LOG.warning.called)
+
+        polling_task.interval = 0.1
+        polling_task.poll_and_notify()
+        self.assertEqual(1, LOG.warning.call_count)
+        slowest = LOG.warning.call_args[0][1]['slowest']
+        self.assertTrue(slowest.startswith('test_source-pollster1 ('))
+        self.assertIn('test_source-pollster0 (', slowest)
+
+    def test_pollsters_share_cache(self):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+
+        class CachePollster(agentbase.TestPollster):
+            samples = []
+            resources = []
+            creator = mock.Mock(return_value='value')
+
+            def get_samples(self, manager, cache, resources):
+                plugin_base.get_cached(cache, 'key', self.creator)
+                eventlet.sleep(0)
+                return super(CachePollster, self).get_samples(
+                    manager, cache, resources)
+
+        polling_task = self._polling_task(CachePollster(), CachePollster())
+        polling_task.poll_and_notify()
+        self.assertEqual(2, len(self.notified_samples))
+        self.assertEqual(1, CachePollster.creator.call_count)
+
     def test_batching_polled_samples_false(self):
         self.CONF.set_override('batch_polled_samples', False)
         self._batching_samples(4, 4)
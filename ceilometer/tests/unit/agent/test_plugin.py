@@ -13,6 +13,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import eventlet
 import mock
 from oslo_config import fixture as fixture_config
 from oslotest import base
@@ -56,3 +57,33 @@ class NotificationBaseTestCase(base.BaseTestCase):
         }
         plugin.to_samples_and_publish.assert_called_with(mock.ANY,
                                                          notification)
+
+
+class PollingCacheTestCase(base.BaseTestCase):
+
+    def test_get_or_set_computes_once(self):
+        cache = plugin_base.PollingCache()
+        creator = mock.Mock(side_effect=lambda: eventlet.sleep(0) or 'value')
+        pool = eventlet.GreenPool()
+        results = [pool.spawn(cache.get_or_set, 'key', creator)
+                   for i in range(5)]
+        self.assertEqual(['value'] * 5, [r.wait() for r in results])
+        self.assertEqual(1, creator.call_count)
+        self.assertEqual({'key': 'value'}, cache)
+
+    def test_get_cached_dict(self):
+        cache = {'key': 'cached'}
+        creator = mock.Mock(return_value='value')
+        self.assertEqual('cached',
+                         plugin_base.get_cached(cache, 'key', creator))
+        self.assertEqual('value',
+                         plugin_base.get_cached(cache, 'other', creator))
+        self.assertEqual(1, creator.call_count)
+        self.assertEqual({'key': 'cached', 'other': 'value'}, cache)
+
+    def test_get_nested_cache(self):
+        cache = plugin_base.PollingCache()
+        nested = plugin_base.get_nested_cache(cache, 'diskio')
+        self.assertIsInstance(nested, plugin_base.PollingCache)
+        self.assertIs(nested, plugin_base.get_nested_cache(cache, 'diskio'))
+        self.assertEqual({}, plugin_base.get_nested_cache({}, 'diskio'))
@@ -188,6 +188,34 @@ class TestTraitDefinition(ConverterBase):
             ('payload.instance_id', 'id-for-instance-0001'),
             ('payload.instance_uuid', 'uuid-for-instance-0001')])
 
+    def test_key_paths(self):
+        simple = ['payload.instance_id',
+                  ['payload.instance_uuid2', 'payload.instance_id'],
+                  '(payload.instance_uuid2)|(payload.instance_uuid)',
+                  '_context_request_id|_context_tenant',
+                  "payload.image_meta.'disk_gb'",
+                  'payload.image_meta.nothere',
+                  'payload.host.nothere',
+                  'payload.nothere.instance_id',
+                  '$.payload.host']
+        complex = ['payload.instance_uuid2|payload.instance_uuid',
+                   'payload.*', 'payload.$.host', 'payload.image_meta.`len`',
+                   'payload[instance_id,host]', 'payload..disk_gb']
+        for fields in simple + complex:
+            tdef = converter.TraitDefinition('test_trait',
+                                             dict(type='text', fields=fields),
+                                             self.fake_plugin_mgr)
+            if fields in simple:
+                self.assertIsNotNone(tdef.key_paths, fields)
+            else:
+                self.assertIsNone(tdef.key_paths, fields)
+            values = [tdef.parse(self.n1),
+                      tdef.parse(self.n1, return_all_values=True)]
+            tdef.key_paths = None
+            self.assertEqual([tdef.parse(self.n1),
+                              tdef.parse(self.n1, return_all_values=True)],
+                             values, fields)
+
     def test_to_trait(self):
         cfg = dict(type='text', fields='payload.instance_id')
         tdef = converter.TraitDefinition('test_trait', cfg,
@@ -708,6 +736,47 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event(self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_converter_first_match_wins(self):
+        event_defs = [
+            {'event_type': 'compute.instance.*', 'traits': {}},
+            {'event_type': ['image.create', 'image.delete'], 'traits': {}},
+            {'event_type': ['*.end', '!scheduler.*'], 'traits': {}},
+            {'event_type': 'compute.instance.create.end', 'traits': {}},
+            {'event_type': 'image.c?eate', 'traits': {}},
+            {'event_type': 'image.create', 'traits': {}},
+            {'event_type': '!image.*', 'traits': {}},
+        ]
+        c = converter.NotificationEventsConverter(
+            event_defs, self.fake_plugin_mgr, add_catchall=False)
+        for event_type in ['compute.instance.create.end',
+                           'compute.instance.create.start',
+                           'compute.instance.exists',
+                           'image.create', 'image.delete', 'image.update',
+                           'image.create.end', 'scheduler.run.end',
+                           'volume.create.end', 'volume.create.start']:
+            expected = None
+            for d in c.definitions:
+                if d.match_type(event_type):
+                    expected = d
+                    break
+            self.assertIs(expected, c._find_definition(event_type),
+                          event_type)
+
+    def test_converter_match_cached(self):
+        c = converter.NotificationEventsConverter(
+            self.valid_event_def1,
+            self.fake_plugin_mgr,
+            add_catchall=False)
+        with mock.patch.object(c, '_find_definition',
+                               wraps=c._find_definition) as find:
+            for i in range(3):
+                self.assertIsValidEvent(c.to_event(self.test_notification1),
+                                        self.test_notification1)
+                self.assertIsNotValidEvent(
+                    c.to_event(self.test_notification2),
+                    self.test_notification2)
+        self.assertEqual(2, find.call_count)
+
     @staticmethod
     def _convert_message(convert, level):
         message = {'priority': level, 'event_type': "foo",
@@ -382,6 +382,45 @@ class TestMeterProcessing(test.BaseTestCase):
         c = list(self.handler.process_notification(NOTIFICATION))
         self.assertEqual(1, len(c))
 
+    def test_dispatch_order(self):
+        metrics = [dict(name="test%d" % i,
+                        event_type=event_type,
+                        type="delta",
+                        unit="B",
+                        volume="$.payload.volume",
+                        resource_id="$.payload.resource_id",
+                        project_id="$.payload.project_id")
+                   for i, event_type in enumerate(
+                       ["test.create", "test.*", "test.update",
+                        ["test.update", "test.create"], "*.create"])]
+        self._load_meter_def_file(yaml.dump({'metric': metrics}))
+        for i in range(2):
+            c = list(self.handler.process_notification(NOTIFICATION))
+            self.assertEqual(['test4', 'test3', 'test1', 'test0'],
+                             [s.name for s in c])
+        self.assertEqual(1, self.handler._cache.hits)
+        self.assertEqual(1, self.handler._cache.misses)
+
+    def test_dispatch_rebuilt_on_reload(self):
+        cfg = dict(name="test1",
+                   event_type="test.create",
+                   type="delta",
+                   unit="B",
+                   volume="$.payload.volume",
+                   resource_id="$.payload.resource_id",
+                   project_id="$.payload.project_id")
+        self._load_meter_def_file(yaml.dump({'metric': [cfg]}))
+        c = list(self.handler.process_notification(NOTIFICATION))
+        self.assertEqual(['test1'], [s.name for s in c])
+        cfg['name'] = 'test2'
+        self._load_meter_def_file(yaml.dump({'metric': [cfg]}))
+        c = list(self.handler.process_notification(NOTIFICATION))
+        self.assertEqual(['test2'], [s.name for s in c])
+        cfg['event_type'] = 'test.update'
+        self._load_meter_def_file(yaml.dump({'metric': [cfg]}))
+        c = list(self.handler.process_notification(NOTIFICATION))
+        self.assertEqual([], c)
+
     def test_default_timestamp(self):
         event = copy.deepcopy(MIDDLEWARE_EVENT)
         del event['payload']['measurements'][1]
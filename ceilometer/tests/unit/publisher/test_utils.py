@@ -14,10 +14,15 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+import hashlib
+import hmac
+
 from oslo_serialization import jsonutils
 from oslotest import base
+import six
 
 from ceilometer.publisher import utils
+from ceilometer import utils as ceilometer_utils
 
 
 class TestSignature(base.BaseTestCase):
@@ -133,3 +138,36 @@ class TestSignature(base.BaseTestCase):
     def test_verify_no_secret(self):
         data = {'a': 'A', 'b': 'B'}
         self.assertTrue(utils.verify_signature(data, ''))
+
+    @staticmethod
+    def _keypairs_signature(message, secret):
+        digest_maker = hmac.new(secret.encode('utf-8'), b'', hashlib.sha256)
+        for name, value in ceilometer_utils.recursive_keypairs(message):
+            if name == 'message_signature':
+                continue
+            digest_maker.update(six.text_type(name).encode('utf-8'))
+            digest_maker.update(six.text_type(value).encode('utf-8'))
+        return digest_maker.hexdigest()
+
+    def test_compute_signature_same_as_keypairs(self):
+        data = {'a': 'A',
+                'b': 1.5,
+                'c': None,
+                u'd\xe9': u'\u0437',
+                'message_signature': 'old',
+                'nested': {'a': ['x', u'\xe9', {'y': 1}],
+                           'b': ('t',),
+                           'deeper': {'message_signature': 'kept',
+                                      'z': {}},
+                           },
+                }
+        self.assertEqual(self._keypairs_signature(data, 'not-so-secret'),
+                         utils.compute_signature(data, 'not-so-secret'))
+
+    def test_verify_signature_modified_after_verification(self):
+        data = {'a': 'A', 'b': 'B'}
+        data['message_signature'] = utils.compute_signature(
+            data, 'not-so-secret')
+        self.assertTrue(utils.verify_signature(data, 'not-so-secret'))
+        data['b'] = 'changed'
+        self.assertFalse(utils.verify_signature(data, 'not-so-secret'))
@@ -214,6 +214,47 @@ class TestPartitioning(base.BaseTestCase):
                                  expected_resources=expected_resources[i]))
         self._usage_simulation(*agents_kwargs)
 
+    def test_partitioning_ring_cached(self):
+        all_resources = ['resource_%s' % i for i in range(100)]
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent_0')
+        coord.join_group('group')
+        with mock.patch('ceilometer.utils.HashRing',
+                        wraps=utils.HashRing) as hash_ring:
+            first = coord.extract_my_subset('group', all_resources)
+            ring = coord._rings['group']
+            with mock.patch.object(ring, 'get_node',
+                                   wraps=ring.get_node) as get_node:
+                self.assertEqual(first, coord.extract_my_subset(
+                    'group', all_resources))
+                self.assertEqual(1, hash_ring.call_count)
+                self.assertEqual(0, get_node.call_count)
+
+                # only new resources are hashed
+                coord.extract_my_subset('group', ['new_resource'])
+                self.assertEqual(1, get_node.call_count)
+
+    def test_partitioning_membership_change(self):
+        all_resources = ['resource_%s' % i for i in range(1000)]
+        coord = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent_0')
+        coord.join_group('group')
+        self.assertEqual(all_resources,
+                         coord.extract_my_subset('group', all_resources))
+
+        other = self._get_new_started_coordinator(self.shared_storage,
+                                                  'agent_1')
+        other.join_group('group')
+        hr = utils.HashRing(['agent_0', 'agent_1'])
+        expected = [r for r in all_resources
+                    if hr.get_node(r) == 'agent_0']
+        self.assertEqual(expected,
+                         coord.extract_my_subset('group', all_resources))
+
+        del self.shared_storage['group']['agent_1']
+        self.assertEqual(all_resources,
+                         coord.extract_my_subset('group', all_resources))
+
     def test_coordination_backend_offline(self):
         agents = [dict(agent_id='agent1',
                        group_id='group',
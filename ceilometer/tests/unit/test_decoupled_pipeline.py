@@ -13,10 +13,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
+
+import mock
+import oslo_messaging
 import yaml
 
 from ceilometer import pipeline
 from ceilometer import sample
+from ceilometer.tests import base
 from ceilometer.tests import pipeline_base
 
 
@@ -294,3 +299,206 @@ class TestDecoupledPipeline(pipeline_base.BasePipelineTestCase):
                           pipeline.PipelineManager,
                           self.pipeline_cfg,
                           self.transformer_manager)
+
+
+class TestPipelineTransportManager(base.BaseTestCase):
+    def _make_sample(self, name, resource_id):
+        return sample.Sample(name=name, type=sample.TYPE_GAUGE, unit='B',
+                             volume=1, user_id='test_user',
+                             project_id='test_proj', resource_id=resource_id,
+                             timestamp='2015-07-02T10:39:00',
+                             resource_metadata={})
+
+    def test_publish_one_message_per_queue(self):
+        notifiers = [mock.Mock(), mock.Mock()]
+        other_notifiers = [mock.Mock()]
+        manager = pipeline.SamplePipelineTransportManager()
+        manager.add_transporter((lambda name: name == 'a', ['resource_id'],
+                                 notifiers))
+        manager.add_transporter((lambda name: True, None, other_notifiers))
+
+        samples = [self._make_sample(name, resource_id)
+                   for name in ('a', 'b')
+                   for resource_id in ('r1', 'r2', 'r3')]
+        context = mock.Mock()
+        with manager.publisher(context) as p:
+            p(samples[:4])
+            p(samples[4])
+            p([samples[5]])
+            for n in notifiers + other_notifiers:
+                self.assertFalse(n.sample.called)
+
+        # Datapoints are still spread between the queues by their grouping
+        # keys, but each queue only receives one message.
+        received = {}
+        for n in notifiers:
+            self.assertTrue(n.sample.call_count <= 1)
+            for call in n.sample.call_args_list:
+                self.assertEqual('ceilometer.pipeline',
+                                 call[1]['event_type'])
+                for s in call[1]['payload']:
+                    received[s['resource_id']] = n
+        self.assertEqual(set(['r1', 'r2', 'r3']), set(received))
+        for resource_id, n in received.items():
+            key = manager.hash_grouping({'resource_id': resource_id},
+                                        ['resource_id']) % len(notifiers)
+            self.assertIs(notifiers[key], n)
+
+        other_notifiers[0].sample.assert_called_once_with(
+            context.to_dict(), event_type='ceilometer.pipeline',
+            payload=mock.ANY)
+        payload = other_notifiers[0].sample.call_args[1]['payload']
+        self.assertEqual([(s.name, s.resource_id) for s in samples],
+                         [(s['counter_name'], s['resource_id'])
+                          for s in payload])
+
+
+class TestBatchPublishManager(base.BaseTestCase):
+    def setUp(self):
+        super(TestBatchPublishManager, self).setUp()
+        self.published = []
+        self.wrapped = mock.Mock()
+        self.wrapped.publisher.return_value.__enter__ = mock.Mock(
+            return_value=self.published.extend)
+        self.wrapped.publisher.return_value.__exit__ = mock.Mock(
+            return_value=False)
+        self.manager = pipeline.BatchPublishManager(self.wrapped)
+        self.dispatcher = pipeline.BatchDispatcher('test', 2, 1)
+
+    def _handle(self, datas):
+        # NOTE: a message handled by two endpoints, each publishing once
+        for data in datas:
+            with self.manager.publisher(None) as p:
+                p(data)
+        return 'handled'
+
+    def _concurrent_dispatch(self, messages):
+        results = []
+
+        def dispatch(datas):
+            try:
+                results.append(self.dispatcher.dispatch(self._handle,
+                                                        datas))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=dispatch, args=(datas,))
+                   for datas in messages]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_publish_batch(self):
+        self.assertEqual(['handled', 'handled'], self._concurrent_dispatch(
+            [[['a', 'b'], 'c'], ['d', 'e']]))
+        self.assertEqual(1, self.wrapped.publisher.call_count)
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], sorted(self.published))
+        self.assertEqual(2, self.dispatcher.buffer.last_batch_size)
+        self.assertEqual(1, self.dispatcher.buffer.flush_count)
+
+    def test_publish_batch_per_manager(self):
+        other_published = []
+        other = mock.Mock()
+        other.publisher.return_value.__enter__ = mock.Mock(
+            return_value=other_published.extend)
+        other.publisher.return_value.__exit__ = mock.Mock(
+            return_value=False)
+        other_manager = pipeline.BatchPublishManager(other)
+
+        def handle(data):
+            for manager in (self.manager, other_manager):
+                with manager.publisher(None) as p:
+                    p(data)
+
+        threads = [threading.Thread(target=self.dispatcher.dispatch,
+                                    args=(handle, data))
+                   for data in ('a', 'b')]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(1, self.wrapped.publisher.call_count)
+        self.assertEqual(1, other.publisher.call_count)
+        self.assertEqual(['a', 'b'], sorted(self.published))
+        self.assertEqual(['a', 'b'], sorted(other_published))
+
+    def test_publish_batch_error(self):
+        self.wrapped.publisher.return_value.__exit__.side_effect = (
+            ValueError('boom'))
+        results = self._concurrent_dispatch([['a'], ['b']])
+        self.assertEqual(2, len(results))
+        self.assertIsInstance(results[0], ValueError)
+        self.assertIsInstance(results[1], ValueError)
+
+    def test_publish_batch_error_requeue(self):
+        self.dispatcher = pipeline.BatchDispatcher('test', 2, 1,
+                                                   requeue_on_error=True)
+        self.wrapped.publisher.return_value.__exit__.side_effect = (
+            ValueError('boom'))
+        self.assertEqual([oslo_messaging.NotificationResult.REQUEUE] * 2,
+                         self._concurrent_dispatch([['a'], ['b']]))
+        self.assertEqual(1, self.wrapped.publisher.call_count)
+
+    def test_publish_partial_batch(self):
+        # the batch is not filled, the timeout alone flushes it
+        self.assertEqual(['handled'], self._concurrent_dispatch([['a']]))
+        self.assertEqual(['a'], self.published)
+        self.assertEqual(1, self.dispatcher.buffer.last_batch_size)
+
+    def test_batch_timeout_required(self):
+        self.assertRaises(ValueError, pipeline.BatchDispatcher,
+                          'test', 2, None)
+        pipeline.BatchDispatcher('test', 1, None)
+
+    def test_publish_nothing(self):
+        self.assertEqual('handled',
+                         self.dispatcher.dispatch(self._handle, [[]]))
+        self.assertFalse(self.wrapped.publisher.called)
+        self.assertEqual(0, self.dispatcher.buffer.flush_count)
+
+    def test_publish_outside_dispatch(self):
+        with self.manager.publisher(None) as p:
+            p(['a'])
+        self.assertEqual(['a'], self.published)
+        self.assertEqual(0, self.dispatcher.buffer.flush_count)
+
+
+class TestSourceMatching(base.BaseTestCase):
+    DATASETS = [
+        ['*'],
+        ['a', 'b'],
+        ['!a', '!disk.*'],
+        ['*', '!disk.*', '!cpu'],
+        ['disk.*', 'network.*.bytes', 'cpu_?til'],
+        ['[abc]*', 'cpu?*'],
+        ['*', '![ab]*'],
+        ['!*'],
+    ]
+    NAMES = ['a', 'b', 'c', 'cpu', 'cpu_util', 'cpu_utils', 'disk.read.bytes',
+             'disk', 'network.incoming.bytes', 'network.bytes', 'image',
+             'bandwidth', '']
+
+    def test_support_meter_matches_is_supported(self):
+        for meters in self.DATASETS:
+            source = pipeline.SampleSource({'name': 'test_source',
+                                            'meters': meters,
+                                            'sinks': ['test_sink']})
+            for name in self.NAMES:
+                # Run twice to check the memoized decision as well
+                for i in range(2):
+                    self.assertEqual(
+                        pipeline.Source.is_supported(meters, name),
+                        source.support_meter(name),
+                        '%s with %s' % (name, meters))
+
+    def test_support_event_matches_is_supported(self):
+        for events in self.DATASETS:
+            source = pipeline.EventSource({'name': 'test_source',
+                                           'events': events,
+                                           'sinks': ['test_sink']})
+            for name in self.NAMES:
+                self.assertEqual(pipeline.Source.is_supported(events, name),
+                                 source.support_event(name),
+                                 '%s with %s' % (name, events))
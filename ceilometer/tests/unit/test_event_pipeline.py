@@ -336,6 +336,26 @@ class EventPipelineTestCase(base.BaseTestCase):
         self.assertEqual(1, new_publisher.calls)
         self.assertEqual('b', getattr(new_publisher.events[0], 'event_type'))
 
+    def test_multiple_pipeline_routing(self):
+        self._augment_pipeline_cfg()
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    self.p_type)
+        self.assertEqual([pipeline_manager.pipelines[1]],
+                         pipeline_manager.route(self.test_event2))
+
+        with mock.patch.object(pipeline_manager.pipelines[0],
+                               'publish_data') as publish_data:
+            with mock.patch.object(pipeline_manager.pipelines[0],
+                                   'flush') as flush:
+                with pipeline_manager.publisher(None) as p:
+                    p(self.test_event2)
+        self.assertFalse(publish_data.called)
+        self.assertFalse(flush.called)
+        new_publisher = pipeline_manager.pipelines[1].publishers[0]
+        self.assertEqual(1, len(new_publisher.events))
+        self.assertEqual('b', getattr(new_publisher.events[0], 'event_type'))
+
     def test_multiple_publisher(self):
         self._set_pipeline_cfg('publishers', ['test://', 'new://'])
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -178,3 +178,47 @@ class TestUtils(base.BaseTestCase):
             assignments[k] -= n
         reassigned = len([c for c in assignments if c != 0])
         self.assertTrue(reassigned < num_keys / num_nodes)
+
+    def test_hash_ring_add_remove_nodes(self):
+        nodes = [str(x) for x in range(10)]
+        hr = utils.HashRing(nodes[:5])
+        hr.add_nodes(nodes[5:])
+        self.assertEqual(set(nodes), hr.nodes)
+        full = utils.HashRing(reversed(nodes))
+        keys = [str(k) for k in range(1000)]
+        self.assertEqual([full.get_node(k) for k in keys],
+                         [hr.get_node(k) for k in keys])
+
+        hr.remove_nodes(['3', '7'])
+        self.assertEqual(set(nodes) - set(['3', '7']), hr.nodes)
+        rebuilt = utils.HashRing(hr.nodes)
+        self.assertEqual([rebuilt.get_node(k) for k in keys],
+                         [hr.get_node(k) for k in keys])
+
+    def test_lru_cache_eviction(self):
+        cache = utils.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        self.assertEqual(2, len(cache))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_lru_cache_disabled(self):
+        cache = utils.LRUCache(maxsize=0)
+        cache['a'] = 1
+        self.assertEqual(0, len(cache))
+        self.assertEqual('x', cache.get('a', 'x'))
+
+    def test_lru_cache_pop_and_clear(self):
+        cache = utils.LRUCache()
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(1, cache.pop('a'))
+        self.assertIsNone(cache.pop('a'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
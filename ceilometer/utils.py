@@ -20,14 +20,18 @@
 
 import bisect
 import calendar
+import collections
 import copy
 import datetime
 import decimal
 import hashlib
 import struct
+import threading
+import time
 
 from oslo_concurrency import processutils
 from oslo_config import cfg
+from oslo_log import log
 from oslo_utils import timeutils
 from oslo_utils import units
 import six
@@ -42,6 +46,8 @@ OPTS = [
 CONF = cfg.CONF
 CONF.register_opts(OPTS)
 
+LOG = log.getLogger(__name__)
+
 EPOCH_TIME = datetime.datetime(1970, 1, 1)
 
 
@@ -222,13 +228,40 @@ class HashRing(object):
     def __init__(self, nodes, replicas=100):
         self._ring = dict()
         self._sorted_keys = []
-
+        self._replicas = replicas
+        # nodes of each position, the smallest one owns it so that the ring
+        # doesn't depend on the order the nodes were added in
+        self._owners = dict()
+        self.nodes = set()
+        self.add_nodes(nodes)
+
+    def _node_keys(self, node):
+        return [self._hash('%s-%s' % (node, r))
+                for r in six.moves.range(self._replicas)]
+
+    def add_nodes(self, nodes):
+        """Add nodes to the ring, keeping the position of the others."""
+        for node in nodes:
+            for hashed_key in self._node_keys(node):
+                owners = self._owners.setdefault(hashed_key, set())
+                owners.add(node)
+                self._ring[hashed_key] = min(owners)
+            self.nodes.add(node)
+        self._sorted_keys = sorted(self._ring)
+
+    def remove_nodes(self, nodes):
+        """Remove nodes from the ring, keeping the position of the others."""
         for node in nodes:
-            for r in six.moves.range(replicas):
-                hashed_key = self._hash('%s-%s' % (node, r))
-                self._ring[hashed_key] = node
-                self._sorted_keys.append(hashed_key)
-        self._sorted_keys.sort()
+            for hashed_key in self._node_keys(node):
+                owners = self._owners.get(hashed_key, set())
+                owners.discard(node)
+                if owners:
+                    self._ring[hashed_key] = min(owners)
+                else:
+                    self._owners.pop(hashed_key, None)
+                    self._ring.pop(hashed_key, None)
+            self.nodes.discard(node)
+        self._sorted_keys = sorted(self._ring)
 
     @staticmethod
     def _hash(key):
@@ -247,6 +280,138 @@ class HashRing(object):
         return self._ring[self._sorted_keys[pos]]
 
 
+class LRUCache(object):
+    """Bounded mapping which evicts its least recently used entries.
+
+    Lookups done through get() are accounted in the hits and misses
+    counters.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Batch(object):
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+        self.error = None
+
+
+class BatchBuffer(object):
+    """Buffer handing the items added concurrently to a single call.
+
+    Every caller of add() joins the current batch and blocks until the
+    batch has been passed to flush, so that the message it handles is only
+    acknowledged (or requeued) once its data has been processed. An
+    exception raised by flush is raised to every caller of the batch. A
+    batch is flushed by the caller filling it up to batch_size or by the
+    caller that opened it once batch_timeout expires. The timeout is
+    required as soon as batches hold more than one item, otherwise a batch
+    which never fills would block its callers forever.
+    """
+
+    def __init__(self, name, flush, batch_size, batch_timeout):
+        if batch_size > 1 and batch_timeout is None:
+            raise ValueError('%s: a batch timeout is required to buffer '
+                             'batches of %d items' % (name, batch_size))
+        self.name = name
+        self.flush = flush
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self._lock = threading.Lock()
+        self._batch = None
+        # Metrics about the buffer, also logged on each flush
+        self.queue_depth = 0
+        self.last_batch_size = 0
+        self.last_flush_latency = 0.0
+        self.flush_count = 0
+
+    def add(self, items):
+        with self._lock:
+            batch = self._batch
+            opener = batch is None
+            if opener:
+                batch = self._batch = _Batch()
+            batch.items.extend(items)
+            self.queue_depth += len(items)
+            flush = len(batch.items) >= self.batch_size
+            if flush:
+                self._batch = None
+
+        if not flush and opener:
+            if not batch.done.wait(self.batch_timeout):
+                with self._lock:
+                    flush = self._batch is batch
+                    if flush:
+                        self._batch = None
+        if flush:
+            self._flush(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+    def _flush(self, batch):
+        start = time.time()
+        try:
+            self.flush(batch.items)
+        except Exception as e:
+            batch.error = e
+        finally:
+            latency = time.time() - start
+            with self._lock:
+                self.queue_depth -= len(batch.items)
+                self.last_batch_size = len(batch.items)
+                self.last_flush_latency = latency
+                self.flush_count += 1
+                queue_depth = self.queue_depth
+            batch.done.set()
+        LOG.debug("%(name)s: flushed a batch of %(size)d items in "
+                  "%(latency).3fs, %(depth)d items still queued",
+                  {'name': self.name, 'size': len(batch.items),
+                   'latency': latency, 'depth': queue_depth})
+
+
 def kill_listeners(listeners):
     # NOTE(gordc): correct usage of oslo.messaging listener is to stop(),
     # which stops new messages, and wait(), which processes remaining
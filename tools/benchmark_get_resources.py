@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the latency of listing resources.
+
+Resources are added to a scratch database and the time it takes to list all
+of them with get_resources is printed for each resource count.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_get_resources.py --url sqlite:// --resources 100,1000,10000
+"""
+import argparse
+import datetime
+import time
+import uuid
+
+from oslo_config import cfg
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
+
+
+def make_resource_samples(resource_id, count, start):
+    for i in range(count):
+        s = sample.Sample(
+            name='cpu_util',
+            type=sample.TYPE_GAUGE,
+            unit='%',
+            volume=i,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id=resource_id,
+            timestamp=start + datetime.timedelta(minutes=10 * i),
+            resource_metadata={'display_name': resource_id,
+                               'sample': i},
+            source='benchmark')
+        yield utils.meter_message_from_counter(
+            s, cfg.CONF.publisher.telemetry_secret)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the listing of resources',
+    )
+    parser.add_argument(
+        '--url',
+        default='sqlite://',
+        help='Connection URL of a scratch metering database, samples are '
+             'added to it.',
+    )
+    parser.add_argument(
+        '--resources',
+        default='100,1000,10000',
+        help='Comma separated resource counts to measure the latency for.',
+    )
+    parser.add_argument(
+        '--samples',
+        default=3,
+        type=int,
+        help='Number of samples of each resource.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='Number of times resources are listed, the best time is kept.',
+    )
+    return parser
+
+
+def main():
+    cfg.CONF([], project='ceilometer')
+
+    args = get_parser().parse_args()
+    counts = sorted(int(c) for c in args.resources.split(','))
+
+    conn = storage.get_connection(args.url, 'ceilometer.metering.storage')
+    conn.upgrade()
+    start = datetime.datetime(2015, 1, 1)
+
+    print('%10s %10s %12s' % ('resources', 'listed', 'seconds'))
+    total = 0
+    for count in counts:
+        while total < count:
+            batch = []
+            for i in range(min(count - total, 100)):
+                batch.extend(make_resource_samples(
+                    str(uuid.uuid4()), args.samples,
+                    start + datetime.timedelta(seconds=total)))
+                total += 1
+            conn.record_metering_data_batch(batch)
+        timings = []
+        for i in range(args.repeat):
+            before = time.time()
+            listed = len(list(conn.get_resources()))
+            timings.append(time.time() - before)
+        print('%10d %10d %12.4f' % (count, listed, min(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the extraction of fields from notifications.
+
+The traits of the event definitions and the attributes of the meter
+definitions matching each notification are extracted, first with the
+direct key lookups compiled for simple paths and then with jsonpath only,
+after checking both give the same values.
+
+Notifications captured as a JSON list, for instance with the messaging
+driver of a notifier, can be given:
+
+source .tox/py27/bin/activate
+./tools/benchmark_notification_parsing.py --notifications captured.json
+
+Without --notifications, sample Nova and Neutron notifications are used.
+"""
+import argparse
+import json
+import time
+
+import pkg_resources
+
+from ceilometer import declarative
+from ceilometer.event import converter
+from ceilometer.meter import notifications
+
+INSTANCE_CREATE_END = {
+    'event_type': 'compute.instance.create.end',
+    'message_id': '0c65cb9c-018c-11e2-bc91-5453ed1bbb5f',
+    'publisher_id': 'compute.vagrant-precise',
+    'priority': 'INFO',
+    'timestamp': '2012-05-08 20:23:48.028195',
+    '_context_request_id': 'req-3d1f5a5c-4ec6-4a4a-b5d7-2eb5b7d1c8e8',
+    '_context_user_id': '1e3ce043029547f1a61c1996d1a531a2',
+    '_context_tenant': '7c150a59fe714e6f9263774af9688f0e',
+    'payload': {
+        'created_at': '2012-05-08 20:23:41',
+        'deleted_at': '',
+        'disk_gb': 0,
+        'display_name': 'testme',
+        'fixed_ips': [{'address': '10.0.0.2', 'floating_ips': [],
+                       'meta': {}, 'type': 'fixed', 'version': 4}],
+        'image_ref_url': 'http://10.0.2.15:9292/images/UUID',
+        'host': 'vagrant-precise',
+        'instance_flavor_id': '1',
+        'instance_id': '9f9d01b9-4a58-4271-9e27-398b21ab20d1',
+        'instance_type': 'm1.tiny',
+        'instance_type_id': 2,
+        'launched_at': '2012-05-08 20:23:47.985999',
+        'memory_mb': 512,
+        'state': 'active',
+        'state_description': '',
+        'tenant_id': '7c150a59fe714e6f9263774af9688f0e',
+        'user_id': '1e3ce043029547f1a61c1996d1a531a2',
+        'reservation_id': '1e3ce043029547f1a61c1996d1a531a3',
+        'vcpus': 1,
+        'root_gb': 0,
+        'ephemeral_gb': 0,
+        'architecture': 'x86_64',
+        'os_type': 'linux',
+        'image_meta': {'base_image_ref': 'UUID',
+                       'org.openstack__1__architecture': 'x86_64'},
+        'metadata': {},
+    },
+}
+
+PORT_CREATE_END = {
+    'event_type': 'port.create.end',
+    'message_id': 'e6c5b0b3-3f64-4a73-85a2-0b2c1a6ce2a1',
+    'publisher_id': 'network.ubuntu-VirtualBox',
+    'priority': 'INFO',
+    'timestamp': '2012-09-27 14:28:31.536370',
+    '_context_request_id': 'req-6a5b5d6b-1d8d-4b4c-a7f0-1d4f0a6c8b0c',
+    '_context_user_id': 'b44b7ce67fc84414a5c1660a92a1b862',
+    '_context_tenant_id': '82ed0c40ebe64d0bb3310027039c8ed2',
+    'payload': {
+        'port': {
+            'admin_state_up': True,
+            'device_id': '',
+            'device_owner': '',
+            'fixed_ips': [{'ip_address': '10.0.0.3',
+                           'subnet_id': '5e5bd9e8-8a61-4d3f-8ab1'}],
+            'id': '9cdfeb92-9391-4da7-95a1-ca214831cfdb',
+            'mac_address': 'fa:16:3e:75:0c:49',
+            'name': '',
+            'network_id': '71e0ef74-1ca4-4f6f-9ba6-b5f3a2d5f8b8',
+            'status': 'DOWN',
+            'tenant_id': '82ed0c40ebe64d0bb3310027039c8ed2',
+        },
+    },
+}
+
+
+def load_definitions():
+    event_cfg = declarative.load_definitions(
+        [], 'etc/ceilometer/event_definitions.yaml')
+    events = converter.NotificationEventsConverter(event_cfg, {})
+    meters_cfg = declarative.load_definitions(
+        {}, pkg_resources.resource_filename(notifications.__name__,
+                                            'data/meters.yaml'))
+    meters = [notifications.MeterDefinition(m, {})
+              for m in meters_cfg['metric']]
+    return events, meters
+
+
+def get_parsers(events, meters, notification):
+    """Return the field definitions applied to the notification."""
+    event_type = notification['event_type']
+    parsers = []
+    edef = events._find_definition(event_type)
+    if edef is not None:
+        parsers.extend(edef.traits.values())
+    for m in meters:
+        if m.match_type(event_type):
+            parsers.extend(m._attributes.values())
+            parsers.extend(m._metadata_attributes.values())
+            parsers.extend([m._fallback_user_id, m._fallback_project_id])
+    return parsers
+
+
+def measure(work, repeat):
+    before = time.time()
+    for i in range(repeat):
+        for parsers, notification in work:
+            for p in parsers:
+                p.parse(notification)
+    return time.time() - before
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the extraction of fields from notifications',
+    )
+    parser.add_argument(
+        '--notifications',
+        help='JSON file holding a list of captured notifications.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=1000,
+        type=int,
+        help='Number of times every notification is parsed.',
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    if args.notifications:
+        with open(args.notifications) as f:
+            captured = json.load(f)
+    else:
+        captured = [INSTANCE_CREATE_END, PORT_CREATE_END]
+
+    events, meters = load_definitions()
+    work = [(get_parsers(events, meters, n), n) for n in captured]
+    parsers = set(p for w in work for p in w[0])
+    compiled = [p for p in parsers if p.key_paths is not None]
+    print('%d fields extracted, %d compiled to key lookups'
+          % (len(parsers), len(compiled)))
+
+    values = [[p.parse(n) for p in ps] for ps, n in work]
+    keys = measure(work, args.repeat)
+    for p in compiled:
+        p.key_paths = None
+    assert values == [[p.parse(n) for p in ps] for ps, n in work]
+    jsonpath = measure(work, args.repeat)
+
+    count = len(captured) * args.repeat
+    print('%12s %12s %18s' % ('parser', 'seconds', 'notifications/s'))
+    print('%12s %12.4f %18.0f' % ('jsonpath', jsonpath, count / jsonpath))
+    print('%12s %12.4f %18.0f' % ('compiled', keys, count / keys))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the workload partitioning of resources.
+
+A partition coordinator with a fake tooz backend splits resources between
+group members, as the agents do at every polling cycle. The time of the
+first call, building the hash ring and hashing every resource, and the time
+of the following calls with the same members are printed, along with the
+time of a rebuild of the ring for each call as it was done before.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_partitioning.py --resources 10000,50000 --members 50
+"""
+import argparse
+import time
+
+import mock
+from oslo_config import cfg
+
+from ceilometer import coordination
+from ceilometer import utils
+
+
+class FakeResult(object):
+    def __init__(self, result=None):
+        self.result = result
+
+    def get(self):
+        return self.result
+
+
+class FakeCoordinator(object):
+    is_started = True
+
+    def __init__(self, members):
+        self.members = members
+
+    def start(self):
+        pass
+
+    def join_group(self, group_id):
+        return FakeResult()
+
+    def get_members(self, group_id):
+        return FakeResult(self.members)
+
+
+def rebuild_subset(my_id, members, resources):
+    hr = utils.HashRing(members)
+    return [v for v in resources if hr.get_node(str(v)) == my_id]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the workload partitioning of resources',
+    )
+    parser.add_argument(
+        '--resources',
+        default='10000,50000',
+        help='Comma separated numbers of resources partitioned.',
+    )
+    parser.add_argument(
+        '--members',
+        default=50,
+        type=int,
+        help='Number of members of the partitioning group.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=10,
+        type=int,
+        help='Number of polling cycles, the mean time is printed.',
+    )
+    return parser
+
+
+def main():
+    cfg.CONF([], project='ceilometer')
+    cfg.CONF.set_override('backend_url', 'fake://', group='coordination')
+
+    args = get_parser().parse_args()
+    members = ['agent-%d' % i for i in range(args.members)]
+    fake = FakeCoordinator(members)
+
+    print('%10s %12s %12s %12s' % ('resources', 'rebuild (s)', 'first (s)',
+                                   'cached (s)'))
+    for count in (int(c) for c in args.resources.split(',')):
+        resources = ['resource-%d' % i for i in range(count)]
+        with mock.patch('tooz.coordination.get_coordinator',
+                        return_value=fake):
+            pc = coordination.PartitionCoordinator(members[0])
+            pc.start()
+        pc._groups.add('group')
+
+        before = time.time()
+        for i in range(args.repeat):
+            expected = rebuild_subset(members[0], members, resources)
+        rebuild = (time.time() - before) / args.repeat
+
+        before = time.time()
+        subset = pc.extract_my_subset('group', resources)
+        first = time.time() - before
+        assert subset == expected
+
+        before = time.time()
+        for i in range(args.repeat):
+            pc.extract_my_subset('group', resources)
+        cached = (time.time() - before) / args.repeat
+        print('%10d %12.4f %12.4f %12.4f' % (count, rebuild, first, cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the meter matching of pipeline sources.
+
+Sources with wildcard meter lists are built and every meter name is matched
+against every source, first with Source.is_supported and then with the
+compiled matchers used by SampleSource.support_meter.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_pipeline_matching.py --sources 50 --names 200
+"""
+import argparse
+import time
+
+from ceilometer import pipeline
+
+PATTERNS = ['disk.*', 'network.*.bytes', 'cpu*', 'memory.*', 'image.*',
+            'storage.objects.*', 'volume.size', 'instance', 'vcpus',
+            'hardware.*', 'ip.floating.*', 'bandwidth']
+
+
+def make_sources(count):
+    sources = []
+    for i in range(count):
+        if i % 3 == 0:
+            meters = ['*', '!%s' % PATTERNS[i % len(PATTERNS)],
+                      '!meter-%d.*' % i]
+        else:
+            meters = [PATTERNS[(i + j) % len(PATTERNS)] for j in range(4)]
+            meters.append('meter-%d.*' % i)
+        sources.append(pipeline.SampleSource({'name': 'source-%d' % i,
+                                              'meters': meters,
+                                              'sinks': ['sink']}))
+    return sources
+
+
+def make_names(count):
+    names = ['disk.read.bytes', 'network.incoming.bytes', 'cpu_util',
+             'memory.usage', 'image.size', 'instance', 'vcpus']
+    names.extend('meter-%d.sample' % i for i in range(count - len(names)))
+    return names
+
+
+def measure(sources, names, supported, repeat):
+    before = time.time()
+    for i in range(repeat):
+        for source in sources:
+            for name in names:
+                supported(source, name)
+    return time.time() - before
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the meter matching of pipeline sources',
+    )
+    parser.add_argument(
+        '--sources',
+        default=50,
+        type=int,
+        help='Number of pipeline sources.',
+    )
+    parser.add_argument(
+        '--names',
+        default=200,
+        type=int,
+        help='Number of distinct meter names matched.',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=10,
+        type=int,
+        help='Number of times every name is matched against every source.',
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    sources = make_sources(args.sources)
+    names = make_names(args.names)
+    matches = args.sources * len(names) * args.repeat
+
+    print('%15s %12s %15s' % ('matcher', 'seconds', 'matches/s'))
+    for label, supported in [
+            ('is_supported',
+             lambda s, n: pipeline.Source.is_supported(s.meters, n)),
+            ('support_meter', lambda s, n: s.support_meter(n))]:
+        elapsed = measure(sources, names, supported, args.repeat)
+        print('%15s %12.4f %15.0f' % (label, elapsed, matches / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the signing of metering messages.
+
+Messages with a growing resource metadata are signed with the previous
+implementation, walking ceilometer.utils.recursive_keypairs, and with
+compute_signature, after checking both give the same signature. The time
+needed to verify the messages is also printed.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_signature.py --metadata 10,100,1000
+"""
+import argparse
+import hashlib
+import hmac
+import time
+
+import six
+
+from ceilometer.publisher import utils
+from ceilometer import utils as ceilometer_utils
+
+SECRET = 'benchmark-secret'
+
+
+def keypairs_signature(message, secret):
+    digest_maker = hmac.new(secret.encode('utf-8'), b'', hashlib.sha256)
+    for name, value in ceilometer_utils.recursive_keypairs(message):
+        if name == 'message_signature':
+            continue
+        digest_maker.update(six.text_type(name).encode('utf-8'))
+        digest_maker.update(six.text_type(value).encode('utf-8'))
+    return digest_maker.hexdigest()
+
+
+def make_message(i, metadata):
+    return {'source': 'benchmark',
+            'counter_name': 'cpu_util',
+            'counter_type': 'gauge',
+            'counter_unit': '%',
+            'counter_volume': i,
+            'user_id': 'user-id',
+            'project_id': 'project-id',
+            'resource_id': 'resource-%d' % i,
+            'timestamp': '2015-01-01T00:00:00',
+            'message_id': 'message-%d' % i,
+            'resource_metadata': {
+                'properties': dict(('key-%d' % k, 'value-%d' % k)
+                                   for k in range(metadata)),
+                'flavor': {'name': 'm1.small', 'vcpus': 1, 'ram': 512},
+                'tags': ['a', 'b', 'c'],
+            }}
+
+
+def measure(function, messages):
+    before = time.time()
+    for m in messages:
+        function(m, SECRET)
+    return time.time() - before
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the signing of metering messages',
+    )
+    parser.add_argument(
+        '--metadata',
+        default='10,100,1000',
+        help='Comma separated numbers of resource metadata properties.',
+    )
+    parser.add_argument(
+        '--messages',
+        default=1000,
+        type=int,
+        help='Number of messages signed for each metadata size.',
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+
+    print('%10s %14s %14s %14s' % ('metadata', 'keypairs (s)',
+                                   'compute (s)', 'verify (s)'))
+    for metadata in (int(m) for m in args.metadata.split(',')):
+        messages = [make_message(i, metadata) for i in range(args.messages)]
+        for m in messages:
+            m['message_signature'] = utils.compute_signature(m, SECRET)
+            assert m['message_signature'] == keypairs_signature(m, SECRET)
+        keypairs = measure(keypairs_signature, messages)
+        compute = measure(utils.compute_signature, messages)
+        verify = measure(utils.verify_signature, messages)
+        print('%10d %14.4f %14.4f %14.4f' % (metadata, keypairs, compute,
+                                             verify))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command line tool measuring the UDP receive path of the collector.
+
+Datagrams are replayed as fast as possible to collector receive loops
+running in worker processes, and the number of samples handed to the
+dispatchers is printed along with the throughput and the drops.
+
+Traffic sent to the collector by the UDP publisher can be recorded first:
+
+source .tox/py27/bin/activate
+./tools/benchmark_udp_collector.py --capture traffic.bin --count 100000
+
+and then replayed:
+
+./tools/benchmark_udp_collector.py --traffic traffic.bin --workers 4
+
+Without --traffic, synthetic samples are generated.
+"""
+import argparse
+import multiprocessing
+import socket
+import struct
+import time
+
+import msgpack
+from oslo_config import cfg
+
+from ceilometer import collector
+from ceilometer.publisher import utils
+from ceilometer import sample
+
+HEADER = struct.Struct('!I')
+
+
+def capture(path, address, port, count):
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    udp.bind((address, port))
+    with open(path, 'wb') as f:
+        for i in range(count):
+            data, source = udp.recvfrom(64 * 1024)
+            f.write(HEADER.pack(len(data)))
+            f.write(data)
+
+
+def load_traffic(path):
+    datagrams = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if not header:
+                return datagrams
+            datagrams.append(f.read(HEADER.unpack(header)[0]))
+
+
+def make_traffic(count):
+    datagrams = []
+    for i in range(count):
+        s = sample.Sample(
+            name='cpu_util',
+            type=sample.TYPE_GAUGE,
+            unit='%',
+            volume=i,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id='resource-%d' % (i % 1000),
+            timestamp='2015-01-01T00:00:00',
+            resource_metadata={'display_name': 'benchmark'},
+            source='benchmark')
+        datagrams.append(msgpack.dumps(utils.meter_message_from_counter(
+            s, cfg.CONF.publisher.telemetry_secret)))
+    return datagrams
+
+
+class CountingManager(object):
+    def __init__(self, received, calls):
+        self.received = received
+        self.calls = calls
+
+    def map_method(self, method, samples):
+        with self.received.get_lock():
+            self.received.value += len(samples)
+            self.calls.value += 1
+
+
+def receive(received, calls):
+    srv = collector.CollectorService()
+    srv.meter_manager = CountingManager(received, calls)
+    srv.start_udp()
+
+
+def replay(args, datagrams):
+    received = multiprocessing.Value('l', 0)
+    calls = multiprocessing.Value('l', 0)
+    workers = [multiprocessing.Process(target=receive,
+                                       args=(received, calls))
+               for i in range(args.workers)]
+    for w in workers:
+        w.start()
+    # Leave the workers time to bind their sockets
+    time.sleep(1)
+
+    # NOTE: the kernel spreads the datagrams between the sockets
+    # according to their source, so send them from several sockets.
+    senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+               for i in range(args.senders)]
+    target = (args.address, args.port)
+    before = time.time()
+    for i, data in enumerate(datagrams):
+        senders[i % len(senders)].sendto(data, target)
+    sent = time.time() - before
+
+    last = -1
+    while last != received.value:
+        last = received.value
+        time.sleep(0.5)
+    elapsed = time.time() - before - 0.5
+
+    for w in workers:
+        w.terminate()
+        w.join()
+    print('%10s %10s %10s %10s %12s %12s' % (
+        'workers', 'sent', 'received', 'batches', 'send (s)', 'samples/s'))
+    print('%10d %10d %10d %10d %12.4f %12.1f' % (
+        args.workers, len(datagrams), received.value, calls.value, sent,
+        received.value / elapsed))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='benchmark the collector UDP receive path',
+    )
+    parser.add_argument(
+        '--address',
+        default='127.0.0.1',
+        help='Address the collector sockets are bound to.',
+    )
+    parser.add_argument(
+        '--port',
+        default=4952,
+        type=int,
+        help='Port the collector sockets are bound to.',
+    )
+    parser.add_argument(
+        '--capture',
+        help='Record the datagrams received on the address and port to '
+             'this file instead of running the benchmark.',
+    )
+    parser.add_argument(
+        '--count',
+        default=100000,
+        type=int,
+        help='Number of datagrams to record or to generate.',
+    )
+    parser.add_argument(
+        '--traffic',
+        help='File of recorded datagrams to replay.',
+    )
+    parser.add_argument(
+        '--workers',
+        default=1,
+        type=int,
+        help='Number of collector processes receiving the datagrams.',
+    )
+    parser.add_argument(
+        '--senders',
+        default=8,
+        type=int,
+        help='Number of sockets the datagrams are sent from.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        default=100,
+        type=int,
+        help='Maximum number of datagrams read in one burst.',
+    )
+    return parser
+
+
+def main():
+    cfg.CONF([], project='ceilometer')
+
+    args = get_parser().parse_args()
+    if args.capture:
+        capture(args.capture, args.address, args.port, args.count)
+        return
+
+    cfg.CONF.set_override('udp_address', args.address, group='collector')
+    cfg.CONF.set_override('udp_port', args.port, group='collector')
+    cfg.CONF.set_override('udp_batch_size', args.batch_size,
+                          group='collector')
+    if args.traffic:
+        datagrams = load_traffic(args.traffic)
+    else:
+        datagrams = make_traffic(args.count)
+    replay(args, datagrams)
+
+
+if __name__ == '__main__':
+    main()